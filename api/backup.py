@@ -1,5 +1,5 @@
 # api/backup.py - Backup and Restore System
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, send_file, current_app, Response
 from datetime import datetime, timezone
 import os
 import tempfile
@@ -10,10 +10,21 @@ import glob
 import logging
 from zipfile import ZipFile
 from pathlib import Path
+from contextlib import closing
 
 from models import db, Setting, Admin, AdminActionLog
 from decorators import admin_required, rate_limit
 from utils import get_setting
+from db_snapshot import snapshot_database
+from backup_store import (
+    BackupStoreError, DATABASE_ARCNAME, backup_metadata, backup_sources, collect_garbage, create_snapshot, delete_snapshot,
+    list_snapshots, load_manifest, materialize_snapshot, prune_snapshots, read_blob,
+    snapshot_exists
+)
+from backup_stream import (
+    RESTORE_STAGING_DIR, BackupStreamError, extract_stream, iter_zip_stream, stream_snapshot_zip,
+    validate_extracted
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -34,78 +45,38 @@ def create_backup():
         include_uploads = request.json.get('include_uploads', True)
         
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"minipass_backup_{backup_type}_{timestamp}.zip"
+        snapshot_id = f"minipass_backup_{backup_type}_{timestamp}"
+        backup_filename = f"{snapshot_id}.zip"
         
-        # Create temporary directory for backup
-        with tempfile.TemporaryDirectory() as temp_dir:
-            backup_path = os.path.join(temp_dir, backup_filename)
-            
-            with ZipFile(backup_path, 'w') as zipf:
-                # Always include database
-                db_path = current_app.config.get('DATABASE_PATH', 'instance/minipass.db')
-                if os.path.exists(db_path):
-                    zipf.write(db_path, 'database/minipass.db')
-                
-                # Include settings export
-                settings_data = export_settings()
-                settings_file = os.path.join(temp_dir, 'settings.json')
-                with open(settings_file, 'w') as f:
-                    json.dump(settings_data, f, indent=2)
-                zipf.write(settings_file, 'settings.json')
-                
-                # Include uploads if requested
-                if include_uploads and backup_type in ['full', 'data']:
-                    upload_dir = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                    if os.path.exists(upload_dir):
-                        for root, dirs, files in os.walk(upload_dir):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arc_path = os.path.relpath(file_path, os.path.dirname(upload_dir))
-                                zipf.write(file_path, arc_path)
-                
-                # Include ALL email template files if full backup (HTML, compiled, images, JSON, etc.)
-                if backup_type == 'full':
-                    template_dir = 'templates/email_templates'
-                    if os.path.exists(template_dir):
-                        for root, dirs, files in os.walk(template_dir):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arc_path = os.path.relpath(file_path, 'templates')
-                                zipf.write(file_path, f'templates/{arc_path}')
-                
-                # Add backup metadata
-                metadata = {
-                    'backup_type': backup_type,
-                    'created_at': datetime.now(timezone.utc).isoformat(),
-                    'created_by': request.headers.get('X-Admin-Email', 'unknown'),
-                    'version': '1.0',
-                    'include_uploads': include_uploads
-                }
-                metadata_file = os.path.join(temp_dir, 'backup_metadata.json')
-                with open(metadata_file, 'w') as f:
-                    json.dump(metadata, f, indent=2)
-                zipf.write(metadata_file, 'backup_metadata.json')
-            
-            # Move to backup directory
-            backup_dir = os.path.join('static', 'backups')
-            os.makedirs(backup_dir, exist_ok=True)
-            final_path = os.path.join(backup_dir, backup_filename)
-            shutil.move(backup_path, final_path)
+        # Stored as a deduplicated snapshot: only chunks not already in the store are written
+        # Uploads if requested; ALL email template files for a full backup (HTML, compiled, images, JSON, etc.)
+        sources = backup_sources(
+            upload_dir=current_app.config.get('UPLOAD_FOLDER', 'static/uploads') if include_uploads and backup_type in ['full', 'data'] else None,
+            template_dir='templates/email_templates' if backup_type == 'full' else None
+        )
+        
+        manifest = create_snapshot(
+            snapshot_id,
+            backup_type=backup_type,
+            created_by=request.headers.get('X-Admin-Email', 'unknown'),
+            db_path=current_app.config.get('DATABASE_PATH', 'instance/minipass.db'),
+            sources=sources,
+            extra_files={'settings.json': json.dumps(export_settings(), indent=2).encode('utf-8')},
+            metadata={'include_uploads': include_uploads}
+        )
         
         # Log action
         log_backup_action(f"Created {backup_type} backup: {backup_filename}")
         
-        # Get file size
-        file_size = os.path.getsize(final_path)
-        
         return jsonify({
             'success': True,
             'data': {
                 'filename': backup_filename,
                 'type': backup_type,
-                'size': file_size,
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'path': f'/static/backups/{backup_filename}'
+                'size': manifest['stats']['total_bytes'],
+                'stored_bytes': manifest['stats']['new_bytes'],
+                'created_at': manifest['created_at'],
+                'path': f'/api/v1/backup/download/{backup_filename}'
             }
         })
         
@@ -117,12 +88,22 @@ def create_backup():
 def list_backups():
     """List all available backups"""
     try:
-        backup_dir = os.path.join('static', 'backups')
-        if not os.path.exists(backup_dir):
-            return jsonify({'success': True, 'data': []})
+        backups = [
+            {
+                'filename': f"{manifest['id']}.zip",
+                'size': manifest.get('stats', {}).get('total_bytes', 0),
+                'stored_bytes': manifest.get('stats', {}).get('new_bytes', 0),
+                'created_at': manifest.get('created_at'),
+                'type': manifest.get('backup_type', 'unknown'),
+                'version': manifest.get('version', 'unknown'),
+                'created_by': manifest.get('created_by', 'unknown')
+            }
+            for manifest in list_snapshots()
+        ]
         
-        backups = []
-        for filename in os.listdir(backup_dir):
+        # Legacy ZIP backups
+        backup_dir = os.path.join('static', 'backups')
+        for filename in (os.listdir(backup_dir) if os.path.exists(backup_dir) else []):
             if filename.endswith('.zip'):
                 file_path = os.path.join(backup_dir, filename)
                 stat = os.stat(file_path)
@@ -164,6 +145,11 @@ def download_backup(filename):
         if not filename.endswith('.zip') or '/' in filename or '\\' in filename:
             return jsonify({'success': False, 'error': 'Invalid filename'}), 400
         
+        snapshot_id = resolve_snapshot(filename)
+        if snapshot_id:
+            log_backup_action(f"Downloaded backup: {filename}")
+            return snapshot_download_response(snapshot_id, filename)
+        
         backup_path = os.path.join('static', 'backups', filename)
         if not os.path.exists(backup_path):
             return jsonify({'success': False, 'error': 'Backup not found'}), 404
@@ -190,11 +176,16 @@ def delete_backup(filename):
         if not filename.endswith('.zip') or '/' in filename or '\\' in filename:
             return jsonify({'success': False, 'error': 'Invalid filename'}), 400
 
-        backup_path = os.path.join('static', 'backups', filename)
-        if not os.path.exists(backup_path):
-            return jsonify({'success': False, 'error': 'Backup not found'}), 404
+        snapshot_id = resolve_snapshot(filename)
+        if snapshot_id:
+            delete_snapshot(snapshot_id)
+            collect_garbage()
+        else:
+            backup_path = os.path.join('static', 'backups', filename)
+            if not os.path.exists(backup_path):
+                return jsonify({'success': False, 'error': 'Backup not found'}), 404
+            os.remove(backup_path)
 
-        os.remove(backup_path)
         log_backup_action(f"Deleted backup: {filename}")
 
         return jsonify({'success': True, 'message': f'Backup {filename} deleted'})
@@ -251,17 +242,15 @@ def restore_backup():
         if not filename:
             return jsonify({'success': False, 'error': 'Filename required'}), 400
 
-        backup_path = os.path.join('static', 'backups', filename)
-        if not os.path.exists(backup_path):
+        if not backup_exists(filename):
             return jsonify({'success': False, 'error': 'Backup not found'}), 404
 
-        # Create restore point before restoring
-        create_restore_point()
+        with restore_staging_dir() as temp_dir:
+            # Extract and validate the backup (or rebuild it from the snapshot store) before touching live data
+            extract_backup(filename, temp_dir)
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Extract backup
-            with ZipFile(backup_path, 'r') as zipf:
-                zipf.extractall(temp_dir)
+            # Create restore point before restoring
+            create_restore_point()
 
             # Read metadata
             metadata_file = os.path.join(temp_dir, 'backup_metadata.json')
@@ -312,6 +301,10 @@ def restore_backup():
 def validate_backup(filename):
     """Validate a backup file"""
     try:
+        snapshot_id = resolve_snapshot(filename)
+        if snapshot_id:
+            return jsonify({'success': True, 'data': validate_snapshot(snapshot_id, filename)})
+        
         backup_path = os.path.join('static', 'backups', filename)
         if not os.path.exists(backup_path):
             return jsonify({'success': False, 'error': 'Backup not found'}), 404
@@ -324,53 +317,48 @@ def validate_backup(filename):
             'contents': []
         }
         
-        try:
-            with ZipFile(backup_path, 'r') as zipf:
-                # Check for required files
-                files = zipf.namelist()
+        # Read every entry through the same reader a restore uses (handles zstd/LZMA entries and
+        # checks CRCs/manifest checksums) without writing it; only the database is written out,
+        # for the integrity check
+        with restore_staging_dir() as temp_dir:
+            files, metadata_raw = [], None
+            try:
+                with open(backup_path, 'rb') as f:
+                    for arcname, size, chunks in iter_zip_stream(f):
+                        if arcname.endswith('/'):
+                            continue  # Directory entry
+                        files.append(arcname)
+                        if arcname == DATABASE_ARCNAME:
+                            extract_stream([(arcname, size, chunks)], temp_dir)
+                        elif arcname == 'backup_metadata.json':
+                            metadata_raw = b''.join(chunks)
+                        else:
+                            for _ in chunks:
+                                pass
+            except Exception as e:
+                validation_result['valid'] = False
+                validation_result['errors'].append(f'Failed to read backup file: {str(e)}')
+                files = None
+
+            if files is not None:
                 validation_result['contents'] = files
-                
+
                 # Check for metadata
-                if 'backup_metadata.json' in files:
-                    with zipf.open('backup_metadata.json') as f:
-                        metadata = json.load(f)
-                        validation_result['metadata'] = metadata
+                if metadata_raw is not None:
+                    validation_result['metadata'] = json.loads(metadata_raw)
                 else:
                     validation_result['warnings'].append('No metadata found')
-                
-                # Check for database
-                if not any(f.startswith('database/') for f in files):
-                    validation_result['errors'].append('No database found in backup')
-                
+
                 # Check for settings
                 if 'settings.json' not in files:
                     validation_result['warnings'].append('No settings export found')
-                
-                # Validate database if present
-                db_files = [f for f in files if f.startswith('database/')]
-                if db_files:
-                    try:
-                        with zipf.open(db_files[0]) as db_file:
-                            # Try to open as SQLite database
-                            temp_db_path = os.path.join(tempfile.gettempdir(), 'temp_validate.db')
-                            with open(temp_db_path, 'wb') as temp_f:
-                                temp_f.write(db_file.read())
-                            
-                            conn = sqlite3.connect(temp_db_path)
-                            cursor = conn.cursor()
-                            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                            tables = cursor.fetchall()
-                            conn.close()
-                            os.remove(temp_db_path)
-                            
-                            validation_result['database_tables'] = [t[0] for t in tables]
-                    except Exception as e:
-                        validation_result['errors'].append(f'Database validation failed: {str(e)}')
-                
-        except Exception as e:
-            validation_result['valid'] = False
-            validation_result['errors'].append(f'Failed to read backup file: {str(e)}')
-        
+
+                # Validate the database (missing, corrupt or unreadable all fail here)
+                try:
+                    validation_result['database_tables'] = validate_extracted(temp_dir)
+                except BackupStreamError as e:
+                    validation_result['errors'].append(f'Database validation failed: {str(e)}')
+
         if validation_result['errors']:
             validation_result['valid'] = False
         
@@ -383,6 +371,95 @@ def validate_backup(filename):
 # UTILITY FUNCTIONS
 # ============================================================================
 
+def resolve_snapshot(filename):
+    """Snapshot id behind a backup name ("<id>.zip"), or None for a legacy ZIP file"""
+    if not filename or not filename.endswith('.zip'):
+        return None
+    snapshot_id = filename[:-len('.zip')]
+    return snapshot_id if snapshot_exists(snapshot_id) else None
+
+def backup_exists(filename):
+    if resolve_snapshot(filename):
+        return True
+    return os.path.exists(os.path.join('static', 'backups', filename))
+
+def restore_staging_dir():
+    """Temporary directory for an incoming backup, on the same filesystem as the live data"""
+    os.makedirs(RESTORE_STAGING_DIR, exist_ok=True)
+    return tempfile.TemporaryDirectory(dir=RESTORE_STAGING_DIR, prefix='restore_')
+
+def extract_backup(filename, temp_dir):
+    """Lay out a backup's files under temp_dir - from the snapshot store or a legacy ZIP - and validate them"""
+    snapshot_id = resolve_snapshot(filename)
+    if snapshot_id:
+        materialize_snapshot(snapshot_id, temp_dir)
+    else:
+        with open(os.path.join('static', 'backups', filename), 'rb') as f:
+            extract_stream(iter_zip_stream(f), temp_dir)
+    return validate_extracted(temp_dir)
+
+def extract_upload(stream, temp_dir):
+    """Extract an uploaded backup while it is being received, then validate it"""
+    extract_stream(iter_zip_stream(stream), temp_dir)
+    return validate_extracted(temp_dir)
+
+def snapshot_download_response(snapshot_id, filename):
+    """Stream a snapshot to the client as a backup ZIP, built while it is sent"""
+    return Response(
+        stream_snapshot_zip(snapshot_id),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def list_backup_names():
+    """Backup names for the setup page: snapshots (newest first), then legacy ZIP files"""
+    names = [f"{manifest['id']}.zip" for manifest in list_snapshots()]
+    backup_dir = os.path.join('static', 'backups')
+    if os.path.exists(backup_dir):
+        names.extend(sorted((f for f in os.listdir(backup_dir) if f.endswith('.zip')), reverse=True))
+    return names
+
+def validate_snapshot(snapshot_id, filename):
+    """validate_backup for a stored snapshot: every blob present and intact, database readable"""
+    manifest = load_manifest(snapshot_id)
+    files = [entry['path'] for entry in manifest.get('files', [])]
+    validation_result = {
+        'filename': filename,
+        'valid': True,
+        'errors': [],
+        'warnings': [],
+        'contents': files,
+        'metadata': backup_metadata(manifest)
+    }
+
+    for entry in manifest.get('files', []):
+        try:
+            for digest in entry['chunks']:
+                read_blob(digest)
+        except BackupStoreError as e:
+            validation_result['errors'].append(f"{entry['path']}: {e}")
+
+    if DATABASE_ARCNAME not in files:
+        validation_result['errors'].append('No database found in backup')
+    if 'settings.json' not in files:
+        validation_result['warnings'].append('No settings export found')
+
+    if not validation_result['errors'] and DATABASE_ARCNAME in files:
+        entry = next(e for e in manifest['files'] if e['path'] == DATABASE_ARCNAME)
+        try:
+            with restore_staging_dir() as temp_dir:
+                temp_db_path = os.path.join(temp_dir, DATABASE_ARCNAME)
+                os.makedirs(os.path.dirname(temp_db_path))
+                with open(temp_db_path, 'wb') as f:
+                    for digest in entry['chunks']:
+                        f.write(read_blob(digest))
+                validation_result['database_tables'] = validate_extracted(temp_dir)
+        except Exception as e:
+            validation_result['errors'].append(f'Database validation failed: {str(e)}')
+
+    validation_result['valid'] = not validation_result['errors']
+    return validation_result
+
 def export_settings():
     """Export all settings to a dictionary"""
     settings = {}
@@ -426,14 +503,26 @@ def restore_database(temp_dir):
     # Get current database path
     db_path = current_app.config.get('DATABASE_PATH', 'instance/minipass.db')
     
+    from chatbot_v2.result_cache import result_cache, read_data_versions, advance_data_versions
+    from chatbot_v2.sql_cache import sql_cache
+
     # Create backup of current database
+    versions = None
     if os.path.exists(db_path):
         backup_current_path = f"{db_path}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        shutil.copy2(db_path, backup_current_path)
+        snapshot_database(db_path, backup_current_path)
+        with closing(sqlite3.connect(backup_current_path)) as conn:
+            versions = read_data_versions(conn)
     
     # Restore database
     shutil.copy2(db_backup_path, db_path)
 
+    # Chatbot caches describe the replaced data: drop them here, and move the restored
+    # data_version counters past the old ones so other workers' cached results can't match
+    advance_data_versions(db_path, versions)
+    result_cache.clear()
+    sql_cache.clear()
+
 def restore_uploads(temp_dir):
     """Restore uploaded files from backup - handles busy directories"""
     # Try new backup structure first (static/uploads in zip)
@@ -462,17 +551,14 @@ def restore_uploads(temp_dir):
     else:
         os.makedirs(upload_dir)
 
-    # Copy new files into the existing directory
+    # Move new files into the existing directory (a rename when staged on the same filesystem)
     for item in os.listdir(upload_backup_dir):
         src = os.path.join(upload_backup_dir, item)
         dst = os.path.join(upload_dir, item)
         try:
-            if os.path.isfile(src):
-                shutil.copy2(src, dst)
-            elif os.path.isdir(src):
-                shutil.copytree(src, dst)
+            shutil.move(src, dst)
         except Exception as e:
-            logger.warning(f"[RESTORE] Could not copy {src} to {dst}: {e}")
+            logger.warning(f"[RESTORE] Could not move {src} to {dst}: {e}")
 
 def restore_templates(temp_dir):
     """Restore email templates from backup - handles busy directories"""
@@ -502,27 +588,31 @@ def restore_templates(temp_dir):
     else:
         os.makedirs(template_dir)
 
-    # Copy new files into the existing directory
+    # Move new files into the existing directory (a rename when staged on the same filesystem)
     for item in os.listdir(template_backup_dir):
         src = os.path.join(template_backup_dir, item)
         dst = os.path.join(template_dir, item)
         try:
-            if os.path.isfile(src):
-                shutil.copy2(src, dst)
-            elif os.path.isdir(src):
-                shutil.copytree(src, dst)
+            shutil.move(src, dst)
         except Exception as e:
-            logger.warning(f"[RESTORE] Could not copy {src} to {dst}: {e}")
+            logger.warning(f"[RESTORE] Could not move {src} to {dst}: {e}")
 
 def cleanup_old_restore_points(keep_count=3):
     """
-    Delete old restore point ZIP files, keeping only the most recent ones.
+    Delete old restore points (snapshots and legacy ZIP files), keeping only the most recent ones.
+    Blobs still referenced by other snapshots are kept; only unreferenced ones are freed.
 
     Args:
         keep_count (int): Number of most recent restore points to keep
     """
     logger.info(f"[CLEANUP] Starting cleanup_old_restore_points(keep_count={keep_count})")
 
+    # Snapshot restore points: drop old manifests, then free the blobs nothing references anymore
+    pruned = prune_snapshots('restore_point', keep_count)
+    if pruned:
+        collect_garbage()
+
+    # Legacy restore point ZIP files
     backup_dir = os.path.join('static', 'backups')
     if not os.path.exists(backup_dir):
         logger.warning(f"[CLEANUP] Backup directory does not exist: {backup_dir}")
@@ -618,49 +708,22 @@ def cleanup_old_safety_backups(keep_count=3):
 def create_restore_point():
     """Create an automatic restore point before major operations"""
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    restore_point_name = f"restore_point_{timestamp}.zip"
+    snapshot_id = f"restore_point_{timestamp}"
     
-    # Use the same backup creation logic but with a different name
+    # Same snapshot store as regular backups: an unchanged database costs nothing extra
     try:
-        backup_dir = os.path.join('static', 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            backup_path = os.path.join(temp_dir, restore_point_name)
-            
-            with ZipFile(backup_path, 'w') as zipf:
-                # Include database
-                db_path = current_app.config.get('DATABASE_PATH', 'instance/minipass.db')
-                if os.path.exists(db_path):
-                    zipf.write(db_path, 'database/minipass.db')
-                
-                # Include settings
-                settings_data = export_settings()
-                settings_file = os.path.join(temp_dir, 'settings.json')
-                with open(settings_file, 'w') as f:
-                    json.dump(settings_data, f, indent=2)
-                zipf.write(settings_file, 'settings.json')
-                
-                # Add metadata
-                metadata = {
-                    'backup_type': 'restore_point',
-                    'created_at': datetime.now(timezone.utc).isoformat(),
-                    'created_by': 'system',
-                    'version': '1.0'
-                }
-                metadata_file = os.path.join(temp_dir, 'backup_metadata.json')
-                with open(metadata_file, 'w') as f:
-                    json.dump(metadata, f, indent=2)
-                zipf.write(metadata_file, 'backup_metadata.json')
-            
-            # Move to backup directory
-            final_path = os.path.join(backup_dir, restore_point_name)
-            shutil.move(backup_path, final_path)
+        create_snapshot(
+            snapshot_id,
+            backup_type='restore_point',
+            created_by='system',
+            db_path=current_app.config.get('DATABASE_PATH', 'instance/minipass.db'),
+            extra_files={'settings.json': json.dumps(export_settings(), indent=2).encode('utf-8')}
+        )
 
         # Cleanup old restore points after successful creation
         cleanup_old_restore_points(keep_count=3)
 
-        return restore_point_name
+        return f"{snapshot_id}.zip"
     except Exception as e:
         print(f"Failed to create restore point: {e}")
         return None
@@ -466,7 +466,11 @@ def upload_organization_logo():
             file.save(os.path.join(upload_folder, filename))
         else:
             from utils import save_optimized_image
-            filename = save_optimized_image(file.stream, upload_folder, prefix="org_logo", max_size=(400, 400))
+            from image_pipeline import swap_reference
+            filename = save_optimized_image(
+                file.stream, upload_folder, prefix="org_logo", max_size=(400, 400),
+                on_ready=swap_reference(Setting, "value", key="LOGO_FILENAME")
+            )
 
         # Update setting
         save_setting('LOGO_FILENAME', filename)
@@ -16,6 +16,7 @@ import logging
 import traceback
 import shutil
 import time
+import threading
 import requests
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
@@ -33,8 +34,8 @@ from api.geocode import geocode_api
 
 # 🌐 Flask Core
 from flask import (
-    Flask, render_template, render_template_string, request, redirect,
-    url_for, session, flash, get_flashed_messages, jsonify, current_app, make_response, Response,
+    Flask, render_template, request, redirect,
+    url_for, session, flash, get_flashed_messages, jsonify, current_app, make_response,
     send_from_directory
 )
 
@@ -88,11 +89,16 @@ from utils import (
     generate_pass_code,
     generate_survey_token,
     generate_response_token,
+    STRIPE_CHECKOUT_EXPIRY_SECONDS,
     HERO_CID_MAP  # Shared constant for email template hero image CIDs
 )
 
+# 🖼️ Image uploads (derivatives built in a process pool)
+from image_pipeline import swap_reference, ready_image, ACTIVITY_IMAGE_SIZES
+
 # 🧠 Data Tools
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from markupsafe import Markup
 
 # ✅ Old chatbot imports removed - using new chatbot_v2 blueprint instead
 
@@ -143,6 +149,23 @@ def enable_foreign_keys():
 app.register_blueprint(backup_api)
 app.register_blueprint(geocode_api)
 
+# 📦 Fingerprinted static assets (built by `python -m static_assets`)
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """url_for('static', filename=...) resolves to the content-hashed name when an asset build exists"""
+    if endpoint == 'static' and 'filename' in values:
+        from static_assets import asset_path
+        values['filename'] = asset_path(app.static_folder, values['filename'])
+
+
+def serve_static_asset(filename):
+    from static_assets import send_asset
+    return send_asset(app.static_folder, filename)
+
+
+app.view_functions['static'] = serve_static_asset
+
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     flash("File is too large. Please use a smaller file.", "error")
@@ -222,6 +245,16 @@ with app.app_context():
     app.config["MAIL_PASSWORD"] = Config.get_setting(app, "MAIL_PASSWORD", "")
     app.config["MAIL_DEFAULT_SENDER"] = Config.get_setting(app, "MAIL_DEFAULT_SENDER", "")
 
+    # Capacity counter triggers (databases created with db.create_all() lack them)
+    try:
+        from utils import ensure_reserved_sessions_triggers
+        _created = ensure_reserved_sessions_triggers()
+        if _created:
+            print(f"🎟️ Created {_created} reserved_sessions triggers and recounted capacity")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Could not check reserved_sessions triggers: {e}")
+
     # Stripe health check: verify the API key can access the subscription
     try:
         from utils import get_setting as _startup_get_setting
@@ -987,6 +1020,36 @@ def init_scheduler(app):
 
                 # Unpaid reminders setup
                 scheduler.add_job(func=lambda: send_unpaid_reminders(app), trigger="interval", days=1, id="unpaid_reminders")
+
+                # API audit retention (raw rows pruned, hourly rollups kept)
+                from audit_writer import prune_api_audit_log
+                scheduler.add_job(func=lambda: prune_api_audit_log(app), trigger="interval", hours=6, id="api_audit_retention")
+
+                # Log table retention: archive old rows to instance/archive/, then incremental VACUUM
+                from data_retention import run_data_retention
+                scheduler.add_job(func=lambda: run_data_retention(app), trigger="cron", hour=3, minute=30, id="data_retention")
+
+                # Capacity counter drift check (activity.reserved_sessions vs passport table),
+                # after releasing holds of Stripe checkouts that can no longer complete
+                def run_reserved_sessions_reconcile():
+                    with app.app_context():
+                        from utils import reconcile_reserved_sessions, release_stale_stripe_holds
+                        released = release_stale_stripe_holds(STRIPE_CHECKOUT_EXPIRY_SECONDS)
+                        if released:
+                            print(f"🔧 Released {released} abandoned Stripe signup holds")
+                        fixed = reconcile_reserved_sessions()
+                        if fixed:
+                            print(f"🔧 Reconciled reserved_sessions for {fixed} activities")
+
+                scheduler.add_job(run_reserved_sessions_reconcile, trigger="cron", hour=4, minute=0, id="reserved_sessions_reconcile")
+
+                # Background export artifacts (instance/exports/) expire after a day
+                from export_jobs import expire_export_jobs
+                scheduler.add_job(func=lambda: expire_export_jobs(app), trigger="interval", hours=1, id="export_job_expiry")
+
+                # Hourly backup snapshot in a low-priority child process, thinned to hourly/daily/weekly/monthly tiers
+                from backup_scheduler import run_scheduled_backup
+                scheduler.add_job(func=lambda: run_scheduled_backup(app), trigger="cron", minute=15, id="scheduled_backup")
                 
                 # Start the scheduler
                 scheduler.start()
@@ -1033,30 +1096,101 @@ def get_git_version():
     except:
         return 'unknown'
 
+# Sidebar badge counts are rendered on every admin page. They are computed in one
+# combined query and cached per process for a few seconds; local writes to the
+# tables involved drop the cache as soon as they commit (see _invalidate_sidebar_on_commit).
+SIDEBAR_COUNTS_TTL_SECONDS = 15
+_SIDEBAR_MODELS = (Signup, Passport, Activity, EbankPayment, EmailLog, Admin)
+_sidebar_cache = {'counts': None, 'expires': 0.0, 'admins': {}}
+
+
+def invalidate_sidebar_counts():
+    """Force the next page render to recompute sidebar badge counts."""
+    _sidebar_cache['counts'] = None
+    _sidebar_cache['admins'] = {}
+
+
+from sqlalchemy import event as _sa_event
+from sqlalchemy.orm import Session as _SASession
+
+
+# Flushed changes are only noted here; invalidating before the commit would let a
+# concurrent render re-cache the old counts for the whole TTL. Registered on the
+# app's db.session only, not on every SQLAlchemy session in the process.
+@_sa_event.listens_for(db.session, "after_flush")
+def _note_sidebar_changes(session, flush_context):
+    if not session.info.get('sidebar_dirty'):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, _SIDEBAR_MODELS):
+                session.info['sidebar_dirty'] = True
+                return
+
+
+@_sa_event.listens_for(db.session, "after_commit")
+def _invalidate_sidebar_on_commit(session):
+    if session.info.pop('sidebar_dirty', False):
+        invalidate_sidebar_counts()
+
+
+@_sa_event.listens_for(db.session, "after_soft_rollback")
+def _forget_sidebar_changes(session, previous_transaction):
+    session.info.pop('sidebar_dirty', None)
+
+
+def _query_sidebar_counts():
+    """All four badge counts in a single SELECT of scalar subqueries."""
+    pending_sq = db.session.query(func.count(Signup.id)).filter(
+        Signup.status == 'pending'
+    ).scalar_subquery()
+
+    active_sq = get_active_passports_query().with_entities(
+        func.count(Passport.id)
+    ).scalar_subquery()
+
+    # Latest log row per unique payment; a payment is unmatched if that row is NO_MATCH
+    latest_payment = db.session.query(func.max(EbankPayment.id).label('id')).group_by(
+        EbankPayment.bank_info_name, EbankPayment.bank_info_amt, EbankPayment.from_email
+    ).subquery()
+    unmatched_sq = db.session.query(func.count(EbankPayment.id)).join(
+        latest_payment, latest_payment.c.id == EbankPayment.id
+    ).filter(EbankPayment.result == 'NO_MATCH').scalar_subquery()
+
+    failed_sq = db.session.query(func.count(EmailLog.id)).filter(
+        EmailLog.result == 'FAILED'
+    ).scalar_subquery()
+
+    pending, active, unmatched, failed = db.session.query(
+        pending_sq, active_sq, unmatched_sq, failed_sq
+    ).one()
+    return {
+        'pending_signups_count': pending or 0,
+        'active_passport_count': active or 0,
+        'unmatched_payment_count': unmatched or 0,
+        'failed_email_count': failed or 0,
+        'total_notifications': (pending or 0) + (unmatched or 0) + (failed or 0),
+    }
+
+
 def _get_sidebar_counts(admin_email):
-    """Return sidebar badge counts and admin data. Fresh query every request."""
+    """Return sidebar badge counts and admin data (cached per process, see SIDEBAR_COUNTS_TTL_SECONDS)."""
     try:
-        admin_obj = Admin.query.filter_by(email=admin_email).first()
-        pending = Signup.query.filter_by(status='pending').count()
-        unmatched = db.session.query(EbankPayment.id).filter(
-            EbankPayment.result == 'NO_MATCH',
-            EbankPayment.id.in_(
-                db.session.query(db.func.max(EbankPayment.id))
-                .group_by(EbankPayment.bank_info_name, EbankPayment.bank_info_amt, EbankPayment.from_email)
-            )
-        ).count()
-        failed = EmailLog.query.filter_by(result="FAILED").count()
-        return {
-            'pending_signups_count': pending,
-            'active_passport_count': get_active_passports_query().count(),
-            'unmatched_payment_count': unmatched,
-            'failed_email_count': failed,
-            'total_notifications': pending + unmatched + failed,
-            'current_admin': {
+        now = time.monotonic()
+        if _sidebar_cache['counts'] is None or now >= _sidebar_cache['expires']:
+            _sidebar_cache['counts'] = _query_sidebar_counts()
+            _sidebar_cache['admins'] = {}
+            _sidebar_cache['expires'] = now + SIDEBAR_COUNTS_TTL_SECONDS
+
+        if admin_email not in _sidebar_cache['admins']:
+            admin_obj = Admin.query.filter_by(email=admin_email).first()
+            _sidebar_cache['admins'][admin_email] = {
                 'avatar_filename': admin_obj.avatar_filename,
                 'display_name': admin_obj.display_name,
                 'email': admin_obj.email,
-            } if admin_obj else None,
+            } if admin_obj else None
+
+        return {
+            **_sidebar_cache['counts'],
+            'current_admin': _sidebar_cache['admins'][admin_email],
         }
     except Exception:
         return {
@@ -1129,9 +1263,48 @@ def inject_globals_and_csrf():
         'placeholder_css': get_placeholder_css,
         'placeholder_letter': get_placeholder_letter,
         'placeholder_color': get_placeholder_color,
+        'activity_image_url': activity_image_url,
+        'activity_image_srcset': activity_image_srcset,
+        'activity_image_background': activity_image_background,
     }
 
 
+def activity_image_url(filename, size="full", ext="jpg"):
+    """URL of an activity image variant (thumb, card, full: at most 320, 720, 1200 px wide); the original until variants exist."""
+    from image_pipeline import image_variant
+    return url_for('static', filename='uploads/activity_images/' + image_variant(filename, size, ext))
+
+
+def activity_image_srcset(filename, ext="jpg"):
+    """srcset value for an activity image, empty when it has no variants (let src alone decide)."""
+    from image_pipeline import srcset_entries
+    return ", ".join(
+        f"{url_for('static', filename='uploads/activity_images/' + name)} {width}w"
+        for name, width in srcset_entries(filename, ext)
+    )
+
+
+def activity_image_background(filename, size="card"):
+    """CSS background-image value: JPEG variant, upgraded to WebP through image-set() where supported."""
+    from image_pipeline import has_variants
+    jpg = activity_image_url(filename, size)
+    if not has_variants(filename):
+        return f"url('{jpg}')"
+    webp = activity_image_url(filename, size, "webp")
+    return f"url('{jpg}'); background-image: image-set(url('{webp}') type('image/webp'), url('{jpg}') type('image/jpeg'))"
+
+
+@app.after_request
+def cache_image_variants(response):
+    """Activity image variants never change under their name - let browsers keep them for a year."""
+    from image_pipeline import IMMUTABLE_VARIANT
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and request.path.startswith('/static/uploads/activity_images/')
+            and IMMUTABLE_VARIANT.search(request.path)):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 @app.template_filter('encode_md5')
 def encode_md5(s):
     if not s:
@@ -1402,10 +1575,7 @@ def unsplash_search():
 def download_unsplash_image():
     """Download an image from Unsplash and save it locally"""
     import requests
-    import uuid
-    import os
-    from PIL import Image
-    
+
     image_url = request.args.get('url')
     
     if not image_url:
@@ -1416,35 +1586,22 @@ def download_unsplash_image():
         response = requests.get(image_url, timeout=30)
         
         if response.status_code == 200:
-            # Generate unique filename
-            filename = f"unsplash_{uuid.uuid4().hex[:8]}.jpg"
-            
-            # Ensure upload directory exists
             upload_dir = os.path.join(app.static_folder, 'uploads', 'activity_images')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            file_path = os.path.join(upload_dir, filename)
-            
-            # Save and optimize the image
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Optimize image size
+
+            # Stored as downloaded; resized to 1200x800 JPEG in the image pool.
+            # The activity form resolves the optimized file with ready_image() on save; an
+            # activity saved before it was ready is switched over by swap_reference.
             try:
-                with Image.open(file_path) as img:
-                    # Convert to RGB if necessary
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Resize if too large
-                    max_size = (1200, 800)
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    
-                    # Save with optimization
-                    img.save(file_path, 'JPEG', quality=85, optimize=True)
+                filename = _save_optimized_image(io.BytesIO(response.content), upload_dir, prefix="unsplash",
+                                                 sizes=ACTIVITY_IMAGE_SIZES,
+                                                 on_ready=swap_reference(Activity, "image_filename"))
             except Exception as img_error:
                 print(f"Image optimization error: {img_error}")
-                # Continue with original file if optimization fails
+                # Continue with original file if it can't be read as an image
+                filename = f"unsplash_{uuid.uuid4().hex[:8]}.jpg"
+                os.makedirs(upload_dir, exist_ok=True)
+                with open(os.path.join(upload_dir, filename), 'wb') as f:
+                    f.write(response.content)
             
             return jsonify({
                 'success': True,
@@ -1459,49 +1616,29 @@ def download_unsplash_image():
         return jsonify({'success': False, 'error': 'Download failed'}), 500
 
 
-def _save_optimized_image(file_stream, dest_folder, prefix="upload", max_size=(1200, 800)):
-    """Save uploaded image: resize to max dimensions, convert to JPEG quality=85."""
-    from PIL import Image
-    import io
-
-    img = Image.open(file_stream)
-
-    # Flatten transparency to white background
-    if img.mode in ('RGBA', 'P'):
-        bg = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        bg.paste(img, mask=img.split()[3])
-        img = bg
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
-
-    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-
-    filename = f"{prefix}_{uuid.uuid4().hex[:10]}.jpg"
-    os.makedirs(dest_folder, exist_ok=True)
-    img.save(os.path.join(dest_folder, filename), 'JPEG', quality=85, optimize=True)
-    return filename
+def _save_optimized_image(file_stream, dest_folder, prefix="upload", max_size=(1200, 800), sizes=None, on_ready=None):
+    """Store uploaded image as-is; resize to max dimensions (plus any extra sizes) as JPEG quality=85 in the image pool."""
+    from image_pipeline import process_image_upload
 
+    return process_image_upload(file_stream, dest_folder, prefix=prefix, max_size=max_size, sizes=sizes,
+                                on_ready=on_ready)
 
-def _save_logo_image(file_stream, dest_folder, prefix="logo", max_size=(400, 400)):
-    """Save org logo: resize to max dimensions, save as PNG preserving transparency."""
-    from PIL import Image
 
-    img = Image.open(file_stream)
+def _save_logo_image(file_stream, dest_folder, prefix="logo", max_size=(400, 400), on_ready=None):
+    """Store org logo as-is; resize to max dimensions and save as PNG preserving transparency in the image pool."""
+    from image_pipeline import process_image_upload
 
-    # Normalize mode for PNG output
-    if img.mode == 'P':
-        img = img.convert('RGBA')
-    elif img.mode not in ('RGBA', 'RGB'):
-        img = img.convert('RGBA')
+    return process_image_upload(file_stream, dest_folder, prefix=prefix, max_size=max_size, fmt="PNG",
+                                on_ready=on_ready)
 
-    img.thumbnail(max_size, Image.Resampling.LANCZOS)
 
-    filename = f"{prefix}_{uuid.uuid4().hex[:10]}.png"
-    os.makedirs(dest_folder, exist_ok=True)
-    img.save(os.path.join(dest_folder, filename), 'PNG', optimize=True)
-    return filename
+def _propagate_org_logo(filename):
+    """Copy the org logo over every activity's owner_logo snapshot."""
+    logo_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    for act in Activity.query.all():
+        snapshot = os.path.join(app.config["UPLOAD_FOLDER"], f"{act.id}_owner_logo.png")
+        if os.path.exists(snapshot):
+            shutil.copy(logo_path, snapshot)
 
 
 ##
@@ -1763,17 +1900,8 @@ def list_signups():
     
     # Apply text search filter
     if q:
-        # Escape special characters for LIKE queries to prevent issues
-        escaped_q = q.replace('%', '\\%').replace('_', '\\_')
-        search_filter = db.or_(
-            User.name.ilike(f'%{escaped_q}%', escape='\\'),
-            User.email.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.subject.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.description.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.form_data.ilike(f'%{escaped_q}%', escape='\\'),
-            Activity.name.ilike(f'%{escaped_q}%', escape='\\')
-        )
-        query = query.join(User).join(Activity).filter(search_filter)
+        from utils import apply_signup_search
+        query = apply_signup_search(query.join(User).join(Activity), q)
     else:
         query = query.join(User).join(Activity)
     
@@ -1813,25 +1941,25 @@ def list_signups():
     
     # Pagination parameters
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 10  # Items per page - optimized for better UX with less scrolling
     
-    # Execute query with pagination
-    signups_pagination = query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    # Execute query with keyset pagination (signed_up_at, id)
+    from utils import keyset_paginate
+    signups_pagination = keyset_paginate(query, Signup.id, Signup.signed_up_at,
+                                         per_page=per_page, cursor=cursor, page=page)
     signups = signups_pagination.items
     
-    # Calculate statistics
-    all_signups = Signup.query.count()
-    paid_signups = Signup.query.filter(Signup.paid == True).count()
-    unpaid_signups = Signup.query.filter(Signup.paid == False).count()
-    pending_signups = Signup.query.filter(Signup.status == 'pending').count()
-    approved_signups = Signup.query.filter(Signup.status == 'approved').count()
-    recent_signups = Signup.query.filter(
-        Signup.signed_up_at >= datetime.now(timezone.utc) - timedelta(days=7)
-    ).count()
+    # Calculate statistics (single aggregate query)
+    recent_cutoff = datetime.now(timezone.utc) - timedelta(days=7)
+    all_signups, paid_signups, unpaid_signups, pending_signups, approved_signups, recent_signups = db.session.query(
+        func.count(Signup.id),
+        func.count(case((Signup.paid == True, 1))),
+        func.count(case((Signup.paid == False, 1))),
+        func.count(case((Signup.status == 'pending', 1))),
+        func.count(case((Signup.status == 'approved', 1))),
+        func.count(case((Signup.signed_up_at >= recent_cutoff, 1))),
+    ).one()
     
     statistics = {
         'total': all_signups,
@@ -2009,9 +2137,8 @@ def export_signups():
         return redirect(url_for("login"))
 
     from models import Signup, User, Activity
-    import csv
-    from io import StringIO
-    
+    from export_engine import iter_query, stream_export
+
     # Apply the same filters as the main list
     q = request.args.get('q', '').strip()
     activity_id = request.args.get('activity_id')
@@ -2028,17 +2155,8 @@ def export_signups():
     
     # Apply filters (same logic as list_signups)
     if q:
-        # Escape special characters for LIKE queries to prevent issues
-        escaped_q = q.replace('%', '\\%').replace('_', '\\_')
-        search_filter = db.or_(
-            User.name.ilike(f'%{escaped_q}%', escape='\\'),
-            User.email.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.subject.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.description.ilike(f'%{escaped_q}%', escape='\\'),
-            Signup.form_data.ilike(f'%{escaped_q}%', escape='\\'),
-            Activity.name.ilike(f'%{escaped_q}%', escape='\\')
-        )
-        query = query.join(User).join(Activity).filter(search_filter)
+        from utils import apply_signup_search
+        query = apply_signup_search(query.join(User).join(Activity), q)
     else:
         query = query.join(User).join(Activity)
     
@@ -2072,61 +2190,41 @@ def export_signups():
         except ValueError:
             pass
     
-    signups = query.all()
-    
-    # Create CSV content
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow([
-        'ID',
-        'User Name',
-        'User Email',
-        'Activity',
-        'Subject',
-        'Description',
-        'Status',
-        'Paid',
-        'Signup Date',
-        'Payment Date',
-        'Form Data'
-    ])
-    
-    # Write data rows
-    for signup in signups:
-        writer.writerow([
-            signup.id,
-            signup.user.name if signup.user else '',
-            signup.user.email if signup.user else '',
-            signup.activity.name if signup.activity else '',
-            signup.subject or '',
-            signup.description or '',
-            signup.status or '',
-            'Yes' if signup.paid else 'No',
-            signup.signed_up_at.strftime('%Y-%m-%d %H:%M') if signup.signed_up_at else '',
-            signup.paid_at.strftime('%Y-%m-%d %H:%M') if signup.paid_at else '',
-            signup.form_data or ''
-        ])
-    
-    # Log admin action
     admin_email = session.get("admin", "unknown")
-    db.session.add(AdminActionLog(
-        admin_email=admin_email,
-        action=f"Exported {len(signups)} signups to CSV"
-    ))
-    db.session.commit()
-    
-    # Create response
-    output.seek(0)
+
+    def signup_rows():
+        for signup in iter_query(query, Signup.id, Signup.signed_up_at):
+            yield [
+                signup.id,
+                signup.user.name if signup.user else '',
+                signup.user.email if signup.user else '',
+                signup.activity.name if signup.activity else '',
+                signup.subject or '',
+                signup.description or '',
+                signup.status or '',
+                'Yes' if signup.paid else 'No',
+                signup.signed_up_at.strftime('%Y-%m-%d %H:%M') if signup.signed_up_at else '',
+                signup.paid_at.strftime('%Y-%m-%d %H:%M') if signup.paid_at else '',
+                signup.form_data or ''
+            ]
+
+    def log_export(row_count):
+        db.session.add(AdminActionLog(
+            admin_email=admin_email,
+            action=f"Exported {row_count} signups to CSV"
+        ))
+        db.session.commit()
+
+    # Rows are streamed from the cursor as the download progresses
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'signups_export_{timestamp}.csv'
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    
-    return response
+    return stream_export(
+        "csv",
+        f"signups_export_{timestamp}",
+        ['ID', 'User Name', 'User Email', 'Activity', 'Subject', 'Description',
+         'Status', 'Paid', 'Signup Date', 'Payment Date', 'Form Data'],
+        signup_rows(),
+        on_complete=log_export,
+    )
 
 
 
@@ -2385,7 +2483,8 @@ def create_activity():
                 upload_folder = os.path.join("static", "uploads", "activity_images")
                 try:
                     image_filename = _save_optimized_image(
-                        uploaded_file.stream, upload_folder, prefix="upload"
+                        uploaded_file.stream, upload_folder, prefix="upload", sizes=ACTIVITY_IMAGE_SIZES,
+                        on_ready=swap_reference(Activity, "image_filename")
                     )
                 except Exception as e:
                     app.logger.error(f"Image optimization failed: {e}")
@@ -2396,7 +2495,7 @@ def create_activity():
                     uploaded_file.save(filepath)
                     image_filename = filename
         elif selected_image_filename:
-            image_filename = selected_image_filename
+            image_filename = ready_image(os.path.join("static", "uploads", "activity_images"), selected_image_filename)
 
         # Get default email templates from central configuration
         from utils_email_defaults import get_default_email_templates
@@ -2640,7 +2739,8 @@ def edit_activity(activity_id):
                 upload_folder = os.path.join("static", "uploads", "activity_images")
                 try:
                     activity.image_filename = _save_optimized_image(
-                        uploaded_file.stream, upload_folder, prefix="upload"
+                        uploaded_file.stream, upload_folder, prefix="upload", sizes=ACTIVITY_IMAGE_SIZES,
+                        on_ready=swap_reference(Activity, "image_filename")
                     )
                 except Exception as e:
                     app.logger.error(f"Image optimization failed: {e}")
@@ -2651,7 +2751,7 @@ def edit_activity(activity_id):
                     uploaded_file.save(filepath)
                     activity.image_filename = filename
         elif selected_image_filename:
-            activity.image_filename = selected_image_filename
+            activity.image_filename = ready_image(os.path.join("static", "uploads", "activity_images"), selected_image_filename)
         else:
             activity.image_filename = None
 
@@ -2868,17 +2968,36 @@ def signup(activity_id):
     is_sold_out = remaining_capacity is not None and remaining_capacity <= 0
 
     if request.method == "POST":
-        # Check capacity again on POST to prevent race conditions
-        remaining_capacity = get_remaining_capacity(activity_id)
-        requested_sessions = int(request.form.get("requested_sessions", 1))
+        # Hold the sessions in the same transaction as the signup insert, so two
+        # concurrent signups cannot both take the last spots
+        from utils import get_setting, reserve_capacity
+        try:
+            requested_sessions = int(request.form.get("requested_sessions", 1))
+        except (TypeError, ValueError):
+            requested_sessions = 0
+        max_quantity = activity.max_sessions if activity.is_quantity_limited and activity.max_sessions else None
+        if requested_sessions < 1 or (max_quantity and requested_sessions > max_quantity):
+            flash("Please choose a valid quantity.", "error")
+            return redirect(url_for("signup", activity_id=activity_id))
+
+        payment_method = request.form.get("payment_method", "interac")
+        if payment_method not in ("interac", "stripe"):
+            payment_method = "interac"
+
+        # Checked before anything is reserved, so a misconfigured Stripe never holds capacity
+        stripe_secret_key = get_setting('STRIPE_PAYMENTS_SECRET_KEY', '') if payment_method == "stripe" else ''
+        if payment_method == "stripe" and not stripe_secret_key:
+            flash("Credit card payments are not configured. Please use Interac.", "error")
+            return redirect(url_for("signup", activity_id=activity_id))
 
-        if remaining_capacity is not None:
-            if remaining_capacity <= 0:
+        if not reserve_capacity(activity_id, requested_sessions):
+            db.session.rollback()
+            remaining_capacity = get_remaining_capacity(activity_id)
+            if not remaining_capacity:
                 flash("Sorry, this activity is sold out.", "error")
-                return redirect(url_for("signup", activity_id=activity_id))
-            if requested_sessions > remaining_capacity:
+            else:
                 flash(f"Only {remaining_capacity} spots remaining. Please reduce your quantity.", "error")
-                return redirect(url_for("signup", activity_id=activity_id))
+            return redirect(url_for("signup", activity_id=activity_id))
 
         name = request.form.get("name", "").strip()
         email = request.form.get("email", "").strip()
@@ -2898,10 +3017,6 @@ def signup(activity_id):
         unit_price = passport_type.price_per_user if passport_type else 0.0
         requested_amount = unit_price * requested_sessions
 
-        payment_method = request.form.get("payment_method", "interac")
-        if payment_method not in ("interac", "stripe"):
-            payment_method = "interac"
-
         signup_record = Signup(
             user_id=user.id,
             activity_id=activity.id,
@@ -2924,12 +3039,6 @@ def signup(activity_id):
         if payment_method == "stripe":
             # Redirect to Stripe Checkout for credit card payment
             try:
-                from utils import get_setting
-                stripe_secret_key = get_setting('STRIPE_PAYMENTS_SECRET_KEY', '')
-                if not stripe_secret_key:
-                    flash("Credit card payments are not configured. Please use Interac.", "error")
-                    return redirect(url_for("signup", activity_id=activity_id))
-
                 checkout_session = stripe.checkout.Session.create(
                     payment_method_types=['card'],
                     line_items=[{
@@ -2941,6 +3050,9 @@ def signup(activity_id):
                         'quantity': 1,
                     }],
                     mode='payment',
+                    # Short-lived, so an abandoned checkout releases its hold quickly
+                    # (checkout.session.expired webhook, or release_stale_stripe_holds)
+                    expires_at=int(time.time()) + STRIPE_CHECKOUT_EXPIRY_SECONDS,
                     success_url=url_for('stripe_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
                     cancel_url=url_for('signup', activity_id=activity_id, _external=True),
                     metadata={'signup_id': str(signup_record.id)},
@@ -2952,6 +3064,10 @@ def signup(activity_id):
                 return redirect(checkout_session.url, code=303)
             except Exception as e:
                 print(f"[Stripe Checkout] Error creating session: {e}")
+                # No checkout exists - release the sessions this signup was holding
+                db.session.rollback()
+                signup_record.status = 'cancelled'
+                db.session.commit()
                 flash("Error creating payment session. Please try again or use Interac.", "error")
                 return redirect(url_for("signup", activity_id=activity_id))
         else:
@@ -3088,6 +3204,16 @@ def stripe_webhook():
         else:
             print(f"[Stripe Webhook] Failed to create passport for signup {signup_id}")
 
+    elif event['type'] == 'checkout.session.expired':
+        # Abandoned checkout: release the sessions the signup was holding
+        signup_record = Signup.query.filter_by(
+            stripe_checkout_session_id=event['data']['object'].get('id'), status='stripe_processing'
+        ).first()
+        if signup_record and not signup_record.paid:
+            signup_record.status = 'cancelled'
+            db.session.commit()
+            print(f"[Stripe Webhook] Checkout expired, signup {signup_record.id} cancelled")
+
     elif event['type'] == 'payout.paid':
         payout_obj  = event['data']['object']
         payout_id   = payout_obj.get('id')
@@ -4284,12 +4410,21 @@ def api_payment_bot_logs():
 
 @app.route("/service-worker.js")
 def serve_service_worker():
-    """Serve service worker from root for full site scope (required for push notifications)"""
-    return send_from_directory(
-        app.static_folder,
-        'service-worker.js',
-        mimetype='application/javascript'
-    )
+    """Serve service worker from root for full site scope (required for push notifications),
+    with the precache list of the current asset build filled in"""
+    from static_assets import precache_manifest
+
+    with open(os.path.join(app.static_folder, 'service-worker.js'), encoding='utf-8') as f:
+        source = f.read()
+
+    revision, urls = precache_manifest(app.static_folder, app.static_url_path)
+    if revision:
+        source = source.replace("const PRECACHE_REVISION = null;", f"const PRECACHE_REVISION = {json.dumps(revision)};", 1)
+        source = source.replace("const PRECACHE_URLS = [];", f"const PRECACHE_URLS = {json.dumps(urls)};", 1)
+
+    response = app.response_class(source, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'  # A new asset build must reach the browser's update check
+    return response
 
 
 @app.route("/manifest.json")
@@ -4535,7 +4670,8 @@ def setup():
                     try:
                         prefix = f"admin_{email.replace('@', '_').replace('.', '_')}_{int(time.time())}"
                         avatar_filename = _save_optimized_image(
-                            avatar_file.stream, avatar_dir, prefix=prefix, max_size=(400, 400)
+                            avatar_file.stream, avatar_dir, prefix=prefix, max_size=(400, 400),
+                            on_ready=swap_reference(Admin, "avatar_filename")
                         )
                     except Exception as e:
                         app.logger.error(f"Avatar optimization failed: {e}")
@@ -4679,8 +4815,10 @@ def setup():
                 return redirect(request.referrer or url_for('setup'))
             logo_file.stream.seek(0)
             upload_folder = app.config["UPLOAD_FOLDER"]
-            filename = _save_logo_image(logo_file.stream, upload_folder, prefix="org_logo", max_size=(400, 400))
-            logo_path = os.path.join(upload_folder, filename)
+            filename = _save_logo_image(
+                logo_file.stream, upload_folder, prefix="org_logo", max_size=(400, 400),
+                on_ready=swap_reference(Setting, "value", after=_propagate_org_logo, key="LOGO_FILENAME")
+            )
 
             setting = Setting.query.filter_by(key="LOGO_FILENAME").first()
             if setting:
@@ -4691,10 +4829,7 @@ def setup():
             flash("Logo uploaded successfully!", "success")
 
             # Propagate new org logo to all existing activity owner_logo snapshots
-            for act in Activity.query.all():
-                snapshot = os.path.join(app.config["UPLOAD_FOLDER"], f"{act.id}_owner_logo.png")
-                if os.path.exists(snapshot):
-                    shutil.copy(logo_path, snapshot)
+            _propagate_org_logo(filename)
 
         db.session.commit()
         print("[SETUP] Admins configured:", admin_emails)
@@ -4711,11 +4846,8 @@ def setup():
     admins = Admin.query.all()
     backup_file = request.args.get("backup_file")
 
-    backup_dir = os.path.join("static", "backups")
-    backup_files = sorted(
-        [f for f in os.listdir(backup_dir) if f.endswith(".zip")],
-        reverse=True
-    ) if os.path.exists(backup_dir) else []
+    from api.backup import list_backup_names
+    backup_files = list_backup_names()
 
     print("📥 Received backup_file from args:", backup_file)
     
@@ -4905,8 +5037,10 @@ def unified_settings():
                     return redirect(request.referrer or url_for('setup'))
                 logo_file.stream.seek(0)
                 upload_folder = app.config["UPLOAD_FOLDER"]
-                filename = _save_logo_image(logo_file.stream, upload_folder, prefix="org_logo", max_size=(400, 400))
-                logo_path = os.path.join(upload_folder, filename)
+                filename = _save_logo_image(
+                    logo_file.stream, upload_folder, prefix="org_logo", max_size=(400, 400),
+                    on_ready=swap_reference(Setting, "value", after=_propagate_org_logo, key="LOGO_FILENAME")
+                )
                 logo_filename = filename  # Store for JSON response
                 
                 setting = Setting.query.filter_by(key="LOGO_FILENAME").first()
@@ -4916,10 +5050,7 @@ def unified_settings():
                     db.session.add(Setting(key="LOGO_FILENAME", value=filename))
 
                 # Propagate new org logo to all existing activity owner_logo snapshots
-                for act in Activity.query.all():
-                    snapshot = os.path.join(app.config["UPLOAD_FOLDER"], f"{act.id}_owner_logo.png")
-                    if os.path.exists(snapshot):
-                        shutil.copy(logo_path, snapshot)
+                _propagate_org_logo(filename)
 
             # Step 3: Email Settings
             email_settings = {
@@ -4980,6 +5111,14 @@ def unified_settings():
                 else:
                     db.session.add(Setting(key=key, value=value))
 
+            # Step 4c: Scheduled backups (always write — False when checkbox is absent from POST)
+            backups_enabled_value = str("enable_scheduled_backups" in request.form)
+            existing_backups = Setting.query.filter_by(key="ENABLE_SCHEDULED_BACKUPS").first()
+            if existing_backups:
+                existing_backups.value = backups_enabled_value
+            else:
+                db.session.add(Setting(key="ENABLE_SCHEDULED_BACKUPS", value=backups_enabled_value))
+
             # Step 5: Save all changes
             db.session.commit()
 
@@ -5012,10 +5151,15 @@ def unified_settings():
         webhook_url = f"https://minipass_app.minipass.me/stripe/webhook"
 
     stripe_payments_enabled = settings.get("STRIPE_PAYMENTS_ENABLED", "False") == "True"
+
+    from backup_scheduler import get_last_run, get_retention_tiers
     return render_template("unified_settings.html",
                            settings=settings,
                            webhook_url=webhook_url,
-                           stripe_payments_enabled=stripe_payments_enabled)
+                           stripe_payments_enabled=stripe_payments_enabled,
+                           scheduled_backups_enabled=settings.get("ENABLE_SCHEDULED_BACKUPS", "True") == "True",
+                           backup_last_run=get_last_run(),
+                           backup_tiers=get_retention_tiers())
 
 
 # Alternative route name to match template url_for reference
@@ -5473,76 +5617,35 @@ def generate_backup():
     if "admin" not in session:
         return redirect(url_for("login"))
 
-    from zipfile import ZipFile
-    import tempfile
-    import shutil
+    from backup_store import create_snapshot, backup_sources, prune_snapshots, collect_garbage
 
     try:
         # ✅ Use real DB path from config
         db_uri = app.config["SQLALCHEMY_DATABASE_URI"]
         db_path = db_uri.replace("sqlite:///", "")
-        db_filename = os.path.basename(db_path)
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        zip_filename = f"minipass_backup_{timestamp}.zip"
+        snapshot_id = f"minipass_backup_{timestamp}"
+        zip_filename = f"{snapshot_id}.zip"
         print("Generating backup:", zip_filename)
 
-        tmp_dir = tempfile.mkdtemp()
-        zip_path = os.path.join(tmp_dir, zip_filename)
+        # Snapshot into the deduplicated backup store: database (online snapshot),
+        # uploads and ALL email template files. Unchanged files and chunks are shared
+        # with earlier backups, so only what changed is written.
+        manifest = create_snapshot(
+            snapshot_id,
+            backup_type="full",
+            created_by=session.get("admin", "unknown"),
+            db_path=db_path,
+            sources=backup_sources(upload_dir=os.path.join(app.static_folder, "uploads")),
+            metadata={"database_file": os.path.basename(db_path)}
+        )
+        stats = manifest["stats"]
+        print(f"Backup stored: {stats['files']} files, {stats['new_bytes']} of {stats['total_bytes']} bytes new")
 
-        with ZipFile(zip_path, "w") as zipf:
-            # Add database in expected folder structure
-            zipf.write(db_path, arcname=f"database/{db_filename}")
-            
-            # Add metadata
-            metadata = {
-                "backup_type": "full",
-                "version": "2.0",
-                "created_by": session.get("admin", "unknown"),
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "database_file": db_filename
-            }
-            zipf.writestr("backup_metadata.json", json.dumps(metadata, indent=2))
-            
-            # Add all uploaded files
-            uploads_dir = os.path.join(app.static_folder, "uploads")
-            if os.path.exists(uploads_dir):
-                for root, dirs, files in os.walk(uploads_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        # Create archive path relative to app root
-                        archive_path = os.path.relpath(file_path, start=os.path.dirname(app.static_folder))
-                        zipf.write(file_path, arcname=archive_path)
-            
-            # Add ALL email template files (HTML, compiled, images, etc.)
-            email_templates_dir = os.path.join("templates", "email_templates")
-            if os.path.exists(email_templates_dir):
-                for root, dirs, files in os.walk(email_templates_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        # Keep relative path from app root
-                        archive_path = os.path.relpath(file_path, start='.')
-                        zipf.write(file_path, arcname=archive_path)
-
-        final_path = os.path.join("static", "backups", zip_filename)
-        os.makedirs(os.path.dirname(final_path), exist_ok=True)
-
-        print(f"🛠 Moving zip from {zip_path} → {final_path}")
-        shutil.move(zip_path, final_path)
-        print(f"Backup saved to: {final_path}")
-
-        # Auto-cleanup: Keep only the 5 most recent backups
-        backup_dir = os.path.join("static", "backups")
-        if os.path.exists(backup_dir):
-            backup_files = sorted(
-                [f for f in os.listdir(backup_dir) if f.endswith(".zip")],
-                reverse=True  # Most recent first
-            )
-            if len(backup_files) > 5:
-                for old_backup in backup_files[5:]:  # Keep first 5, delete rest
-                    old_path = os.path.join(backup_dir, old_backup)
-                    os.remove(old_path)
-                    print(f"Deleted old backup: {old_backup}")
+        # Auto-cleanup: Keep only the 5 most recent backups, then free unreferenced blobs
+        if prune_snapshots("full", 5):
+            collect_garbage()
 
         flash(f"Backup created: {zip_filename}", "success")
     except Exception as e:
@@ -5563,8 +5666,17 @@ def delete_backup(filename):
             flash("Invalid backup filename.", "danger")
             return redirect(url_for("setup") + "#tab-data")
 
+        from api.backup import resolve_snapshot
+        from backup_store import delete_snapshot, collect_garbage
+
+        snapshot_id = resolve_snapshot(filename)
         backup_path = os.path.join("static", "backups", filename)
-        if os.path.exists(backup_path):
+        if snapshot_id:
+            delete_snapshot(snapshot_id)
+            collect_garbage()
+            print(f"Backup deleted: {filename}")
+            flash(f"Backup deleted: {filename}", "success")
+        elif os.path.exists(backup_path):
             os.remove(backup_path)
             print(f"Backup deleted: {filename}")
             flash(f"Backup deleted: {filename}", "success")
@@ -5577,6 +5689,30 @@ def delete_backup(filename):
     return redirect(url_for("setup") + "#tab-data")
 
 
+@app.route("/download-backup/<filename>")
+def download_backup(filename):
+    if "admin" not in session:
+        return redirect(url_for("login"))
+
+    # Security: Only allow .zip files and prevent path traversal
+    if not filename.endswith(".zip") or "/" in filename or "\\" in filename:
+        flash("Invalid backup filename.", "danger")
+        return redirect(url_for("setup") + "#tab-data")
+
+    from api.backup import resolve_snapshot, snapshot_download_response
+
+    snapshot_id = resolve_snapshot(filename)
+    if snapshot_id:
+        # Zip bytes are produced from the snapshot store while they are sent
+        return snapshot_download_response(snapshot_id, filename)
+
+    backup_dir = os.path.join("static", "backups")
+    if not os.path.exists(os.path.join(backup_dir, filename)):
+        flash("Backup file not found.", "danger")
+        return redirect(url_for("setup") + "#tab-data")
+    return send_from_directory(backup_dir, filename, as_attachment=True)
+
+
 @app.route("/restore-backup/<filename>", methods=["POST"])
 def restore_backup(filename):
     if "admin" not in session:
@@ -5588,24 +5724,24 @@ def restore_backup(filename):
             flash("Invalid backup filename.", "danger")
             return redirect(url_for("setup") + "#tab-data")
 
-        backup_path = os.path.join("static", "backups", filename)
-        if not os.path.exists(backup_path):
+        # Import restore functions directly
+        from api.backup import (
+            restore_database, restore_uploads, restore_templates, create_restore_point, backup_exists,
+            extract_backup, restore_staging_dir
+        )
+
+        if not backup_exists(filename):
             flash("Backup file not found.", "danger")
             return redirect(url_for("setup") + "#tab-data")
-
-        # Import restore functions directly
-        from api.backup import restore_database, restore_uploads, restore_templates, create_restore_point
-        from zipfile import ZipFile
-        import tempfile
         
         try:
-            # Create restore point before restoration
-            create_restore_point()
-            
-            # Extract and restore from the backup file
-            with tempfile.TemporaryDirectory() as temp_extract_dir:
-                with ZipFile(backup_path, 'r') as zipf:
-                    zipf.extractall(temp_extract_dir)
+            # Rebuild the backup from the snapshot store (or extract a legacy ZIP) next to the
+            # live data and validate it, then move it into place
+            with restore_staging_dir() as temp_extract_dir:
+                extract_backup(filename, temp_extract_dir)
+
+                # Create restore point before restoration
+                create_restore_point()
                 
                 # Restore database, uploads, and templates
                 restore_database(temp_extract_dir)
@@ -5630,51 +5766,55 @@ def upload_and_restore_backup():
     if "admin" not in session:
         return redirect(url_for("login"))
 
-    try:
-        # Check if file was uploaded
-        if 'backup_file' not in request.files:
-            flash("No backup file selected.", "danger")
-            return redirect(url_for("setup") + "#tab-data")
+    # The setup page sends the ZIP as the raw request body so it can be restored while it
+    # arrives; a regular multipart form post still works (Werkzeug spools that file first)
+    raw_upload = request.mimetype == "application/zip"
+    setup_url = url_for("setup") + "#tab-data"
 
-        file = request.files['backup_file']
-        if file.filename == '':
-            flash("No backup file selected.", "danger")
-            return redirect(url_for("setup") + "#tab-data")
+    def done():
+        return jsonify({"redirect": setup_url}) if raw_upload else redirect(setup_url)
+
+    try:
+        if raw_upload:
+            from urllib.parse import unquote
+            filename = unquote(request.headers.get("X-Backup-Filename", "backup.zip"))
+            stream = request.stream
+        else:
+            # Check if file was uploaded
+            if 'backup_file' not in request.files:
+                flash("No backup file selected.", "danger")
+                return done()
+
+            file = request.files['backup_file']
+            if file.filename == '':
+                flash("No backup file selected.", "danger")
+                return done()
+            filename = file.filename
+            stream = file.stream
 
         # Validate file extension
-        if not file.filename.endswith('.zip'):
+        if not filename.endswith('.zip'):
             flash("Only ZIP backup files are supported.", "danger")
-            return redirect(url_for("setup") + "#tab-data")
+            return done()
 
-        # Save uploaded file temporarily
-        import tempfile
-        import shutil
         from werkzeug.utils import secure_filename
-        
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_filename = f"uploaded_backup_{timestamp}_{filename}"
-        
-        # Ensure backup directory exists
-        backup_dir = os.path.join("static", "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # Save uploaded file
-        temp_backup_path = os.path.join(backup_dir, temp_filename)
-        file.save(temp_backup_path)
+        filename = secure_filename(filename)
         
         # Import restore functions directly
-        from api.backup import restore_database, restore_uploads, restore_templates, create_restore_point, cleanup_old_safety_backups
-        from zipfile import ZipFile
+        from api.backup import (
+            restore_database, restore_uploads, restore_templates, create_restore_point, cleanup_old_safety_backups,
+            extract_upload, restore_staging_dir
+        )
 
         try:
-            # Create restore point before restoration
-            create_restore_point()
+            # Entries are CRC-checked and written into a staging directory next to the live
+            # data as the upload is read; nothing live is touched until the whole archive
+            # and its database have been validated
+            with restore_staging_dir() as temp_extract_dir:
+                extract_upload(stream, temp_extract_dir)
 
-            # Extract and restore from the uploaded backup
-            with tempfile.TemporaryDirectory() as temp_extract_dir:
-                with ZipFile(temp_backup_path, 'r') as zipf:
-                    zipf.extractall(temp_extract_dir)
+                # Create restore point before restoration
+                create_restore_point()
 
                 # Restore database, uploads, and templates
                 restore_database(temp_extract_dir)
@@ -5684,21 +5824,9 @@ def upload_and_restore_backup():
             # CLEANUP OLD BACKUPS - Keep only 3 most recent
             cleanup_old_safety_backups(keep_count=3)
 
-            # Clean up the temporary uploaded file
-            try:
-                os.remove(temp_backup_path)
-            except:
-                pass
-
             flash(f"Successfully restored from uploaded backup: {filename}", "success")
             
         except Exception as restore_error:
-            # Clean up the temporary uploaded file
-            try:
-                os.remove(temp_backup_path)
-            except:
-                pass
-            
             print(f"Direct restore failed: {str(restore_error)}")
             flash(f"Restore failed: {str(restore_error)}", "danger")
 
@@ -5706,7 +5834,7 @@ def upload_and_restore_backup():
         print("Upload and restore failed:", str(e))
         flash("Failed to upload and restore backup. Check logs.", "danger")
 
-    return redirect(url_for("setup") + "#tab-data")
+    return done()
 
 
 @app.route("/users.json")
@@ -6062,42 +6190,152 @@ def reset_password(token):
     )
 
 
-@app.route("/pass/<pass_code>")
-def show_pass(pass_code):
-    from models import Passport
+# The pass page is opened over and over at the door. Its owner/history cards are
+# rendered once per pass version (passport, owner, activity and redemptions, read
+# in one query) and cached per process; local writes to those rows drop the entry
+# right away (see _invalidate_pass_pages_on_flush) and the version check catches
+# writes made by the other workers. Public views also answer If-None-Match, with an
+# ETag over that version, the release and the org settings the base template and
+# context processor render (read in the same query, so a 304 costs one SELECT).
+PASS_PAGE_CACHE_SIZE = 512
+PASS_PAGE_SETTINGS = ("ORG_NAME", "LOGO_FILENAME", "ORG_ADDRESS", "DISPLAY_PAYMENT_EMAIL", "MAIL_USERNAME")
+PASS_PAGE_RELEASE = get_git_version()
+_pass_page_cache = OrderedDict()  # (pass_code, admin email) -> entry
+_pass_page_lock = threading.Lock()
+
+
+def invalidate_pass_pages(passport_ids=(), user_ids=(), activity_ids=()):
+    """Drop cached pass fragments for the given passports, owners or activities."""
+    with _pass_page_lock:
+        for key in [k for k, e in _pass_page_cache.items()
+                    if e['passport_id'] in passport_ids or e['user_id'] in user_ids
+                    or e['activity_id'] in activity_ids]:
+            del _pass_page_cache[key]
+
+
+@_sa_event.listens_for(_SASession, "after_flush")
+def _invalidate_pass_pages_on_flush(session, flush_context):
+    passport_ids, user_ids, activity_ids = set(), set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Passport):
+            passport_ids.add(obj.id)
+        elif isinstance(obj, Redemption):
+            passport_ids.add(obj.passport_id)
+        elif isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, Activity):
+            activity_ids.add(obj.id)
+    if (passport_ids or user_ids or activity_ids) and _pass_page_cache:
+        invalidate_pass_pages(passport_ids, user_ids, activity_ids)
+
+
+def _pass_version(pass_code):
+    """
+    (passport id, user id, activity id, card version, page version) or None. The card
+    version covers what the pass cards show; the page version adds PASS_PAGE_SETTINGS.
+    """
+    redemption_count_sq = db.session.query(func.count(Redemption.id)).filter(
+        Redemption.passport_id == Passport.id
+    ).correlate(Passport).scalar_subquery()
+
+    last_redemption_sq = db.session.query(func.max(Redemption.id)).filter(
+        Redemption.passport_id == Passport.id
+    ).correlate(Passport).scalar_subquery()
+
+    settings_sq = db.session.query(
+        func.group_concat(Setting.key + '=' + func.coalesce(Setting.value, ''), '|')
+    ).filter(Setting.key.in_(PASS_PAGE_SETTINGS)).scalar_subquery()
+
+    row = db.session.query(
+        Passport.id, Passport.user_id, Passport.activity_id,
+        Passport.sold_amt, Passport.uses_remaining, Passport.created_by, Passport.created_dt,
+        Passport.paid, Passport.paid_date, Passport.marked_paid_by,
+        User.name, User.email, User.phone_number,
+        Activity.name, Activity.image_filename, Activity.logo_filename,
+        redemption_count_sq, last_redemption_sq, settings_sq
+    ).outerjoin(User, User.id == Passport.user_id).outerjoin(
+        Activity, Activity.id == Passport.activity_id
+    ).filter(Passport.pass_code == pass_code).first()
+
+    if row is None:
+        return None
+    cards = tuple(row)[:-1]
+    # get_setting prefers environment variables, so those count too
+    settings = (row[-1], tuple(os.environ.get(key) for key in PASS_PAGE_SETTINGS))
+    return (row[0], row[1], row[2], hashlib.sha1(repr(cards).encode()).hexdigest()[:16],
+            hashlib.sha1(repr((cards, settings, PASS_PAGE_RELEASE)).encode()).hexdigest()[:20])
 
-    hockey_pass = Passport.query.filter_by(pass_code=pass_code).first()
 
-    if not hockey_pass:
-        return "Pass not found", 404
-
-    # ✅ Generate QR code
+def _render_pass_details(pass_code, hockey_pass, admin_email):
     qr_data = base64.b64encode(generate_qr_code_image(pass_code)).decode()
 
     # ✅ Pass fallback admin email for correct "Par" display
-    history = get_pass_history_data(pass_code, fallback_admin_email=session.get("admin"))
+    history = get_pass_history_data(pass_code, fallback_admin_email=admin_email)
+
+    return Markup(render_template(
+        "partials/pass_details.html",
+        hockey_pass=hockey_pass,
+        qr_data=qr_data,
+        history=history
+    ))
+
+
+@app.route("/pass/<pass_code>")
+def show_pass(pass_code):
+    version = _pass_version(pass_code)
+    if version is None:
+        return "Pass not found", 404
+    passport_id, user_id, activity_id, pass_version, etag = version
 
     # ✅ Check if admin is logged in
+    admin_email = session.get("admin")
     is_admin = "admin" in session
 
-    # ✅ Load system settings
-    settings_raw = {s.key: s.value for s in Setting.query.all()}
-
-    # ✅ Render payment instructions
-    email_info_rendered = render_template_string(
-        settings_raw.get("EMAIL_INFO_TEXT", ""),
-        hockey_pass=hockey_pass
-    )
+    # ✅ Members: 304 while nothing on the page changed (admins get a fresh CSRF token instead,
+    # and a pending flash message must still reach the page)
+    if is_admin or session.get("_flashes"):
+        etag = None
+    elif request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    hockey_pass = Passport.query.get(passport_id)
+
+    cache_key = (pass_code, admin_email)
+    with _pass_page_lock:
+        entry = _pass_page_cache.get(cache_key)
+        if entry is not None and entry['version'] == pass_version:
+            _pass_page_cache.move_to_end(cache_key)
+            pass_details = entry['html']
+        else:
+            pass_details = None
+
+    if pass_details is None:
+        pass_details = _render_pass_details(pass_code, hockey_pass, admin_email)
+        with _pass_page_lock:
+            _pass_page_cache[cache_key] = {
+                'version': pass_version,
+                'passport_id': passport_id,
+                'user_id': user_id,
+                'activity_id': activity_id,
+                'html': pass_details,
+            }
+            _pass_page_cache.move_to_end(cache_key)
+            while len(_pass_page_cache) > PASS_PAGE_CACHE_SIZE:
+                _pass_page_cache.popitem(last=False)
 
-    return render_template(
+    response = make_response(render_template(
         "pass.html",
         hockey_pass=hockey_pass,
-        qr_data=qr_data,
-        history=history,
-        is_admin=is_admin,
-        settings=settings_raw,
-        email_info=email_info_rendered
-    )
+        pass_details=pass_details,
+        is_admin=is_admin
+    ))
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 
@@ -6707,6 +6945,7 @@ def list_passports():
 
     # Get pagination and filter parameters
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 10
     q = request.args.get("q", "").strip()
     activity_id = request.args.get("activity", "")
@@ -6734,14 +6973,8 @@ def list_passports():
 
     # Apply filters
     if q:
-        query = query.join(User).filter(
-            db.or_(
-                User.name.ilike(f"%{q}%"),
-                User.email.ilike(f"%{q}%"),
-                Passport.pass_code.ilike(f"%{q}%"),
-                Passport.notes.ilike(f"%{q}%")
-            )
-        )
+        from utils import apply_passport_search
+        query = apply_passport_search(query, q)
 
     if activity_id:
         query = query.filter(Passport.activity_id == activity_id)
@@ -6785,23 +7018,24 @@ def list_passports():
         except ValueError:
             pass
 
-    # Paginate the results
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Paginate the results (keyset on created_dt, id - constant cost on deep pages)
+    from utils import keyset_paginate
+    pagination = keyset_paginate(query, Passport.id, Passport.created_dt,
+                                 per_page=per_page, cursor=cursor, page=page)
     passports = pagination.items
 
     # Get activities for filter dropdown
     activities = Activity.query.filter_by(status='active').order_by(Activity.name).all()
 
-    # Get all passports for statistics (unfiltered counts)
-    all_passports = Passport.query.all()
-
-    # Calculate statistics using ALL passports (not filtered results)
-    paid_passports = len([p for p in all_passports if p.paid])
-    unpaid_passports = len([p for p in all_passports if not p.paid])
+    # Calculate statistics over ALL passports (not filtered results) in one aggregate query
+    paid_passports, unpaid_passports, total_revenue, pending_revenue = db.session.query(
+        func.count(case((Passport.paid == True, 1))),
+        func.count(case((Passport.paid == False, 1))),
+        func.coalesce(func.sum(case((Passport.paid == True, Passport.sold_amt))), 0),
+        func.coalesce(func.sum(case((Passport.paid == False, Passport.sold_amt))), 0),
+    ).one()
     # Active = has remaining uses AND belongs to a non-archived activity
     active_passports = get_active_passports_query().count()
-    total_revenue = sum(p.sold_amt for p in all_passports if p.paid)
-    pending_revenue = sum(p.sold_amt for p in all_passports if not p.paid)
 
     statistics = {
         'total_passports': all_passports_count,
@@ -6889,49 +7123,14 @@ def financial_report():
                          period_display=period_display)
 
 
-def generate_smart_filename(source_type, record_id, date, amount, original_filename):
-    """
-    Generate smart filename for ZIP export: {TYPE}-{ID}_{DATE}_{AMOUNT}_{original}.{ext}
-    Example: INCOME-42_2025-01-15_150_00_receipt.jpg
-    """
-    import re
-    from werkzeug.utils import secure_filename
-
-    # Extract extension
-    ext = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else 'file'
-
-    # Extract original base name (remove UUID prefix if present)
-    original_base = original_filename.rsplit('.', 1)[0]
-    original_base = re.sub(r'^(income|expense)_[a-f0-9]{32}', '', original_base)
-    if not original_base:
-        original_base = 'receipt'
-    original_base = secure_filename(original_base) or 'receipt'
-
-    # Format date
-    if hasattr(date, 'strftime'):
-        date_str = date.strftime('%Y-%m-%d')
-    else:
-        date_str = str(date).split()[0]
-
-    # Format amount (replace . with _ for filename safety)
-    amount_str = f"{float(amount):.2f}".replace('.', '_')
-
-    # Build filename
-    type_prefix = source_type.upper()
-    return f"{type_prefix}-{record_id}_{date_str}_{amount_str}_{original_base}.{ext}"
-
-
 @app.route("/reports/financial/export")
 def financial_report_export():
     """Export financial report in various formats (CSV, IIF, XLSX)"""
     if "admin" not in session:
         return redirect(url_for("login"))
 
-    from flask import Response
     from datetime import datetime
-    from sqlalchemy import text
-    import csv
-    from io import StringIO
+    from export_engine import XLSX_AVAILABLE, iter_sql, stream_export
 
     export_format = request.args.get("format", "csv")
 
@@ -6965,8 +7164,12 @@ def financial_report_export():
         filename = f"{base_filename}.{export_format}"
 
     # Export based on format
-    if export_format == "csv":
-        # Query view directly for CSV export (exact structure)
+    if export_format in ("csv", "xlsx"):
+        if export_format == "xlsx" and not XLSX_AVAILABLE:
+            flash("Excel export requires the XlsxWriter package. Use CSV for now.", "warning")
+            return redirect(url_for("financial_report"))
+
+        # Query view directly for CSV/XLSX export (exact structure)
         query = """
             SELECT
                 month,
@@ -7003,198 +7206,10 @@ def financial_report_export():
         # Order by date descending
         query += " ORDER BY transaction_date DESC"
 
-        # Execute query
-        result = db.session.execute(text(query), params)
-
-        # Create CSV with exact view column names
-        output = StringIO()
-        writer = csv.writer(output)
-
-        # Write header (exact view column names)
-        writer.writerow([
-            'month',
-            'project',
-            'transaction_type',
-            'transaction_date',
-            'customer',
-            'memo',
-            'passport_number',
-            'amount',
-            'payment_status',
-            'entered_by'
-        ])
-
-        # Write data
-        for row in result:
-            writer.writerow([
-                row.month,
-                row.project,
-                row.transaction_type,
-                row.transaction_date,
-                row.customer or '',
-                row.memo or '',
-                row.passport_number or '',
-                f"{row.amount:.2f}",
-                row.payment_status,
-                row.entered_by or ''
-            ])
-
-        csv_content = output.getvalue()
-        return Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-    elif export_format == "zip":
-        # ZIP export with all documents (exports ALL data, ignores filters)
-        from io import BytesIO
-        from zipfile import ZipFile
-        import os
-
-        # Query ALL transactions (Passport sales + Income + Expense) with receipt info
-        # Matches the monthly_transactions_detail view structure
-        zip_query = """
-            SELECT
-                strftime('%Y-%m', COALESCE(p.paid_date, p.created_dt)) as month,
-                a.name as project,
-                'Income' as transaction_type,
-                COALESCE(p.paid_date, p.created_dt) as transaction_date,
-                u.name as customer,
-                CASE
-                    WHEN p.payment_method IN ('cash', 'pos', 'cheque')
-                    THEN CASE WHEN p.notes IS NOT NULL AND p.notes != '' THEN p.notes || ' | ' ELSE '' END
-                         || CASE p.payment_method
-                                WHEN 'cash' THEN 'Cash'
-                                WHEN 'pos' THEN 'POS/TPV'
-                                WHEN 'cheque' THEN 'Cheque'
-                            END
-                    WHEN p.payment_method = 'interac'
-                    THEN CASE WHEN p.notes IS NOT NULL AND p.notes != '' THEN p.notes || ' | ' ELSE '' END || 'E-Transfer'
-                    ELSE p.notes
-                END as memo,
-                p.pass_code AS passport_number,
-                p.sold_amt as amount,
-                CASE WHEN p.paid = 1 THEN 'Paid' ELSE 'Unpaid (AR)' END as payment_status,
-                'Passport System' as entered_by,
-                NULL as record_id,
-                'passport' as source_type,
-                NULL as receipt_filename
-            FROM passport p
-            JOIN activity a ON p.activity_id = a.id
-            LEFT JOIN user u ON p.user_id = u.id
-
-            UNION ALL
-
-            SELECT
-                strftime('%Y-%m', i.date) as month,
-                a.name as project,
-                'Income' as transaction_type,
-                i.date as transaction_date,
-                u_stripe.name as customer,
-                CASE
-                    WHEN st.id IS NOT NULL
-                    THEN 'Stripe Credit Card' || CASE WHEN p_stripe.pass_code IS NOT NULL THEN ' | ' || p_stripe.pass_code ELSE '' END
-                    ELSE i.note
-                END as memo,
-                p_stripe.pass_code AS passport_number,
-                i.amount,
-                CASE WHEN i.payment_status = 'received' THEN 'Paid' ELSE 'Unpaid (AR)' END as payment_status,
-                COALESCE(i.created_by, 'System') as entered_by,
-                i.id as record_id,
-                'income' as source_type,
-                i.receipt_filename
-            FROM income i
-            JOIN activity a ON i.activity_id = a.id
-            LEFT JOIN stripe_transaction st ON st.income_id = i.id
-            LEFT JOIN signup sg ON sg.id = st.signup_id
-            LEFT JOIN user u_stripe ON u_stripe.id = sg.user_id
-            LEFT JOIN passport p_stripe ON p_stripe.id = st.passport_id
-
-            UNION ALL
-
-            SELECT
-                strftime('%Y-%m', e.date) as month,
-                a.name as project,
-                'Expense' as transaction_type,
-                e.date as transaction_date,
-                u_stripe.name as customer,
-                CASE
-                    WHEN st.id IS NOT NULL
-                    THEN 'Stripe processing fee' || CASE WHEN p_stripe.pass_code IS NOT NULL THEN ' | ' || p_stripe.pass_code ELSE '' END
-                    ELSE e.description
-                END as memo,
-                p_stripe.pass_code AS passport_number,
-                e.amount,
-                CASE WHEN e.payment_status = 'paid' THEN 'Paid' ELSE 'Unpaid (AP)' END as payment_status,
-                COALESCE(e.created_by, 'System') as entered_by,
-                e.id as record_id,
-                'expense' as source_type,
-                e.receipt_filename
-            FROM expense e
-            JOIN activity a ON e.activity_id = a.id
-            LEFT JOIN stripe_transaction st ON st.id = e.stripe_transaction_id
-            LEFT JOIN signup sg ON sg.id = st.signup_id
-            LEFT JOIN user u_stripe ON u_stripe.id = sg.user_id
-            LEFT JOIN passport p_stripe ON p_stripe.id = st.passport_id
-
-            ORDER BY transaction_date DESC
-        """
-
-        # Execute query (no filters - exports everything)
-        zip_result = db.session.execute(text(zip_query))
-
-        # Create in-memory ZIP
-        zip_buffer = BytesIO()
-        with ZipFile(zip_buffer, 'w') as zipf:
-            # Generate CSV with document_filename column
-            csv_output = StringIO()
-            writer = csv.writer(csv_output)
-
-            # Write header with document_filename column
-            writer.writerow([
-                'month',
-                'project',
-                'transaction_type',
-                'transaction_date',
-                'customer',
-                'memo',
-                'passport_number',
-                'amount',
-                'payment_status',
-                'entered_by',
-                'document_filename'
-            ])
-
-            documents_added = set()
-            receipts_dir = os.path.join(app.static_folder, 'uploads', 'receipts')
-
-            for row in zip_result:
-                doc_filename = ''
-
-                if row.receipt_filename:
-                    # Generate smart filename
-                    doc_filename = generate_smart_filename(
-                        source_type=row.source_type,
-                        record_id=row.record_id,
-                        date=row.transaction_date,
-                        amount=row.amount,
-                        original_filename=row.receipt_filename
-                    )
-
-                    # Add document to ZIP if not already added and file exists
-                    if doc_filename not in documents_added:
-                        receipt_path = os.path.join(receipts_dir, row.receipt_filename)
-                        # Security: verify path is within receipts directory
-                        receipt_path = os.path.abspath(receipt_path)
-                        if receipt_path.startswith(os.path.abspath(receipts_dir)) and os.path.exists(receipt_path):
-                            zipf.write(receipt_path, f'documents/{doc_filename}')
-                            documents_added.add(doc_filename)
-                        else:
-                            # File missing - skip silently, leave doc_filename empty
-                            doc_filename = ''
-
-                # Write CSV row
-                writer.writerow([
+        def transaction_rows():
+            # Rows are fetched in batches while the download streams
+            for row in iter_sql(query, params):
+                yield [
                     row.month,
                     row.project,
                     row.transaction_type,
@@ -7202,34 +7217,94 @@ def financial_report_export():
                     row.customer or '',
                     row.memo or '',
                     row.passport_number or '',
-                    f"{row.amount:.2f}",
+                    f"{row.amount:.2f}" if export_format == "csv" else round(row.amount or 0, 2),
                     row.payment_status,
-                    row.entered_by or '',
-                    doc_filename
-                ])
-
-            # Add CSV to ZIP
-            zipf.writestr('financial_report.csv', csv_output.getvalue())
+                    row.entered_by or ''
+                ]
 
-        zip_buffer.seek(0)
-        return Response(
-            zip_buffer.getvalue(),
-            mimetype='application/zip',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        # Exact view column names
+        return stream_export(
+            export_format,
+            base_filename,
+            ['month', 'project', 'transaction_type', 'transaction_date', 'customer',
+             'memo', 'passport_number', 'amount', 'payment_status', 'entered_by'],
+            transaction_rows(),
+            sheet_name="Transactions",
         )
+    elif export_format == "zip":
+        # ZIP export with all documents is built by a background job (can take minutes)
+        from export_jobs import enqueue_export_job
+
+        job = enqueue_export_job(app, "financial_zip", filename, created_by=session.get("admin"))
+        return redirect(url_for("export_job_status", job_id=job.id))
     elif export_format == "iif":
         # TODO: Implement QuickBooks IIF export in Phase 2
         flash("QuickBooks IIF export coming soon! Use CSV for now.", "info")
         return redirect(url_for("financial_report"))
-    elif export_format == "xlsx":
-        # TODO: Implement Excel export in Phase 2
-        flash("Excel export coming soon! Use CSV for now.", "info")
-        return redirect(url_for("financial_report"))
     else:
         flash("Invalid export format", "error")
         return redirect(url_for("financial_report"))
 
 
+@app.route("/exports/<job_id>")
+def export_job_status(job_id):
+    """Progress page for a background export; polls export_job_status_json until ready"""
+    if "admin" not in session:
+        return redirect(url_for("login"))
+
+    from models import ExportJob
+
+    job = db.session.get(ExportJob, job_id)
+    if not job:
+        flash("This export has expired or does not exist.", "warning")
+        return redirect(url_for("financial_report"))
+
+    return render_template("export_job.html", job=job)
+
+
+@app.route("/exports/<job_id>/status")
+def export_job_status_json(job_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+
+    from models import ExportJob
+    from export_jobs import export_job_to_dict
+
+    job = db.session.get(ExportJob, job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Export not found'}), 404
+
+    return jsonify({'success': True, 'job': export_job_to_dict(job)})
+
+
+@app.route("/exports/<job_id>/download")
+def export_job_download(job_id):
+    if "admin" not in session:
+        return redirect(url_for("login"))
+
+    from models import ExportJob
+    from export_jobs import EXPORT_JOB_DIR, EXPORT_JOB_TYPES, artifact_path
+
+    job = db.session.get(ExportJob, job_id)
+    if not job or job.status != "ready" or not os.path.exists(artifact_path(job.id)):
+        flash("This export is not available for download.", "warning")
+        return redirect(url_for("export_job_status", job_id=job_id) if job else url_for("financial_report"))
+
+    db.session.add(AdminActionLog(
+        admin_email=session.get("admin", "unknown"),
+        action=f"Downloaded export {job.filename}"
+    ))
+    db.session.commit()
+
+    return send_from_directory(
+        os.path.abspath(EXPORT_JOB_DIR),
+        os.path.basename(artifact_path(job.id)),
+        as_attachment=True,
+        download_name=job.filename,
+        mimetype=EXPORT_JOB_TYPES[job.job_type]["mimetype"],
+    )
+
+
 @app.route("/reports/user-contacts")
 def user_contacts_report():
     """Display user contact list with engagement metrics"""
@@ -7288,9 +7363,9 @@ def user_contacts_export():
     if "admin" not in session:
         return redirect(url_for("login"))
 
-    from utils import export_user_contacts_raw_csv
+    from utils import USER_CONTACTS_RAW_HEADER, iter_user_contacts_raw_rows
     from datetime import datetime, timezone
-    from flask import Response
+    from export_engine import stream_export
 
     # Get search filter (if any)
     q = request.args.get("q", "").strip()
@@ -7298,15 +7373,15 @@ def user_contacts_export():
     # Generate filename
     now = datetime.now(timezone.utc)
     search_part = f"_search_{q[:20]}" if q else ""
-    filename = f"user_contacts_raw{search_part}_{now.strftime('%Y-%m-%d')}.csv"
-
-    # Export raw passport data to CSV
-    csv_content = export_user_contacts_raw_csv(search_query=q)
-
-    return Response(
-        csv_content,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    filename_base = f"user_contacts_raw{search_part}_{now.strftime('%Y-%m-%d')}"
+
+    # Stream raw passport data to CSV (UTF-8 BOM for Excel compatibility)
+    return stream_export(
+        "csv",
+        filename_base,
+        USER_CONTACTS_RAW_HEADER,
+        iter_user_contacts_raw_rows(search_query=q),
+        bom=True,
     )
 
 
@@ -7360,12 +7435,8 @@ def payment_bot_matches():
 
     # Apply search filter (name and amount only, not email)
     if q:
-        query = query.filter(
-            db.or_(
-                EbankPayment.bank_info_name.ilike(f"%{q}%"),
-                db.cast(EbankPayment.bank_info_amt, db.String).ilike(f"%{q}%")
-            )
-        )
+        from utils import apply_payment_search
+        query = apply_payment_search(query, q)
 
     # Paginate results
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -7562,11 +7633,9 @@ def passports_bulk_action():
 def export_passports():
     if "admin" not in session:
         return redirect(url_for("login"))
-    
-    import csv
-    import io
-    from flask import make_response
-    
+
+    from export_engine import iter_query, stream_export
+
     # Get all filters from current session
     q = request.args.get("q", "").strip()
     activity_id = request.args.get("activity", "")
@@ -7583,13 +7652,8 @@ def export_passports():
     
     # Apply the same filters
     if q:
-        query = query.join(User).filter(
-            db.or_(
-                User.name.ilike(f"%{q}%"),
-                User.email.ilike(f"%{q}%"),
-                Passport.pass_code.ilike(f"%{q}%")
-            )
-        )
+        from utils import apply_passport_search
+        query = apply_passport_search(query, q)
     
     if activity_id:
         query = query.filter(Passport.activity_id == activity_id)
@@ -7613,48 +7677,39 @@ def export_passports():
         except ValueError:
             pass
     
-    passports = query.all()
-    
-    # Create CSV data
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header row
-    writer.writerow([
-        'Passport Code', 'User Name', 'User Email', 'Activity', 'Passport Type',
-        'Amount', 'Payment Status', 'Uses Remaining', 'Created Date', 'Paid Date', 'Notes'
-    ])
-    
-    # Data rows
-    for passport in passports:
-        writer.writerow([
-            passport.pass_code,
-            passport.user.name if passport.user else '-',
-            passport.user.email if passport.user else '-',
-            passport.activity.name if passport.activity else '-',
-            passport.passport_type.name if passport.passport_type else '-',
-            passport.sold_amt,
-            'Paid' if passport.paid else 'Unpaid',
-            passport.uses_remaining,
-            passport.created_dt.strftime('%Y-%m-%d %H:%M') if passport.created_dt else '-',
-            passport.paid_date.strftime('%Y-%m-%d %H:%M') if passport.paid_date else '-',
-            passport.notes or ''
-        ])
-    
-    # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=passports_export_{datetime.now().strftime("%Y%m%d_%H%M")}.csv'
-    
-    # Log admin action
-    db.session.add(AdminActionLog(
-        admin_email=session.get("admin", "unknown"),
-        action=f"Exported {len(passports)} passports to CSV by {session.get('admin', 'unknown')}"
-    ))
-    db.session.commit()
-    
-    return response
+    admin_email = session.get("admin", "unknown")
+
+    def passport_rows():
+        for passport in iter_query(query, Passport.id, Passport.created_dt):
+            yield [
+                passport.pass_code,
+                passport.user.name if passport.user else '-',
+                passport.user.email if passport.user else '-',
+                passport.activity.name if passport.activity else '-',
+                passport.passport_type.name if passport.passport_type else '-',
+                passport.sold_amt,
+                'Paid' if passport.paid else 'Unpaid',
+                passport.uses_remaining,
+                passport.created_dt.strftime('%Y-%m-%d %H:%M') if passport.created_dt else '-',
+                passport.paid_date.strftime('%Y-%m-%d %H:%M') if passport.paid_date else '-',
+                passport.notes or ''
+            ]
+
+    def log_export(row_count):
+        db.session.add(AdminActionLog(
+            admin_email=admin_email,
+            action=f"Exported {row_count} passports to CSV by {admin_email}"
+        ))
+        db.session.commit()
+
+    return stream_export(
+        "csv",
+        f"passports_export_{datetime.now().strftime('%Y%m%d_%H%M')}",
+        ['Passport Code', 'User Name', 'User Email', 'Activity', 'Passport Type',
+         'Amount', 'Payment Status', 'Uses Remaining', 'Created Date', 'Paid Date', 'Notes'],
+        passport_rows(),
+        on_complete=log_export,
+    )
 
 
 @app.route("/admin/activity-income/<int:activity_id>", methods=["GET", "POST"])
@@ -7722,7 +7777,10 @@ def activity_income(activity_id, income_id=None):
                 os.makedirs(receipts_dir, exist_ok=True)
                 receipt_file.save(os.path.join(receipts_dir, filename))
             else:
-                filename = _save_optimized_image(receipt_file.stream, receipts_dir, prefix="income", max_size=(1200, 1600))
+                filename = _save_optimized_image(
+                    receipt_file.stream, receipts_dir, prefix="income", max_size=(1200, 1600),
+                    on_ready=swap_reference(Income, "receipt_filename")
+                )
             income.receipt_filename = filename
 
         # Log the income operation
@@ -7852,7 +7910,10 @@ def activity_expenses(activity_id, expense_id=None):
                 os.makedirs(receipts_dir, exist_ok=True)
                 receipt_file.save(os.path.join(receipts_dir, filename))
             else:
-                filename = _save_optimized_image(receipt_file.stream, receipts_dir, prefix="expense", max_size=(1200, 1600))
+                filename = _save_optimized_image(
+                    receipt_file.stream, receipts_dir, prefix="expense", max_size=(1200, 1600),
+                    on_ready=swap_reference(Expense, "receipt_filename")
+                )
             expense.receipt_filename = filename
 
         # Log the expense operation
@@ -8077,7 +8138,8 @@ def activity_form(activity_id=None):
             activity.image_filename = filename
 
         elif request.form.get("selected_image_filename"):
-            activity.image_filename = request.form.get("selected_image_filename")
+            activity.image_filename = ready_image(os.path.join(app.static_folder, "uploads/activity_images"),
+                                                  request.form.get("selected_image_filename"))
 
         db.session.commit()
         flash("Activity saved.", "success")
@@ -8270,9 +8332,11 @@ def activity_dashboard(activity_id):
     show_all_param = request.args.get('show_all', '').lower()
     q = request.args.get('q', '').strip()  # Add search parameter support
 
-    # Get pagination parameters
+    # Get pagination parameters (page numbers are for display; cursors drive the keyset queries)
     passport_page = request.args.get('passport_page', 1, type=int)
     signup_page = request.args.get('signup_page', 1, type=int)
+    passport_cursor = request.args.get('passport_cursor')
+    signup_cursor = request.args.get('signup_cursor')
     per_page = 10
 
     # Default to 'active' filter if no passport filter specified (unless explicitly showing all)
@@ -8299,9 +8363,9 @@ def activity_dashboard(activity_id):
     # IMPORTANT: On activity_dashboard, search only applies to passports, NOT signups
     # Signups are displayed unfiltered by search query for clarity
 
-    signup_pagination = signups_query.order_by(Signup.signed_up_at.desc()).paginate(
-        page=signup_page, per_page=per_page, error_out=False
-    )
+    from utils import keyset_paginate
+    signup_pagination = keyset_paginate(signups_query, Signup.id, Signup.signed_up_at,
+                                        per_page=per_page, cursor=signup_cursor, page=signup_page)
     signups = signup_pagination.items
 
     # Load passports with filtering
@@ -8328,19 +8392,11 @@ def activity_dashboard(activity_id):
     
     # Apply search filter for passports
     if q:
-        from models import User
-        passports_query = passports_query.join(User).filter(
-            or_(
-                User.name.ilike(f"%{q}%"),
-                User.email.ilike(f"%{q}%"),
-                Passport.pass_code.ilike(f"%{q}%"),
-                Passport.notes.ilike(f"%{q}%")
-            )
-        )
+        from utils import apply_passport_search
+        passports_query = apply_passport_search(passports_query, q)
 
-    passport_pagination = passports_query.order_by(Passport.created_dt.desc()).paginate(
-        page=passport_page, per_page=per_page, error_out=False
-    )
+    passport_pagination = keyset_paginate(passports_query, Passport.id, Passport.created_dt,
+                                          per_page=per_page, cursor=passport_cursor, page=passport_page)
     passports = passport_pagination.items
 
     # Use the enhanced get_kpi_data function with activity filtering
@@ -8378,16 +8434,23 @@ def activity_dashboard(activity_id):
     now = datetime.now(timezone.utc)
     three_days_ago = now - timedelta(days=3)
     
-    # Get all passports and signups for this activity for additional calculations and counts
-    all_passports = Passport.query.filter_by(activity_id=activity_id).all()
-    all_signups = Signup.query.filter_by(activity_id=activity_id).all()
-
-    # Calculate statistics using ALL passports (not filtered results) - for filter button counts
-    total_passports_count = len(all_passports)
-    paid_passports_count = len([p for p in all_passports if p.paid])
-    unpaid_passports_count = len([p for p in all_passports if not p.paid])
-    # Active = has remaining uses OR unpaid
-    active_passports_count = len([p for p in all_passports if p.uses_remaining > 0 or not p.paid])
+    # Passport and signup counts for this activity, aggregated in SQL (not filtered results)
+    (total_passports_count, paid_passports_count, unpaid_passports_count,
+     active_passports_count, open_passports_count, overdue_count, total_users_count) = db.session.query(
+        func.count(Passport.id),
+        func.count(case((Passport.paid == True, 1))),
+        func.count(case((Passport.paid == False, 1))),
+        # Active = has remaining uses OR unpaid
+        func.count(case((or_(Passport.uses_remaining > 0, Passport.paid == False), 1))),
+        func.count(case((Passport.uses_remaining > 0, 1))),
+        func.count(case(((Passport.paid == False) & (Passport.created_dt < three_days_ago), 1))),
+        func.count(func.distinct(Passport.user_id)),
+    ).filter(Passport.activity_id == activity_id).one()
+
+    total_signups_count, activity_approved_signups_count = db.session.query(
+        func.count(Signup.id),
+        func.count(case((Signup.status == 'approved', 1))),
+    ).filter(Signup.activity_id == activity_id).one()
 
     # Calculate total redemptions (sessions consumed) for this activity
     total_redemptions_count = db.session.query(Redemption).join(Passport).filter(
@@ -8403,19 +8466,8 @@ def activity_dashboard(activity_id):
         'total_redemptions': total_redemptions_count,
     }
     
-    # Helper function to safely compare dates
-    def is_recent(dt, cutoff_date):
-        if not dt:
-            return False
-        # Make timezone-naive datetime timezone-aware if needed
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt >= cutoff_date
-    
     # Unpaid passport statistics
-    unpaid_passports = [p for p in all_passports if not p.paid]
-    unpaid_count = len(unpaid_passports)
-    overdue_count = len([p for p in unpaid_passports if p.created_dt and not is_recent(p.created_dt, three_days_ago)])
+    unpaid_count = unpaid_passports_count
     
     # Activity profit calculation (combining revenue with expenses/income)
     try:
@@ -8434,8 +8486,6 @@ def activity_dashboard(activity_id):
 
     has_pending_signups = len(pending_signups) > 0
     activity_pending_signups_count = len(pending_signups)
-    activity_approved_signups_count = len([s for s in all_signups if s.status == 'approved'])
-    open_passports_count = len([p for p in all_passports if p.uses_remaining > 0])
 
     # Revenue progress percentage for the progress bar (capped at 100)
     _target = float(activity.goal_revenue or 0)
@@ -8464,14 +8514,14 @@ def activity_dashboard(activity_id):
     
     # Dashboard statistics
     dashboard_stats = {
-        'total_passports': len(all_passports),
-        'paid_passports': len([p for p in all_passports if p.paid]),
+        'total_passports': total_passports_count,
+        'paid_passports': paid_passports_count,
         'unpaid_passports': unpaid_count,
         'active_passports': current_kpi.get('active_users', 0),
         'pending_signups': len(pending_signups),
         'approved_signups': len(approved_signups),
         'recent_signups': current_kpi.get('pending_signups', 0),
-        'total_users': len(set(p.user_id for p in all_passports))
+        'total_users': total_users_count
     }
 
     # Load surveys for this activity (handle case where tables might not exist yet)
@@ -8522,8 +8572,7 @@ def activity_dashboard(activity_id):
         activity=activity,
         signups=signups,
         passes=passports,
-        all_signups=all_signups,  # For filter counts
-        all_passports=all_passports,  # For filter counts
+        total_signups_count=total_signups_count,  # For filter counts
         surveys=surveys,
         survey_templates=survey_templates,
         passport_types=passport_types,
@@ -9197,13 +9246,8 @@ def get_activity_dashboard_data(activity_id):
         
         # Apply search filter if provided
         if q:
-            passports_query = passports_query.join(User).filter(
-                or_(
-                    User.name.ilike(f"%{q}%"),
-                    User.email.ilike(f"%{q}%"),
-                    Passport.pass_code.ilike(f"%{q}%")
-                )
-            )
+            from utils import apply_passport_search
+            passports_query = apply_passport_search(passports_query, q)
         
         passports = passports_query.order_by(Passport.created_dt.desc()).all()
         
@@ -11096,17 +11140,27 @@ def survey_results(survey_id):
 
     survey = Survey.query.get_or_404(survey_id)
 
-    # Add pagination for responses
+    # Add pagination for responses (keyset on id, oldest first as before)
+    from utils import keyset_paginate
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 10
 
-    response_pagination = SurveyResponse.query.filter_by(survey_id=survey_id).paginate(
-        page=page, per_page=per_page, error_out=False
+    response_pagination = keyset_paginate(
+        SurveyResponse.query.filter_by(survey_id=survey_id), SurveyResponse.id,
+        per_page=per_page, cursor=cursor, page=page, descending=False
     )
     responses = response_pagination.items
 
-    # For analysis, we still need all responses
-    all_responses = SurveyResponse.query.filter_by(survey_id=survey_id).all()
+    # For analysis we still need every answer, but only the JSON column - not full rows
+    all_answer_blobs = [
+        row.responses for row in
+        db.session.query(SurveyResponse.responses).filter(SurveyResponse.survey_id == survey_id)
+    ]
+    total_responses_count, completed_count = db.session.query(
+        func.count(SurveyResponse.id),
+        func.count(case((SurveyResponse.completed == True, 1))),
+    ).filter(SurveyResponse.survey_id == survey_id).one()
     
     # Parse questions for analysis
     try:
@@ -11115,7 +11169,7 @@ def survey_results(survey_id):
     except:
         questions = []
     
-    # Analyze responses (use all_responses for complete analysis)
+    # Analyze responses (every answer blob for complete analysis)
     analysis = {}
     for question in questions:
         question_id = str(question['id'])
@@ -11125,10 +11179,10 @@ def survey_results(survey_id):
             'summary': {}
         }
 
-        for response in all_responses:
-            if response.responses:
+        for answer_blob in all_answer_blobs:
+            if answer_blob:
                 try:
-                    response_data = json.loads(response.responses)
+                    response_data = json.loads(answer_blob)
                     if question_id in response_data:
                         analysis[question_id]['responses'].append(response_data[question_id])
                 except (json.JSONDecodeError, TypeError):
@@ -11160,14 +11214,13 @@ def survey_results(survey_id):
         else:
             analysis[question_id]['summary'] = {'count': total}
     
-    completed_count = sum(1 for r in all_responses if r.completed)
-    in_progress_count = len(all_responses) - completed_count
-    completion_rate = round((completed_count / len(all_responses) * 100) if all_responses else 0, 1)
+    in_progress_count = total_responses_count - completed_count
+    completion_rate = round((completed_count / total_responses_count * 100) if total_responses_count else 0, 1)
 
     return render_template("survey_results.html",
                          survey=survey,
                          responses=responses,
-                         all_responses=all_responses,
+                         total_responses_count=total_responses_count,
                          analysis=analysis,
                          pagination=response_pagination,
                          completed_count=completed_count,
@@ -11548,18 +11601,21 @@ def export_survey_results(survey_id):
     if "admin" not in session:
         return redirect(url_for("login"))
     
+    from export_engine import iter_query, stream_export
+
     try:
-        # Get survey and its responses
+        # Get survey and its completed responses (rows are streamed below, not loaded)
         survey = Survey.query.get_or_404(survey_id)
-        responses = SurveyResponse.query.filter_by(survey_id=survey_id, completed=True).all()
+        responses_query = SurveyResponse.query.options(
+            db.joinedload(SurveyResponse.user)
+        ).filter_by(survey_id=survey_id, completed=True).order_by(SurveyResponse.id)
         
-        if not responses:
+        if not db.session.query(responses_query.exists()).scalar():
             flash("No completed responses found for this survey", "info")
             return redirect(url_for("survey_results", survey_id=survey_id))
         
         # Get survey questions from template
         import json
-        import csv
         template_data = json.loads(survey.template.questions)
         
         # Handle both old and new template formats
@@ -11568,11 +11624,7 @@ def export_survey_results(survey_id):
         else:
             template_questions = template_data.get('questions', [])  # New format: wrapped in object
         
-        # Create CSV content
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
+        # Headers
         headers = [
             'Response ID', 'User Name', 'User Email', 'Passport ID',
             'Started Date', 'Completed Date', 'IP Address'
@@ -11582,58 +11634,47 @@ def export_survey_results(survey_id):
         for question in template_questions:
             headers.append(f"Q{question['id']}: {question['question']}")
         
-        writer.writerow(headers)
-        
-        # Write response data
-        for response in responses:
-            response_data = json.loads(response.responses) if response.responses else {}
-            
-            row = [
-                response.id,
-                response.user.name if response.user else 'N/A',
-                response.user.email if response.user else 'N/A',
-                response.passport_id or 'N/A',
-                response.started_dt.strftime('%Y-%m-%d %H:%M:%S') if response.started_dt else 'N/A',
-                response.completed_dt.strftime('%Y-%m-%d %H:%M:%S') if response.completed_dt else 'N/A',
-                response.ip_address or 'N/A'
-            ]
-            
-            # Add answer data for each question
-            for question in template_questions:
-                question_id = str(question['id'])
-                answer = response_data.get(question_id, 'No response')
+        def response_rows():
+            for response in iter_query(responses_query, SurveyResponse.id, descending=False):
+                response_data = json.loads(response.responses) if response.responses else {}
                 
-                # Format answer based on question type
-                if question['type'] == 'rating':
-                    if isinstance(answer, (int, float)):
-                        row.append(f"{answer}/{question.get('max_rating', 5)}")
-                    else:
-                        row.append(answer)
-                elif question['type'] == 'multiple_choice':
-                    if isinstance(answer, list):
-                        row.append('; '.join(answer))
+                row = [
+                    response.id,
+                    response.user.name if response.user else 'N/A',
+                    response.user.email if response.user else 'N/A',
+                    response.passport_id or 'N/A',
+                    response.started_dt.strftime('%Y-%m-%d %H:%M:%S') if response.started_dt else 'N/A',
+                    response.completed_dt.strftime('%Y-%m-%d %H:%M:%S') if response.completed_dt else 'N/A',
+                    response.ip_address or 'N/A'
+                ]
+                
+                # Add answer data for each question
+                for question in template_questions:
+                    question_id = str(question['id'])
+                    answer = response_data.get(question_id, 'No response')
+                    
+                    # Format answer based on question type
+                    if question['type'] == 'rating':
+                        if isinstance(answer, (int, float)):
+                            row.append(f"{answer}/{question.get('max_rating', 5)}")
+                        else:
+                            row.append(answer)
+                    elif question['type'] == 'multiple_choice':
+                        if isinstance(answer, list):
+                            row.append('; '.join(answer))
+                        else:
+                            row.append(answer)
                     else:
-                        row.append(answer)
-                else:
-                    row.append(str(answer) if answer else 'No response')
-            
-            writer.writerow(row)
-        
-        # Create response
-        csv_content = output.getvalue()
-        output.close()
+                        row.append(str(answer) if answer else 'No response')
+                
+                yield row
         
         # Generate filename
         safe_survey_name = re.sub(r'[^\w\s-]', '', survey.name).strip()
         safe_survey_name = re.sub(r'[-\s]+', '-', safe_survey_name)
-        filename = f"survey-{survey_id}-{safe_survey_name}-{datetime.now().strftime('%Y%m%d')}.csv"
+        filename_base = f"survey-{survey_id}-{safe_survey_name}-{datetime.now().strftime('%Y%m%d')}"
         
-        # Return CSV file
-        return Response(
-            csv_content,
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
-        )
+        return stream_export("csv", filename_base, headers, response_rows())
         
     except Exception as e:
         print(f"Export error: {str(e)}")
@@ -13166,7 +13207,8 @@ def upload_activity_logo(activity_id):
 
         # Save and compress logo (compression handles size reduction automatically)
         unique_filename = _save_optimized_image(
-            logo_file.stream, logos_dir, prefix=f"activity_{activity_id}_logo", max_size=(400, 400)
+            logo_file.stream, logos_dir, prefix=f"activity_{activity_id}_logo", max_size=(400, 400),
+            on_ready=swap_reference(Activity, "logo_filename")
         )
 
         # Update activity with new logo filename
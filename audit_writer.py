@@ -0,0 +1,192 @@
+"""
+API Audit Writer - Batched, asynchronous audit trail for decorated API calls
+Events are queued in memory by decorators.log_api_call and written by a
+background flusher thread, so polling endpoints never take a write lock on
+the request path. Each batch also updates the hourly rollup table
+(api_audit_hourly), which survives pruning of the raw rows.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Tuning knobs
+FLUSH_INTERVAL_SECONDS = 5      # Max delay before a queued event hits the DB
+MAX_BATCH_SIZE = 500            # Rows per INSERT batch
+MAX_QUEUE_SIZE = 10000          # Events beyond this are dropped (audit never blocks a request)
+RAW_RETENTION_DAYS = 30         # Raw api_audit_log rows kept this long
+ROLLUP_RETENTION_DAYS = 400     # Hourly rollups kept this long
+
+_queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+_writer_lock = threading.Lock()
+_writer_thread = None
+_writer_pid = None
+_writer_app = None
+_dropped_events = 0
+
+
+def record_api_call(app, admin_email, method, endpoint, status_code=None, duration_ms=None):
+    """Queue one API audit event. Never touches the database."""
+    global _dropped_events
+
+    _ensure_writer(app)
+    try:
+        _queue.put_nowait({
+            "timestamp": datetime.now(timezone.utc),
+            "admin_email": admin_email,
+            "method": method,
+            "endpoint": endpoint,
+            "status_code": status_code,
+            "duration_ms": duration_ms,
+        })
+    except queue.Full:
+        _dropped_events += 1
+        if _dropped_events % 1000 == 1:
+            logger.warning(f"API audit queue full, dropped {_dropped_events} events so far")
+
+
+def _ensure_writer(app):
+    """Start the flusher thread once per process (Gunicorn forks after import)."""
+    global _writer_thread, _writer_pid, _writer_app
+
+    pid = os.getpid()
+    if _writer_thread is not None and _writer_pid == pid and _writer_thread.is_alive():
+        return
+
+    with _writer_lock:
+        if _writer_thread is not None and _writer_pid == pid and _writer_thread.is_alive():
+            return
+        _writer_app = app
+        _writer_pid = pid
+        _writer_thread = threading.Thread(
+            target=_writer_loop, args=(app,), name="api-audit-writer", daemon=True
+        )
+        _writer_thread.start()
+
+
+def _drain(first_timeout):
+    """Collect up to MAX_BATCH_SIZE queued events, waiting at most first_timeout for the first one."""
+    batch = []
+    try:
+        batch.append(_queue.get(timeout=first_timeout))
+    except queue.Empty:
+        return batch
+    while len(batch) < MAX_BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _writer_loop(app):
+    while True:
+        batch = _drain(FLUSH_INTERVAL_SECONDS)
+        if not batch:
+            continue
+        try:
+            _write_batch(app, batch)
+        except Exception as e:
+            logger.error(f"API audit batch write failed ({len(batch)} events lost): {e}")
+
+
+def _write_batch(app, batch):
+    """Insert raw events and upsert the per-hour rollup in one short transaction."""
+    from models import db, ApiAuditLog, ApiAuditHourly
+    from sqlalchemy import insert
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    buckets = Counter(
+        (e["timestamp"].replace(minute=0, second=0, microsecond=0), e["endpoint"] or "-", e["method"] or "-")
+        for e in batch
+    )
+
+    with app.app_context():
+        try:
+            db.session.execute(insert(ApiAuditLog), batch)
+
+            for (hour, endpoint, method), count in buckets.items():
+                stmt = sqlite_insert(ApiAuditHourly).values(
+                    hour=hour, endpoint=endpoint, method=method, call_count=count
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["hour", "endpoint", "method"],
+                    set_={"call_count": ApiAuditHourly.call_count + stmt.excluded.call_count},
+                )
+                db.session.execute(stmt)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+def flush_api_audit_queue(app=None):
+    """Synchronously write everything currently queued (used at shutdown)."""
+    app = app or _writer_app
+    if app is None:
+        return 0
+
+    written = 0
+    while True:
+        batch = _drain(0)
+        if not batch:
+            return written
+        try:
+            _write_batch(app, batch)
+            written += len(batch)
+        except Exception as e:
+            logger.error(f"API audit flush failed: {e}")
+            return written
+
+
+def prune_api_audit_log(app, raw_retention_days=RAW_RETENTION_DAYS, rollup_retention_days=ROLLUP_RETENTION_DAYS):
+    """
+    Apply retention to the audit tables. Raw rows are already counted in
+    api_audit_hourly at write time, so deleting them loses no totals.
+    Returns (raw_deleted, rollup_deleted).
+    """
+    from models import db, ApiAuditLog, ApiAuditHourly
+
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        raw_deleted = ApiAuditLog.query.filter(
+            ApiAuditLog.timestamp < now - timedelta(days=raw_retention_days)
+        ).delete(synchronize_session=False)
+        rollup_deleted = ApiAuditHourly.query.filter(
+            ApiAuditHourly.hour < now - timedelta(days=rollup_retention_days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    return raw_deleted, rollup_deleted
+
+
+def get_api_call_rollup(since=None, endpoint=None):
+    """Return hourly call counts (newest first) as dicts. Must run in an app context."""
+    from models import ApiAuditHourly
+
+    query = ApiAuditHourly.query
+    if since is not None:
+        query = query.filter(ApiAuditHourly.hour >= since)
+    if endpoint:
+        query = query.filter(ApiAuditHourly.endpoint == endpoint)
+
+    return [
+        {
+            "hour": row.hour,
+            "endpoint": row.endpoint,
+            "method": row.method,
+            "call_count": row.call_count,
+        }
+        for row in query.order_by(ApiAuditHourly.hour.desc()).all()
+    ]
+
+
+atexit.register(flush_api_audit_queue)
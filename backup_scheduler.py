@@ -0,0 +1,215 @@
+"""
+Scheduled Backups - Hourly snapshots with grandfather-father-son retention
+Backups used to happen only when an admin clicked through /generate-backup or
+the backup API, inside a web worker. The scheduler now takes a snapshot every
+hour in a separate process started at the lowest CPU priority (nice 19) and,
+where ionice is available, the idle I/O class, with reads rate-limited on top.
+
+Snapshots of type "scheduled" are thinned to the newest one per hour, day,
+ISO week and month, keeping BACKUP_KEEP_HOURLY/DAILY/WEEKLY/MONTHLY buckets
+(defaults below); unreferenced blobs are then garbage-collected. The last
+run's metrics are stored in the SCHEDULED_BACKUP_LAST_RUN setting (JSON) and
+shown in unified settings. Disable with ENABLE_SCHEDULED_BACKUPS=False.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_BACKUP_TYPE = "scheduled"
+LAST_RUN_SETTING = "SCHEDULED_BACKUP_LAST_RUN"
+RETENTION_TIERS = {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 12}
+BACKUP_IO_LIMIT_MB_S = 20       # Read rate of the backup process (BACKUP_IO_LIMIT_MB_S setting)
+BACKUP_TIMEOUT_SECONDS = 3300   # Killed before the next hourly run would start
+
+
+def get_retention_tiers():
+    """Buckets kept per tier, overridable with BACKUP_KEEP_<TIER> settings."""
+    from utils import get_setting
+
+    tiers = {}
+    for tier, default in RETENTION_TIERS.items():
+        try:
+            tiers[tier] = max(int(get_setting(f"BACKUP_KEEP_{tier.upper()}", str(default))), 0)
+        except (TypeError, ValueError):
+            tiers[tier] = default
+    return tiers
+
+
+def _bucket(tier, created_at):
+    created = datetime.fromisoformat(created_at)
+    if tier == "hourly":
+        return created.strftime("%Y-%m-%d %H")
+    if tier == "daily":
+        return created.strftime("%Y-%m-%d")
+    if tier == "weekly":
+        return created.isocalendar()[:2]
+    return created.strftime("%Y-%m")
+
+
+def select_retained(snapshots, tiers):
+    """Ids to keep: the newest snapshot in each of the latest N hourly/daily/weekly/monthly buckets"""
+    keep = set()
+    for tier, count in tiers.items():
+        seen = set()
+        for manifest in snapshots:  # Newest first
+            if len(seen) >= count:
+                break
+            key = _bucket(tier, manifest["created_at"])
+            if key not in seen:
+                seen.add(key)
+                keep.add(manifest["id"])
+    return keep
+
+
+def apply_retention(tiers):
+    """Delete scheduled snapshots outside every tier, then free their blobs; returns (kept, pruned, freed bytes)"""
+    from backup_store import list_snapshots, delete_snapshot, collect_garbage
+
+    snapshots = list_snapshots(SCHEDULED_BACKUP_TYPE)
+    keep = select_retained(snapshots, tiers)
+    pruned = [m["id"] for m in snapshots if m["id"] not in keep and delete_snapshot(m["id"])]
+    freed = collect_garbage()[1] if pruned else 0
+    return len(keep), len(pruned), freed
+
+
+def take_scheduled_backup(db_path, upload_dir, template_dir, tiers, max_bytes_per_second=None):
+    """Snapshot + retention (runs in the low-priority child process); returns the run metrics"""
+    from backup_store import create_snapshot, backup_sources, store_usage
+
+    snapshot_id = f"{SCHEDULED_BACKUP_TYPE}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+    manifest = create_snapshot(
+        snapshot_id,
+        backup_type=SCHEDULED_BACKUP_TYPE,
+        created_by="scheduler",
+        db_path=db_path,
+        sources=backup_sources(upload_dir=upload_dir, template_dir=template_dir),
+        max_bytes_per_second=max_bytes_per_second
+    )
+    kept, pruned, freed = apply_retention(tiers)
+
+    stats = manifest["stats"]
+    return {
+        "snapshot": snapshot_id,
+        "files": stats["files"],
+        "total_bytes": stats["total_bytes"],
+        "new_bytes": stats["new_bytes"],
+        "dedup_ratio": round(1 - stats["new_bytes"] / stats["total_bytes"], 4) if stats["total_bytes"] else 0,
+        "snapshot_ms": stats["duration_ms"],
+        "kept": kept,
+        "pruned": pruned,
+        "freed_bytes": freed,
+        "store_bytes": store_usage(),
+    }
+
+
+def _record_last_run(app, result):
+    from models import db, Setting
+
+    with app.app_context():
+        value = json.dumps(result)
+        setting = Setting.query.filter_by(key=LAST_RUN_SETTING).first()
+        if setting:
+            setting.value = value
+        else:
+            db.session.add(Setting(key=LAST_RUN_SETTING, value=value))
+        db.session.commit()
+
+
+def get_last_run():
+    """Metrics of the last scheduled backup for the settings page, or None"""
+    from utils import get_setting
+
+    try:
+        return json.loads(get_setting(LAST_RUN_SETTING, "") or "null")
+    except ValueError:
+        return None
+
+
+def run_scheduled_backup(app):
+    """Scheduled job: run take_scheduled_backup in a niced, I/O-idle child process and record its metrics."""
+    from utils import get_setting
+
+    with app.app_context():
+        if get_setting("ENABLE_SCHEDULED_BACKUPS", "True") != "True":
+            print("⚪ Scheduled backup: DISABLED (skipping)")
+            return None
+
+        try:
+            io_limit = float(get_setting("BACKUP_IO_LIMIT_MB_S", str(BACKUP_IO_LIMIT_MB_S)))
+        except (TypeError, ValueError):
+            io_limit = BACKUP_IO_LIMIT_MB_S
+        args = [
+            "--db", app.config["SQLALCHEMY_DATABASE_URI"].replace("sqlite:///", ""),
+            "--uploads", os.path.join(app.static_folder, "uploads"),
+            "--templates", os.path.join("templates", "email_templates"),
+            "--tiers", json.dumps(get_retention_tiers()),
+            "--io-limit", str(int(io_limit * 1024 * 1024)),
+        ]
+
+    command = [sys.executable, "-m", "backup_scheduler"] + args
+    if shutil.which("ionice"):
+        command = ["ionice", "-c", "3"] + command  # Idle I/O class: only uses the disk when nobody else does
+
+    started = time.monotonic()
+    result = {"finished_at": None, "status": "error"}
+    try:
+        proc = subprocess.run(command, cwd=app.root_path, capture_output=True, text=True,
+                              timeout=BACKUP_TIMEOUT_SECONDS)
+        if proc.returncode == 0:
+            result.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+            result["status"] = "ok"
+        else:
+            result["error"] = (proc.stderr.strip().splitlines() or ["exit code %d" % proc.returncode])[-1]
+    except subprocess.TimeoutExpired:
+        result["error"] = f"Timed out after {BACKUP_TIMEOUT_SECONDS}s"
+    except (OSError, ValueError, IndexError) as e:
+        result["error"] = str(e)
+
+    result["duration_ms"] = int((time.monotonic() - started) * 1000)
+    result["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    if result["status"] == "ok":
+        print(f"💾 Scheduled backup {result['snapshot']}: {result['new_bytes']} new of {result['total_bytes']} bytes "
+              f"({result['dedup_ratio']:.0%} deduplicated), {result['pruned']} pruned, {result['duration_ms']}ms")
+    else:
+        logger.error(f"Scheduled backup failed: {result.get('error')}")
+
+    try:
+        _record_last_run(app, result)
+    except Exception as e:
+        logger.error(f"Could not record scheduled backup metrics: {e}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Take a scheduled backup snapshot and apply retention")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--uploads")
+    parser.add_argument("--templates")
+    parser.add_argument("--tiers", default=json.dumps(RETENTION_TIERS))
+    parser.add_argument("--io-limit", type=int, default=0, help="bytes/second, 0 = unthrottled")
+    args = parser.parse_args(argv)
+
+    # Lowest CPU priority, set here rather than with a preexec_fn: forking the
+    # scheduler's multi-threaded process and running Python before exec can deadlock
+    try:
+        os.nice(19)
+    except OSError:
+        pass
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    result = take_scheduled_backup(args.db, args.uploads, args.templates, json.loads(args.tiers),
+                                   max_bytes_per_second=args.io_limit or None)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""
+Backup Store - Content-addressed, deduplicated backup snapshots
+Every backup used to re-zip the whole database, static/uploads and the email
+templates. Snapshots are now split into fixed-size chunks stored once under
+instance/backup_store/blobs/ (named by their SHA-256), plus a small JSON
+manifest per snapshot listing each file and its chunks. Unchanged files are
+recognised by size/mtime from the previous manifest and are not even re-read,
+so a daily backup costs only the bytes that changed. Chunks are stored
+zlib-compressed ("<digest>.z") unless that doesn't make them smaller, in which
+case (already-compressed uploads, and blobs written before compression) they
+stay raw under the bare digest; either way the digest is of the raw bytes.
+
+A snapshot is restored by rebuilding its files from the manifest into the same
+layout a backup ZIP extracts to (database/, static/uploads/, templates/...),
+so the restore_* helpers in api/backup.py work on either. Deleting snapshots
+never touches blobs directly; collect_garbage() removes the unreferenced ones.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+
+from db_snapshot import database_snapshot
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.path.join("instance", "backup_store")
+CHUNK_SIZE = 4 * 1024 * 1024      # Fixed-size chunks; SQLite rewrites pages in place so these dedupe well
+BLOB_COMPRESSION_LEVEL = 3        # zlib level; database chunks shrink a lot even at low levels
+GC_GRACE_SECONDS = 3600           # Unreferenced blobs younger than this may belong to a snapshot in progress
+MANIFEST_VERSION = "3.0"
+DATABASE_ARCNAME = "database/minipass.db"
+EMAIL_TEMPLATES_DIR = os.path.join("templates", "email_templates")
+
+SNAPSHOT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+class BackupStoreError(Exception):
+    """Missing/corrupt snapshot or blob"""
+
+
+def _blob_dir():
+    return os.path.join(STORE_DIR, "blobs")
+
+
+def _snapshot_dir():
+    return os.path.join(STORE_DIR, "snapshots")
+
+
+def _blob_path(digest, compressed=False):
+    return os.path.join(_blob_dir(), digest[:2], digest + ".z" if compressed else digest)
+
+
+def _find_blob(digest):
+    """(path, compressed) of a stored chunk, or (None, False) when it isn't in the store"""
+    for compressed in (True, False):
+        path = _blob_path(digest, compressed)
+        if os.path.exists(path):
+            return path, compressed
+    return None, False
+
+
+def _manifest_path(snapshot_id):
+    if not SNAPSHOT_ID_PATTERN.match(snapshot_id or ""):
+        raise BackupStoreError(f"Invalid snapshot id: {snapshot_id}")
+    return os.path.join(_snapshot_dir(), f"{snapshot_id}.json")
+
+
+def _touch_blob(path):
+    # Refresh mtime so a concurrent collect_garbage() treats the blob as in use
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def snapshot_exists(snapshot_id):
+    try:
+        return os.path.exists(_manifest_path(snapshot_id))
+    except BackupStoreError:
+        return False
+
+
+def _put_blob(data):
+    """Store one chunk; returns (digest, bytes_written) - 0 written when it was already there"""
+    digest = hashlib.sha256(data).hexdigest()
+    existing, _ = _find_blob(digest)
+    if existing:
+        _touch_blob(existing)
+        return digest, 0
+
+    packed = zlib.compress(data, BLOB_COMPRESSION_LEVEL)
+    compressed = len(packed) < len(data)
+    if not compressed:
+        packed = data
+    path = _blob_path(digest, compressed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(packed)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest, len(packed)
+
+
+def read_blob(digest):
+    """Chunk contents, verified against their digest"""
+    path, compressed = _find_blob(digest)
+    try:
+        with open(path or _blob_path(digest), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise BackupStoreError(f"Missing blob {digest}")
+    if compressed:
+        try:
+            data = zlib.decompress(data)
+        except zlib.error:
+            raise BackupStoreError(f"Corrupt blob {digest}")
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise BackupStoreError(f"Corrupt blob {digest}")
+    return data
+
+
+class _Throttle:
+    """Sleeps so reads average at most rate bytes/second (no-op without a rate)"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def __call__(self, size):
+        if not self.rate:
+            return
+        self.consumed += size
+        ahead = self.consumed / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _store_stream(fileobj, stats, throttle=None):
+    """Chunk and store a file; returns (chunk digests, bytes read)"""
+    chunks, size = [], 0
+    while True:
+        data = fileobj.read(CHUNK_SIZE)
+        if not data:
+            break
+        if throttle:
+            throttle(len(data))
+        digest, written = _put_blob(data)
+        chunks.append(digest)
+        size += len(data)
+        stats["new_bytes"] += written
+        stats["new_blobs"] += 1 if written else 0
+    stats["total_bytes"] += size
+    return chunks, size
+
+
+def iter_directory(directory, arc_prefix):
+    """(arcname, path) for every file under directory, arcname = arc_prefix/relative path"""
+    if not os.path.isdir(directory):
+        return
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, directory).replace(os.sep, "/")
+            yield f"{arc_prefix}/{rel}", path
+
+
+def backup_sources(upload_dir=None, template_dir=EMAIL_TEMPLATES_DIR):
+    """Files of a full backup besides the database: uploads and email templates"""
+    sources = []
+    if upload_dir:
+        sources.extend(iter_directory(upload_dir, "static/uploads"))
+    if template_dir:
+        sources.extend(iter_directory(template_dir, "templates/email_templates"))
+    return sources
+
+
+def _latest_file_index():
+    """path -> file entry of the newest manifest, for skipping unchanged files"""
+    snapshots = list_snapshots()
+    if not snapshots:
+        return {}
+    try:
+        manifest = load_manifest(snapshots[0]["id"])
+    except BackupStoreError:
+        return {}
+    return {entry["path"]: entry for entry in manifest.get("files", [])}
+
+
+def create_snapshot(snapshot_id, backup_type="full", created_by="system", db_path=None,
+                    sources=(), extra_files=None, metadata=None, max_bytes_per_second=None):
+    """
+    Store a snapshot and write its manifest.
+
+    Args:
+        db_path: live database to include (copied with the online backup API first)
+        sources: (arcname, path) pairs, e.g. from backup_sources()
+        extra_files: {arcname: bytes} generated content such as settings.json
+        metadata: extra fields for backup_metadata.json
+        max_bytes_per_second: read rate limit for background runs (None = unthrottled)
+
+    Returns the manifest (with stats: files, total_bytes, new_bytes, new_blobs, duration_ms).
+    """
+    started = time.monotonic()
+    manifest_path = _manifest_path(snapshot_id)
+    os.makedirs(_snapshot_dir(), exist_ok=True)
+
+    previous = _latest_file_index()
+    stats = {"files": 0, "total_bytes": 0, "new_bytes": 0, "new_blobs": 0, "reused_files": 0}
+    files = []
+    throttle = _Throttle(max_bytes_per_second)
+
+    if db_path and os.path.exists(db_path):
+        with database_snapshot(db_path) as snapshot_path:
+            with open(snapshot_path, "rb") as f:
+                chunks, size = _store_stream(f, stats, throttle)
+            files.append({"path": DATABASE_ARCNAME, "size": size, "chunks": chunks})
+
+    for arcname, path in sources:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # Deleted while we were walking
+
+        old = previous.get(arcname)
+        if (old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns
+                and all(_find_blob(d)[0] for d in old["chunks"])):
+            for digest in old["chunks"]:
+                _touch_blob(_find_blob(digest)[0])
+            chunks, size = old["chunks"], st.st_size
+            stats["total_bytes"] += size
+            stats["reused_files"] += 1
+        else:
+            with open(path, "rb") as f:
+                chunks, size = _store_stream(f, stats, throttle)
+        files.append({"path": arcname, "size": size, "mtime_ns": st.st_mtime_ns, "chunks": chunks})
+
+    for arcname, data in (extra_files or {}).items():
+        chunks, size = _store_stream(io.BytesIO(data), stats)
+        files.append({"path": arcname, "size": size, "chunks": chunks})
+
+    stats["files"] = len(files)
+    stats["duration_ms"] = int((time.monotonic() - started) * 1000)
+
+    manifest = {
+        "id": snapshot_id,
+        "version": MANIFEST_VERSION,
+        "backup_type": backup_type,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_by": created_by,
+        "metadata": metadata or {},
+        "stats": stats,
+        "files": files,
+    }
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+    logger.info(f"[BACKUP STORE] Snapshot {snapshot_id}: {stats['files']} files, "
+                f"{stats['total_bytes']} bytes, {stats['new_bytes']} new in {stats['duration_ms']}ms")
+    return manifest
+
+
+def load_manifest(snapshot_id):
+    try:
+        with open(_manifest_path(snapshot_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise BackupStoreError(f"Snapshot not found: {snapshot_id}")
+
+
+def list_snapshots(backup_type=None):
+    """Snapshot summaries (no file lists), newest first"""
+    snapshot_dir = _snapshot_dir()
+    if not os.path.isdir(snapshot_dir):
+        return []
+
+    snapshots = []
+    for name in os.listdir(snapshot_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(snapshot_dir, name)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if backup_type and manifest.get("backup_type") != backup_type:
+            continue
+        manifest.pop("files", None)
+        snapshots.append(manifest)
+
+    snapshots.sort(key=lambda m: m.get("created_at", ""), reverse=True)
+    return snapshots
+
+
+def backup_metadata(manifest):
+    """Contents of backup_metadata.json for a snapshot (same keys as the ZIP backups)"""
+    return {
+        "backup_type": manifest.get("backup_type"),
+        "version": manifest.get("version"),
+        "created_by": manifest.get("created_by"),
+        "created_at": manifest.get("created_at"),
+        **manifest.get("metadata", {}),
+    }
+
+
+def iter_snapshot_files(manifest):
+    """(arcname, size, chunk-bytes iterator) per file, plus the generated backup_metadata.json"""
+    for entry in manifest.get("files", []):
+        yield entry["path"], entry["size"], (read_blob(digest) for digest in entry["chunks"])
+    metadata = json.dumps(backup_metadata(manifest), indent=2).encode("utf-8")
+    yield "backup_metadata.json", len(metadata), iter([metadata])
+
+
+def materialize_snapshot(snapshot_id, target_dir):
+    """Rebuild a snapshot's files under target_dir (the layout a backup ZIP extracts to)"""
+    manifest = load_manifest(snapshot_id)
+    root = os.path.abspath(target_dir)
+
+    for arcname, size, chunks in iter_snapshot_files(manifest):
+        dest = os.path.abspath(os.path.join(root, arcname))
+        if not dest.startswith(root + os.sep):
+            raise BackupStoreError(f"Unsafe path in manifest: {arcname}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            for data in chunks:
+                f.write(data)
+    return manifest
+
+
+def delete_snapshot(snapshot_id):
+    """Remove a manifest; its blobs go away in the next collect_garbage()"""
+    try:
+        os.remove(_manifest_path(snapshot_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def prune_snapshots(backup_type, keep_count):
+    """Delete all but the newest keep_count snapshots of a type; returns deleted ids"""
+    deleted = []
+    for manifest in list_snapshots(backup_type)[keep_count:]:
+        if delete_snapshot(manifest["id"]):
+            deleted.append(manifest["id"])
+            logger.info(f"[BACKUP STORE] Pruned snapshot {manifest['id']}")
+    return deleted
+
+
+def collect_garbage(grace_seconds=GC_GRACE_SECONDS):
+    """Delete blobs no manifest references (mark and sweep). Returns (blobs_deleted, bytes_freed)."""
+    blob_dir = _blob_dir()
+    if not os.path.isdir(blob_dir):
+        return 0, 0
+
+    referenced = set()
+    snapshot_dir = _snapshot_dir()
+    if os.path.isdir(snapshot_dir):
+        for name in os.listdir(snapshot_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(snapshot_dir, name)) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                # An unreadable manifest might still reference anything - don't sweep
+                logger.error(f"[BACKUP STORE] Unreadable manifest {name}, skipping garbage collection")
+                return 0, 0
+            for entry in manifest.get("files", []):
+                referenced.update(entry["chunks"])
+
+    cutoff = time.time() - grace_seconds
+    deleted = freed = 0
+    for prefix in os.listdir(blob_dir):
+        prefix_dir = os.path.join(blob_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            if name.split(".")[0] in referenced:
+                continue
+            path = os.path.join(prefix_dir, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+                deleted += 1
+                freed += st.st_size
+            except OSError:
+                continue
+
+    logger.info(f"[BACKUP STORE] Garbage collection: {deleted} blobs, {freed} bytes freed")
+    return deleted, freed
+
+
+def store_usage():
+    """Total bytes held in blobs (what the snapshots actually cost on disk)"""
+    total = 0
+    for root, dirs, files in os.walk(_blob_dir()):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
@@ -0,0 +1,589 @@
+"""
+Backup Stream - Backup archives written and read as streams
+Downloads used to build the whole backup ZIP in a temp dir before send_file,
+and restores saved the upload, extracted it with extractall and then copied
+every file into place - two to three times the archive size on disk at once.
+
+stream_snapshot_zip() yields archive bytes as entries are compressed, so a
+download starts immediately and never touches the disk. Each entry gets its
+own codec - images and other already-compressed files are stored, the
+database and JSON go through zstd (LZMA when zstandard isn't installed) and
+the rest is deflated - and chunks are compressed in parallel on a thread pool.
+The first entry, backup_manifest.json, lists every file's size, codec and
+per-chunk SHA-256, so an archive can be verified entry by entry while it is
+read, without extracting it.
+
+iter_zip_stream() reads a ZIP front to back from a non-seekable stream (the
+request body), checking CRCs and manifest checksums as it goes, and
+extract_stream() writes the entries straight into a staging directory next
+to the live data, from which the restore_* helpers move files into place.
+"""
+import hashlib
+import json
+import logging
+import lzma
+import os
+import posixpath
+import sqlite3
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZIP_STORED, ZIP_DEFLATED, ZIP_LZMA, ZIP64_LIMIT
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from backup_store import CHUNK_SIZE, backup_metadata, load_manifest, read_blob
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_WORKERS = min(4, os.cpu_count() or 1)
+COMPRESS_WINDOW = 2 * COMPRESS_WORKERS  # Chunks read/compressed ahead of what is being sent
+DEFLATE_LEVEL = 6
+ZSTD_LEVEL = 6
+LZMA_DICT_SIZE = 8 * 1024 * 1024
+READ_BLOCK_SIZE = 256 * 1024
+RESTORE_MAX_BYTES = 10 * 1024 ** 3      # Uncompressed total accepted from one archive (zip bomb guard)
+RESTORE_STAGING_DIR = "instance"        # Same filesystem as the live data, so applying is a rename
+ARCHIVE_MANIFEST_NAME = "backup_manifest.json"
+ARCHIVE_FORMAT = 1
+
+ZIP_ZSTANDARD = 93
+CODEC_METHODS = {"store": ZIP_STORED, "deflate": ZIP_DEFLATED, "lzma": ZIP_LZMA, "zstd": ZIP_ZSTANDARD}
+# Already compressed: recompressing costs CPU and saves nothing
+STORED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".heic", ".ico",
+    ".zip", ".gz", ".bz2", ".xz", ".zst", ".br", ".pdf", ".woff", ".woff2",
+    ".mp3", ".mp4", ".m4a", ".mov", ".webm",
+}
+# Compress well but are large: worth the slower, stronger codec
+DENSE_EXTENSIONS = {".db", ".json", ".sqlite"}
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_LOCAL_HEADER_SIGNATURE = 0x04034B50
+_CENTRAL_DIR_SIGNATURE = 0x02014B50
+_END_OF_CENTRAL_DIR_SIGNATURE = 0x06054B50
+_ZIP64_END_OF_CENTRAL_DIR_SIGNATURE = 0x06064B50
+_ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_ZSTD_FRAME_MAGIC = b"\x28\xb5\x2f\xfd"
+_FLAG_ENCRYPTED = 0x01
+_FLAG_LZMA_EOS = 0x02
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+class BackupStreamError(Exception):
+    """The archive is malformed, corrupt or unsafe to restore"""
+
+
+# ============================================================================
+# CODECS
+# ============================================================================
+
+def choose_codec(arcname):
+    """Codec for one archive entry, picked from its file extension"""
+    extension = os.path.splitext(arcname)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return "store"
+    if extension in DENSE_EXTENSIONS:
+        return "zstd" if zstandard else "lzma"
+    return "deflate"
+
+
+def _lzma_filter(props=None):
+    """LZMA1 filter for ZIP entries: default parameters, or those encoded in an entry's 5 property bytes"""
+    if props is None:
+        return {"id": lzma.FILTER_LZMA1, "dict_size": LZMA_DICT_SIZE, "lc": 3, "lp": 0, "pb": 2}
+    if len(props) != 5:
+        raise BackupStreamError("Invalid LZMA properties")
+    lc, rest = props[0] % 9, props[0] // 9
+    return {"id": lzma.FILTER_LZMA1, "dict_size": int.from_bytes(props[1:], "little"),
+            "lc": lc, "lp": rest % 5, "pb": rest // 5}
+
+
+def _lzma_header():
+    """ZIP LZMA entry prefix: LZMA SDK version, property size, properties (lc/lp/pb + dictionary size)"""
+    options = _lzma_filter()
+    props = bytes([(options["pb"] * 5 + options["lp"]) * 9 + options["lc"]]) + options["dict_size"].to_bytes(4, "little")
+    return struct.pack("<BBH", 9, 4, len(props)) + props
+
+
+def _compress_piece(codec, source, last):
+    """
+    Read (if a blob digest) and compress one chunk on a worker thread.
+    Deflate chunks end on a full flush so independently compressed pieces
+    concatenate into one valid stream; zstd chunks are separate frames, which
+    concatenate the same way. Store and LZMA pieces are handled in order by
+    the writer (LZMA is a single stream per entry).
+    """
+    raw = read_blob(source) if isinstance(source, str) else source
+    if codec == "deflate":
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+        return raw, compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    if codec == "zstd":
+        return raw, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return raw, None
+
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+def _dos_datetime(timestamp=None):
+    t = time.localtime(timestamp)
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+
+class _ZipWriter:
+    """Streaming ZIP writer: local header, data, data descriptor per entry, then the central directory"""
+
+    def __init__(self):
+        self.offset = 0
+        self.entries = []
+        self.current = None
+        self.dostime, self.dosdate = _dos_datetime()
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def begin(self, arcname, size, codec):
+        name = arcname.encode("utf-8")
+        method = CODEC_METHODS[codec]
+        zip64 = size * 1.05 > ZIP64_LIMIT
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8 | (_FLAG_LZMA_EOS if codec == "lzma" else 0)
+        version = 45 if zip64 else (63 if codec in ("lzma", "zstd") else 20)
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        placeholder = 0xFFFFFFFF if zip64 else 0
+
+        self.current = {
+            "name": name, "method": method, "flags": flags, "version": version, "zip64": zip64,
+            "offset": self.offset, "crc": 0, "size": 0, "compress_size": 0, "codec": codec,
+            "lzma": lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[_lzma_filter()]) if codec == "lzma" else None,
+        }
+        header = _LOCAL_HEADER.pack(_LOCAL_HEADER_SIGNATURE, version, flags, method, self.dostime, self.dosdate,
+                                    0, placeholder, placeholder, len(name), len(extra)) + name + extra
+        data = self._emit(header)
+        if codec == "lzma":
+            prefix = _lzma_header()
+            self.current["compress_size"] += len(prefix)
+            data += self._emit(prefix)
+        return data
+
+    def write(self, raw, compressed):
+        entry = self.current
+        entry["crc"] = zlib.crc32(raw, entry["crc"])
+        entry["size"] += len(raw)
+        if entry["codec"] == "store":
+            compressed = raw
+        elif entry["codec"] == "lzma":
+            compressed = entry["lzma"].compress(raw)
+        entry["compress_size"] += len(compressed)
+        return self._emit(compressed)
+
+    def end(self):
+        entry = self.current
+        data = b""
+        if entry["codec"] == "lzma":
+            data = entry["lzma"].flush()
+            entry["compress_size"] += len(data)
+            entry["lzma"] = None
+        descriptor = _DATA_DESCRIPTOR_SIGNATURE + struct.pack(
+            "<IQQ" if entry["zip64"] else "<III", entry["crc"], entry["compress_size"], entry["size"])
+        self.entries.append(entry)
+        self.current = None
+        return self._emit(data) + self._emit(descriptor)
+
+    def finish(self):
+        """Central directory and end records"""
+        start = self.offset
+        records = []
+        for entry in self.entries:
+            sizes = (entry["compress_size"], entry["size"], entry["offset"])
+            extra = b""
+            if entry["zip64"] or max(sizes) >= ZIP64_LIMIT:
+                extra = struct.pack("<HHQQQ", 1, 24, entry["size"], entry["compress_size"], entry["offset"])
+                sizes = (0xFFFFFFFF, 0xFFFFFFFF, 0xFFFFFFFF)
+            records.append(_CENTRAL_HEADER.pack(
+                _CENTRAL_DIR_SIGNATURE, 0x0300 | entry["version"], entry["version"], entry["flags"], entry["method"],
+                self.dostime, self.dosdate, entry["crc"], sizes[0], sizes[1], len(entry["name"]), len(extra),
+                0, 0, 0, 0o100644 << 16, sizes[2]) + entry["name"] + extra)
+        data = b"".join(records)
+        size, count = len(data), len(self.entries)
+
+        end = b""
+        if count >= 0xFFFF or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            zip64_end_offset = start + size
+            end += struct.pack("<IQHHIIQQQQ", _ZIP64_END_OF_CENTRAL_DIR_SIGNATURE, 44, 45, 45, 0, 0,
+                               count, count, size, start)
+            end += struct.pack("<IIQI", _ZIP64_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1)
+            count, size, start = min(count, 0xFFFF), min(size, 0xFFFFFFFF), 0xFFFFFFFF
+        end += struct.pack("<IHHHHIIH", _END_OF_CENTRAL_DIR_SIGNATURE, 0, 0, count, count, size, start, 0)
+        return self._emit(data + end)
+
+
+def _archive_plan(manifest):
+    """(arcname, size, codec, sources) for every entry, manifest entry first; sources are blob digests or bytes"""
+    files = [(entry["path"], entry["size"], choose_codec(entry["path"]), list(entry["chunks"]))
+             for entry in manifest.get("files", [])]
+    metadata = json.dumps(backup_metadata(manifest), indent=2).encode("utf-8")
+    files.append(("backup_metadata.json", len(metadata), choose_codec("backup_metadata.json"), [metadata]))
+
+    index = {
+        "format": ARCHIVE_FORMAT,
+        "snapshot": manifest.get("id"),
+        "chunk_size": CHUNK_SIZE,
+        "files": [
+            {
+                "path": arcname,
+                "size": size,
+                "codec": codec,
+                "chunks": [source if isinstance(source, str) else hashlib.sha256(source).hexdigest()
+                           for source in sources],
+            }
+            for arcname, size, codec, sources in files
+        ],
+    }
+    index_data = json.dumps(index).encode("utf-8")
+    return [(ARCHIVE_MANIFEST_NAME, len(index_data), "deflate", [index_data])] + files
+
+
+def stream_archive(manifest, workers=COMPRESS_WORKERS):
+    """
+    Yield a snapshot as a ZIP archive piece by piece.
+    Chunks are read and compressed up to COMPRESS_WINDOW ahead on a thread pool
+    (zlib, lzma and zstd release the GIL) and written out in order.
+    """
+    plan = [(arcname, size, codec, sources or [b""]) for arcname, size, codec, sources in _archive_plan(manifest)]
+    tasks = (
+        (codec, source, index == len(sources) - 1)
+        for _, _, codec, sources in plan
+        for index, source in enumerate(sources)
+    )
+    writer = _ZipWriter()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup-compress")
+    pending = deque()
+    try:
+        for arcname, size, codec, sources in plan:
+            yield writer.begin(arcname, size, codec)
+            for _ in sources:
+                while len(pending) < COMPRESS_WINDOW:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    pending.append(pool.submit(_compress_piece, *task))
+                raw, compressed = pending.popleft().result()
+                data = writer.write(raw, compressed)
+                if data:
+                    yield data
+            yield writer.end()
+        yield writer.finish()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_snapshot_zip(snapshot_id):
+    """A stored snapshot as a backup ZIP, generated while it is being sent"""
+    manifest = load_manifest(snapshot_id)
+    return stream_archive(manifest)
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+class _StreamReader:
+    """Buffered reads from a non-seekable stream, with push-back for over-reads"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.pending = b""
+
+    def read(self, size):
+        """Up to size bytes; b"" at end of stream"""
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.fileobj.read(size)
+
+    def read_exact(self, size):
+        parts, remaining = [], size
+        while remaining:
+            data = self.read(remaining)
+            if not data:
+                raise BackupStreamError("Unexpected end of archive")
+            parts.append(data)
+            remaining -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+def _zip64_sizes(extra, compress_size, file_size):
+    """Sizes from the ZIP64 extra field when the header holds 0xFFFFFFFF placeholders"""
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, offset)
+        if header_id == 0x0001:
+            values = list(struct.unpack_from(f"<{length // 8}Q", extra, offset + 4))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compress_size == 0xFFFFFFFF and values:
+                compress_size = values.pop(0)
+            return True, compress_size, file_size
+        offset += 4 + length
+    return False, compress_size, file_size
+
+
+def _inflate(reader, decompressor, sized, remaining):
+    """Feed compressed bytes until the decompressor's stream ends; returns the compressed bytes consumed"""
+    consumed = 0
+    while not decompressor.eof and (not sized or remaining):
+        data = reader.read(min(READ_BLOCK_SIZE, remaining) if sized else READ_BLOCK_SIZE)
+        if not data:
+            raise BackupStreamError("Unexpected end of archive")
+        if sized:
+            remaining -= len(data)
+        consumed += len(data)
+        try:
+            output = decompressor.decompress(data)
+        except (zlib.error, lzma.LZMAError) as e:
+            raise BackupStreamError(f"Corrupt compressed data: {e}") from e
+        except Exception as e:
+            if zstandard and isinstance(e, zstandard.ZstdError):
+                raise BackupStreamError(f"Corrupt compressed data: {e}") from e
+            raise
+        if output:
+            yield output
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+        consumed -= len(decompressor.unused_data)
+    return consumed
+
+
+def _read_entry_data(reader, method, flags, compress_size, zip64, known_size=None):
+    """Yield the uncompressed bytes of one entry and return its descriptor CRC (or None)"""
+    sized = not flags & _FLAG_DATA_DESCRIPTOR
+
+    if method == ZIP_STORED:
+        if not sized and known_size is None:
+            raise BackupStreamError("Stored entries without sizes cannot be streamed")
+        remaining = compress_size if sized else known_size
+        while remaining:
+            data = reader.read(min(READ_BLOCK_SIZE, remaining))
+            if not data:
+                raise BackupStreamError("Unexpected end of archive")
+            remaining -= len(data)
+            yield data
+
+    elif method == ZIP_DEFLATED:
+        yield from _inflate(reader, zlib.decompressobj(-15), sized, compress_size)
+
+    elif method == ZIP_LZMA:
+        _, _, props_size = struct.unpack("<BBH", reader.read_exact(4))
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[_lzma_filter(reader.read_exact(props_size))])
+        yield from _inflate(reader, decompressor, sized, compress_size - 4 - props_size)
+
+    elif method == ZIP_ZSTANDARD:
+        if zstandard is None:
+            raise BackupStreamError("This backup uses zstd compression; install the zstandard package to restore it")
+        # One or more concatenated frames (one per chunk)
+        remaining = compress_size
+        while True:
+            consumed = yield from _inflate(reader, zstandard.ZstdDecompressor().decompressobj(), sized, remaining)
+            if sized:
+                remaining -= consumed
+                if remaining <= 0:
+                    break
+            else:
+                magic = reader.read_exact(4)
+                reader.unread(magic)
+                if magic != _ZSTD_FRAME_MAGIC:
+                    break
+
+    else:
+        raise BackupStreamError(f"Unsupported compression method {method}")
+
+    if sized:
+        return None
+    descriptor = reader.read_exact(4)
+    if descriptor == _DATA_DESCRIPTOR_SIGNATURE:
+        descriptor = reader.read_exact(4)
+    reader.read_exact(16 if zip64 else 8)  # Sizes; the CRC is what we verify
+    return struct.unpack("<I", descriptor)[0]
+
+
+def _verify_against_manifest(chunks, entry, chunk_size, arcname):
+    """Pass chunks through, checking size and per-chunk SHA-256 against the archive manifest"""
+    expected = entry.get("chunks", [])
+    digest, filled, index, size = hashlib.sha256(), 0, 0, 0
+
+    def check(digest, index):
+        if index >= len(expected) or digest.hexdigest() != expected[index]:
+            raise BackupStreamError(f"Checksum mismatch in {arcname} (chunk {index})")
+
+    for data in chunks:
+        size += len(data)
+        view = memoryview(data)
+        while view:
+            take = min(chunk_size - filled, len(view))
+            digest.update(view[:take])
+            filled += take
+            view = view[take:]
+            if filled == chunk_size:
+                check(digest, index)
+                digest, filled, index = hashlib.sha256(), 0, index + 1
+        yield data
+    if filled:
+        check(digest, index)
+        index += 1
+    if index != len(expected) or size != entry.get("size"):
+        raise BackupStreamError(f"Size mismatch in {arcname}")
+
+
+def iter_zip_stream(fileobj):
+    """
+    Yield (arcname, size, chunk iterator) for each entry of a ZIP read front to back.
+    size is None when the archive only records it after the data. Each entry's
+    CRC - and, when the archive starts with backup_manifest.json, its size and
+    chunk checksums - are verified as its chunks are consumed (unconsumed
+    entries are skipped but still verified); a mismatch raises BackupStreamError.
+    """
+    reader = _StreamReader(fileobj)
+    manifest = None
+    first = True
+    while True:
+        signature = reader.read(4)
+        while signature and len(signature) < 4:
+            more = reader.read(4 - len(signature))
+            if not more:
+                break
+            signature += more
+        if len(signature) < 4:
+            raise BackupStreamError("Unexpected end of archive")
+        signature = struct.unpack("<I", signature)[0]
+        if signature in (_CENTRAL_DIR_SIGNATURE, _END_OF_CENTRAL_DIR_SIGNATURE):
+            break  # Central directory: every entry has been read
+        if signature != _LOCAL_HEADER_SIGNATURE:
+            raise BackupStreamError("Not a ZIP archive (or a corrupt one)")
+
+        (_, _, flags, method, _, _, crc, compress_size, file_size,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(struct.pack("<I", signature) + reader.read_exact(26))
+        raw_name = reader.read_exact(name_length)
+        extra = reader.read_exact(extra_length)
+        arcname = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+
+        if flags & _FLAG_ENCRYPTED:
+            raise BackupStreamError(f"Encrypted entry not supported: {arcname}")
+        zip64, compress_size, file_size = _zip64_sizes(extra, compress_size, file_size)
+
+        listed = None
+        if manifest is not None and not arcname.endswith("/"):
+            listed = manifest["files"].pop(arcname, None)
+            if listed is None:
+                raise BackupStreamError(f"{arcname} is not listed in the archive manifest")
+
+        def chunks(method=method, flags=flags, crc=crc, compress_size=compress_size, zip64=zip64, arcname=arcname,
+                   known_size=listed["size"] if listed else None):
+            running_crc = 0
+            data_iter = _read_entry_data(reader, method, flags, compress_size, zip64, known_size)
+            while True:
+                try:
+                    data = next(data_iter)
+                except StopIteration as done:
+                    expected = crc if done.value is None else done.value
+                    break
+                running_crc = zlib.crc32(data, running_crc)
+                yield data
+            if running_crc != expected:
+                raise BackupStreamError(f"CRC mismatch in {arcname}")
+
+        entry_chunks = chunks()
+        size = None if flags & _FLAG_DATA_DESCRIPTOR else file_size
+
+        if first and arcname == ARCHIVE_MANIFEST_NAME:
+            data = b"".join(entry_chunks)
+            try:
+                manifest = json.loads(data)
+                manifest["files"] = {entry["path"]: entry for entry in manifest["files"]}
+                manifest["chunk_size"] = int(manifest["chunk_size"])
+            except (ValueError, KeyError, TypeError) as e:
+                raise BackupStreamError(f"Unreadable archive manifest: {e}") from e
+            entry_chunks = iter([data])
+        elif listed is not None:
+            entry_chunks = _verify_against_manifest(entry_chunks, listed, manifest["chunk_size"], arcname)
+            size = listed["size"]
+        first = False
+
+        yield arcname, size, entry_chunks
+        for _ in entry_chunks:
+            pass  # Skip whatever the caller did not read
+
+    if manifest is not None and manifest["files"]:
+        raise BackupStreamError(f"Archive is missing {len(manifest['files'])} file(s) listed in its manifest")
+
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+def _safe_path(root, arcname):
+    """Destination for arcname under root, or BackupStreamError for absolute/escaping names"""
+    normalized = posixpath.normpath(arcname.replace("\\", "/"))
+    if normalized.startswith(("/", "../")) or normalized == ".." or ":" in normalized.split("/")[0]:
+        raise BackupStreamError(f"Unsafe path in archive: {arcname}")
+    dest = os.path.abspath(os.path.join(root, *normalized.split("/")))
+    if not dest.startswith(os.path.abspath(root) + os.sep):
+        raise BackupStreamError(f"Unsafe path in archive: {arcname}")
+    return dest
+
+
+def extract_stream(entries, target_dir, max_bytes=RESTORE_MAX_BYTES):
+    """
+    Write (arcname, size, chunks) entries under target_dir as they are read.
+    Returns the list of extracted names; raises BackupStreamError on unsafe
+    paths, CRC mismatches or archives expanding beyond max_bytes.
+    """
+    names, total = [], 0
+    for arcname, size, chunks in entries:
+        if arcname.endswith("/"):
+            continue  # Directory entry
+        dest = _safe_path(target_dir, arcname)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            for data in chunks:
+                total += len(data)
+                if total > max_bytes:
+                    raise BackupStreamError("Archive expands beyond the restore size limit")
+                f.write(data)
+        names.append(arcname)
+    return names
+
+
+def validate_extracted(target_dir):
+    """Check an extracted backup before anything live is touched; returns its table names"""
+    db_path = os.path.join(target_dir, "database", "minipass.db")
+    if not os.path.exists(db_path):
+        raise BackupStreamError("No database found in backup")
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()
+        if not result or result[0] != "ok":
+            raise BackupStreamError(f"Backup database failed integrity check: {result[0] if result else 'no result'}")
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    except sqlite3.Error as e:
+        raise BackupStreamError(f"Backup database is not readable: {e}") from e
+    finally:
+        conn.close()
+
+    logger.info(f"[RESTORE] Backup database OK ({len(tables)} tables)")
+    return tables
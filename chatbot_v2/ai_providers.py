@@ -2,9 +2,11 @@
 Abstract AI Provider Interface
 Defines the contract for all AI providers (Ollama, Anthropic, OpenAI)
 """
+import asyncio
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, AsyncIterator
 from datetime import datetime
 
 
@@ -21,6 +23,11 @@ class AIResponse:
     metadata: Optional[Dict[str, Any]] = None
 
 
+class AIProviderError(Exception):
+    """Raised by streaming generation (which has no AIResponse to carry the error)"""
+    pass
+
+
 @dataclass
 class AIRequest:
     """Standard request format to AI providers"""
@@ -46,6 +53,16 @@ class AIProvider(ABC):
         """Generate AI response from prompt"""
         pass
     
+    async def generate_stream(self, request: AIRequest) -> AsyncIterator[str]:
+        """
+        Yield the response text in chunks as the provider produces it.
+        Default: one chunk with the full generate() result. Raises AIProviderError.
+        """
+        response = await self.generate(request)
+        if response.error:
+            raise AIProviderError(response.error)
+        yield response.content
+    
     @abstractmethod
     def check_availability(self) -> bool:
         """Check if the provider is currently available"""
@@ -71,17 +88,65 @@ class AIProvider(ABC):
         }
 
 
+class CircuitBreaker:
+    """Remembers recent rate limits/timeouts/errors of one provider and skips it while open"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.open_until = 0.0
+        self.consecutive_errors = 0
+        self.last_failure: Optional[str] = None
+    
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+    
+    def record_success(self):
+        self.consecutive_errors = 0
+        self.open_until = 0.0
+    
+    def record_failure(self, error: str):
+        from .config import (
+            BREAKER_RATE_LIMIT_COOLDOWN_SECONDS, BREAKER_TIMEOUT_COOLDOWN_SECONDS,
+            BREAKER_ERROR_THRESHOLD, BREAKER_ERROR_COOLDOWN_SECONDS
+        )
+        
+        error_lower = (error or '').lower()
+        self.last_failure = error
+        self.consecutive_errors += 1
+        if '429' in error_lower or 'rate limit' in error_lower or 'quota' in error_lower:
+            cooldown = BREAKER_RATE_LIMIT_COOLDOWN_SECONDS
+        elif 'timed out' in error_lower or 'timeout' in error_lower:
+            cooldown = BREAKER_TIMEOUT_COOLDOWN_SECONDS
+        elif self.consecutive_errors >= BREAKER_ERROR_THRESHOLD:
+            cooldown = BREAKER_ERROR_COOLDOWN_SECONDS
+        else:
+            return
+        self.open_until = time.monotonic() + cooldown
+        print(f"🔌 Circuit breaker OPEN for '{self.name}' ({cooldown}s): {error}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'open': self.is_open(),
+            'retry_in_seconds': max(0, int(self.open_until - time.monotonic())),
+            'consecutive_errors': self.consecutive_errors,
+            'last_failure': self.last_failure
+        }
+
+
 class AIProviderManager:
-    """Manages multiple AI providers with fallback logic"""
+    """Manages multiple AI providers with hedged fallback and per-provider circuit breakers"""
     
     def __init__(self):
         self.providers: Dict[str, AIProvider] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
         self.primary_provider = None
         self.fallback_order = []
+        self._availability: Dict[str, tuple] = {}  # provider -> (checked at, available)
     
     def register_provider(self, provider: AIProvider, is_primary: bool = False):
         """Register an AI provider"""
         self.providers[provider.name] = provider
+        self.breakers[provider.name] = CircuitBreaker(provider.name)
         if is_primary:
             self.primary_provider = provider.name
         if provider.name not in self.fallback_order:
@@ -91,73 +156,129 @@ class AIProviderManager:
         """Get a specific provider by name"""
         return self.providers.get(name)
     
-    async def generate(self, request: AIRequest, preferred_provider: Optional[str] = None) -> AIResponse:
-        """Generate response using preferred provider or fallback chain"""
+    def _check_availability(self, provider_name: str) -> bool:
+        """provider.check_availability(), cached for AVAILABILITY_CHECK_TTL_SECONDS (blocking: run off the loop)"""
+        from .config import AVAILABILITY_CHECK_TTL_SECONDS
         
-        # Determine provider order
-        provider_order = []
+        cached = self._availability.get(provider_name)
+        if cached and time.monotonic() - cached[0] < AVAILABILITY_CHECK_TTL_SECONDS:
+            return cached[1]
+        try:
+            available = bool(self.providers[provider_name].check_availability())
+        except Exception as e:
+            print(f"❌ PROVIDER DEBUG: Availability check for '{provider_name}' failed: {e}")
+            available = False
+        self._availability[provider_name] = (time.monotonic(), available)
+        if not available:
+            print(f"❌ PROVIDER DEBUG: Provider '{provider_name}' not available")
+        return available
+    
+    async def _provider_order(self, preferred_provider: Optional[str]) -> List[str]:
+        """
+        Preferred/primary first, then fallbacks. Fallbacks failing check_availability()
+        (no API key, host unreachable) are dropped - the explicitly preferred provider is
+        always tried - then providers with an open breaker are skipped.
+        """
+        order = []
         if preferred_provider and preferred_provider in self.providers:
-            provider_order.append(preferred_provider)
+            order.append(preferred_provider)
         elif self.primary_provider:
-            provider_order.append(self.primary_provider)
-        
-        # Add fallback providers
+            order.append(self.primary_provider)
         for provider_name in self.fallback_order:
-            if provider_name not in provider_order:
-                provider_order.append(provider_name)
+            if provider_name not in order:
+                order.append(provider_name)
+        
+        to_check = [name for name in order if name != preferred_provider]
+        available = await asyncio.gather(*[asyncio.to_thread(self._check_availability, name) for name in to_check])
+        unavailable = {name for name, ok in zip(to_check, available) if not ok}
+        order = [name for name in order if name not in unavailable]
+        
+        healthy = [name for name in order if not self.breakers[name].is_open()]
+        if not healthy and order:
+            # Everything is cooling down: try the first one anyway rather than failing outright
+            healthy = order[:1]
+        return healthy
+    
+    async def _call_provider(self, provider_name: str, request: AIRequest) -> AIResponse:
+        provider = self.providers[provider_name]
+        try:
+            response = await provider.generate(request)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            response = AIResponse(content="", model=request.model, provider=provider_name, error=str(e))
+        
+        if response.error is None:
+            self.breakers[provider_name].record_success()
+        else:
+            self.breakers[provider_name].record_failure(response.error)
+        return response
+    
+    async def generate(self, request: AIRequest, preferred_provider: Optional[str] = None,
+                       validate: Optional[Callable[[AIResponse], bool]] = None,
+                       hedge_delay_seconds: Optional[float] = None) -> AIResponse:
+        """
+        Generate a response from the first provider that returns a valid answer.
+        The next provider is started when the current ones fail, or - hedging - when
+        none has answered after hedge_delay_seconds; the slower calls are cancelled.
+        
+        Args:
+            validate: Optional check on a successful response (e.g. "looks like SQL");
+                      rejected responses count as failures and trigger the next provider
+            hedge_delay_seconds: Defaults to HEDGE_DELAY_SECONDS; None/0 in config disables hedging
+        """
+        from .config import HEDGE_DELAY_SECONDS
+        
+        if hedge_delay_seconds is None:
+            hedge_delay_seconds = HEDGE_DELAY_SECONDS
+        
+        provider_order = await self._provider_order(preferred_provider)
+        print(f"🔍 PROVIDER DEBUG: Trying providers in order: {provider_order} (hedge after {hedge_delay_seconds}s)")
         
-        # Try each provider in order
         last_error = None
-
-        print(f"🔍 PROVIDER DEBUG: Trying providers in order: {provider_order}")
-        print(f"🔍 PROVIDER DEBUG: Preferred provider: {preferred_provider}")
-        print(f"🔍 PROVIDER DEBUG: Request model: {request.model}")
-
-        for provider_name in provider_order:
-            provider = self.providers.get(provider_name)
-            if not provider:
-                print(f"❌ PROVIDER DEBUG: Provider '{provider_name}' not found")
-                continue
-
-            print(f"🔄 PROVIDER DEBUG: Trying provider '{provider_name}'...")
-
-            try:
-                # Skip availability check if this is the explicitly preferred provider
-                # This prevents fallback when user specifically requests a provider
-                is_preferred = (preferred_provider and provider_name == preferred_provider)
-
-                if not is_preferred:
-                    # Only check availability for fallback providers
-                    print(f"🔍 PROVIDER DEBUG: Checking availability for '{provider_name}'...")
-                    if not provider.check_availability():
-                        print(f"❌ PROVIDER DEBUG: Provider '{provider_name}' not available")
-                        continue
-                    print(f"✅ PROVIDER DEBUG: Provider '{provider_name}' is available")
-                else:
-                    print(f"⚡ PROVIDER DEBUG: Skipping availability check for preferred provider '{provider_name}'")
-
-                # Generate response
-                print(f"🚀 PROVIDER DEBUG: Calling {provider_name}.generate()...")
-                response = await provider.generate(request)
-                print(f"📥 PROVIDER DEBUG: Response from '{provider_name}': error={response.error}, provider={response.provider}")
-
-                if response.error is None:
-                    print(f"✅ PROVIDER DEBUG: SUCCESS with '{provider_name}'")
-                    return response
-                else:
-                    last_error = response.error
-                    # If this was the preferred provider and it failed, try fallbacks
-                    if is_preferred:
-                        print(f"⚠️ PREFERRED PROVIDER '{provider_name}' FAILED: {response.error}")
-                    else:
-                        print(f"⚠️ Provider '{provider_name}' failed: {response.error}")
-
-            except Exception as e:
-                last_error = str(e)
-                print(f"❌ PROVIDER DEBUG: Exception with '{provider_name}': {e}")
-                if preferred_provider and provider_name == preferred_provider:
-                    print(f"⚠️ PREFERRED PROVIDER '{provider_name}' EXCEPTION: {e}")
-                continue
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        
+        def start_next():
+            nonlocal next_index
+            provider_name = provider_order[next_index]
+            next_index += 1
+            print(f"🚀 PROVIDER DEBUG: Calling {provider_name}.generate()...")
+            pending[asyncio.ensure_future(self._call_provider(provider_name, request))] = provider_name
+        
+        try:
+            if provider_order:
+                start_next()
+            
+            while pending:
+                can_hedge = hedge_delay_seconds and next_index < len(provider_order)
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=hedge_delay_seconds if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    print(f"⏱️ PROVIDER DEBUG: No answer after {hedge_delay_seconds}s, hedging with '{provider_order[next_index]}'")
+                    start_next()
+                    continue
+                
+                for task in done:
+                    provider_name = pending.pop(task)
+                    response = task.result()
+                    if response.error is None and (validate is None or validate(response)):
+                        print(f"✅ PROVIDER DEBUG: SUCCESS with '{provider_name}'")
+                        return response
+                    last_error = response.error or f"{provider_name} returned an invalid response"
+                    print(f"⚠️ Provider '{provider_name}' failed: {last_error}")
+                
+                # Sequential fallback once nothing is in flight
+                if not pending and next_index < len(provider_order):
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
         
         # All providers failed
         return AIResponse(
@@ -167,9 +288,50 @@ class AIProviderManager:
             error=f"All AI providers failed. Last error: {last_error}"
         )
     
+    async def generate_stream(self, request: AIRequest,
+                              preferred_provider: Optional[str] = None) -> AsyncIterator[AIResponse]:
+        """
+        Stream a response as AIResponse chunks (content = next piece of text).
+        Falls back to the next provider only until the first chunk has been sent -
+        text already shown can't be taken back, so a later failure raises AIProviderError.
+        No hedging here: two streams racing would both produce visible output.
+        """
+        last_error = None
+        
+        for provider_name in await self._provider_order(preferred_provider):
+            provider = self.providers[provider_name]
+            breaker = self.breakers[provider_name]
+            started = False
+            print(f"🚀 PROVIDER DEBUG: Streaming from {provider_name}...")
+            try:
+                async for text in provider.generate_stream(request):
+                    if not text:
+                        continue
+                    started = True
+                    yield AIResponse(content=text, model=request.model, provider=provider_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = str(e)
+                breaker.record_failure(last_error)
+                print(f"⚠️ Provider '{provider_name}' stream failed: {last_error}")
+                if started:
+                    raise AIProviderError(last_error)
+                continue
+            
+            breaker.record_success()
+            if started:
+                return
+            last_error = f"{provider_name} returned an empty response"
+        
+        raise AIProviderError(f"All AI providers failed. Last error: {last_error}")
+    
     def get_all_status(self) -> Dict[str, Dict[str, Any]]:
         """Get status of all registered providers"""
-        return {name: provider.get_status() for name, provider in self.providers.items()}
+        return {
+            name: {**provider.get_status(), 'circuit_breaker': self.breakers[name].get_status()}
+            for name, provider in self.providers.items()
+        }
 
 
 # Global provider manager instance
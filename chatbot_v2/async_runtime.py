@@ -0,0 +1,184 @@
+"""
+Async runtime for the chatbot
+One long-lived event loop runs in a daemon thread per process, and each AI
+provider keeps a pooled aiohttp session on it, so repeated questions reuse
+DNS lookups and keep-alive TLS connections instead of paying the setup cost
+on every call. Flask routes (sync) submit coroutines with run_async(), or
+iterate async generators with iter_async() for streamed responses.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import queue
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, Optional
+
+import aiohttp
+
+# Connection pool settings per provider session
+HTTP_CONNECTION_LIMIT = 10        # Concurrent connections per provider
+HTTP_KEEPALIVE_SECONDS = 60       # Idle keep-alive before a connection is closed
+HTTP_DNS_CACHE_SECONDS = 300
+
+
+class AsyncRuntime:
+    """Background event loop thread plus the aiohttp sessions that live on it"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.pid = os.getpid()
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._thread = threading.Thread(target=self._run, name="chatbot-async-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the background loop without waiting for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the background loop and block until it finishes"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def get_session(self, name: str) -> aiohttp.ClientSession:
+        """Pooled session for one provider; must be called from the runtime's loop"""
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_CONNECTION_LIMIT,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[name] = session
+        return session
+
+    async def _close_sessions(self):
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+    def shutdown(self):
+        if not self.loop.is_running():
+            return
+        try:
+            self.run(self._close_sessions(), timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """Process-wide runtime, recreated after a fork (Gunicorn workers)"""
+    global _runtime
+
+    runtime = _runtime
+    if runtime is not None and runtime.pid == os.getpid():
+        return runtime
+
+    with _runtime_lock:
+        if _runtime is None or _runtime.pid != os.getpid():
+            _runtime = AsyncRuntime()
+        return _runtime
+
+
+async def _in_app_context(app, coro: Awaitable[Any]) -> Any:
+    # Each task has its own contextvars copy, so this context is private to the coroutine
+    with app.app_context():
+        return await coro
+
+
+def run_async(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Sync bridge used by the Flask routes instead of a new event loop per call.
+    The caller's app context is re-pushed on the loop so coroutines can use db/current_app.
+    """
+    from flask import current_app, has_app_context
+
+    if has_app_context():
+        coro = _in_app_context(current_app._get_current_object(), coro)
+    return get_runtime().run(coro, timeout)
+
+
+class _StreamFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STREAM_END = object()
+
+
+def iter_async(agen: AsyncIterator[Any], timeout: Optional[float] = None) -> Iterator[Any]:
+    """
+    Sync iterator over an async generator, for streamed Flask responses.
+    The generator runs as a single task on the runtime loop (inside the caller's
+    app context) and hands items over through a queue; closing the iterator -
+    e.g. when the client disconnects - cancels the task. timeout applies per item.
+    """
+    from flask import current_app, has_app_context
+
+    items: "queue.Queue[Any]" = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except Exception as e:
+            items.put(_StreamFailed(e))
+        finally:
+            items.put(_STREAM_END)
+
+    coro = pump()
+    if has_app_context():
+        coro = _in_app_context(current_app._get_current_object(), coro)
+    future = get_runtime().submit(coro)
+
+    try:
+        while True:
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No streamed output for {timeout}s")
+            if item is _STREAM_END:
+                return
+            if isinstance(item, _StreamFailed):
+                raise item.error
+            yield item
+    finally:
+        future.cancel()
+
+
+@asynccontextmanager
+async def provider_session(name: str) -> AsyncIterator[aiohttp.ClientSession]:
+    """
+    Pooled aiohttp session for a provider (not closed on exit). Coroutines driven
+    by some other loop (e.g. asyncio.run in a script) get a one-off session instead,
+    since a session is bound to the loop it was created on.
+    """
+    runtime = _runtime
+    if runtime is not None and asyncio.get_running_loop() is runtime.loop:
+        yield runtime.get_session(name)
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+
+@atexit.register
+def _shutdown_runtime():
+    if _runtime is not None and _runtime.pid == os.getpid():
+        _runtime.shutdown()
@@ -24,8 +24,37 @@ CHATBOT_ENABLE_GROQ = os.environ.get('CHATBOT_ENABLE_GROQ', 'true').lower() == '
 # Query Settings
 MAX_QUERY_TIMEOUT_SECONDS = 30
 MAX_RESULT_ROWS = 1000
+MAX_RESULT_BYTES = 5 * 1024 * 1024  # Approximate in-memory size cap for one result set
+QUERY_POOL_SIZE = 4                 # Read-only SQLite connections kept open per process
+QUERY_PROGRESS_INTERVAL = 10000     # SQLite VM steps between deadline checks
+SQL_CACHE_MAX_ENTRIES = 500         # Question -> SQL cache size (LRU)
+SQL_CACHE_TTL_SECONDS = 7 * 24 * 3600
+SQL_CACHE_WARM_LIMIT = 500          # Recent successful QueryLog rows loaded into the cache
+SQL_CACHE_WARM_MAX_AGE_SECONDS = 24 * 3600  # Older QueryLog rows are not warmed
+RESULT_CACHE_MAX_ENTRIES = 200      # Query results kept per process (LRU)
+RESULT_CACHE_MAX_BYTES = 20 * 1024 * 1024
+RESULT_CACHE_TTL_SECONDS = 3600     # Upper bound even when the data version has not moved
+RESULT_CACHE_NOW_TTL_SECONDS = 60   # For SQL using 'now' / CURRENT_* (answer changes with the clock)
+SCHEMA_CONTEXT_TOKEN_BUDGET = 1200  # Approximate tokens of schema text per SQL prompt
+# Tables never shown to the model (internal, logging and security tables)
+SCHEMA_CONTEXT_EXCLUDED_TABLES = [
+    'alembic_version', 'admin', 'setting', '*_log', 'api_audit_*', 'log_archive_summary', 'export_job',
+    'push_subscription', 'data_version', 'query_log*', 'chat_*', 'ebank_payment'
+]
+# Columns left out of the schema text (files, templates, integration secrets)
+SCHEMA_CONTEXT_HIDDEN_COLUMNS = ['*_filename', 'email_templates', 'discord_*', 'stripe_checkout_session_id', 'form_data', 'form_url']
+
 DEFAULT_AI_MODEL = 'gemini-2.5-flash'  # Gemini 2.5 Flash (WORKS! Free tier available)
 
+# Provider fallback: hedged requests + circuit breaker (see AIProviderManager.generate)
+HEDGE_DELAY_SECONDS = float(os.environ.get('CHATBOT_HEDGE_DELAY_SECONDS', 4))  # Start the next provider if no answer yet
+BREAKER_RATE_LIMIT_COOLDOWN_SECONDS = 60   # Skip a provider this long after a 429
+BREAKER_TIMEOUT_COOLDOWN_SECONDS = 30      # ... after a timeout
+BREAKER_ERROR_THRESHOLD = 3                # Consecutive other errors before the breaker opens
+BREAKER_ERROR_COOLDOWN_SECONDS = 30
+AVAILABILITY_CHECK_TTL_SECONDS = 300      # Cache of provider.check_availability() for fallback providers
+STREAM_IDLE_TIMEOUT_SECONDS = 60           # /chatbot/ask/stream gives up if no event arrives for this long
+
 # Model preferences (in order of preference)
 # Note: Groq is used as automatic fallback when Gemini hits rate limits
 # Updated Jan 2026: Gemini 1.5/2.0 models retired Sept 2025, use 2.5 series
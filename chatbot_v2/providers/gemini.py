@@ -6,10 +6,11 @@ import asyncio
 import aiohttp
 import json
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 
-from ..ai_providers import AIProvider, AIRequest, AIResponse
+from ..ai_providers import AIProvider, AIRequest, AIResponse, AIProviderError
+from ..async_runtime import provider_session
 from ..config import DEFAULT_AI_MODEL
 
 
@@ -50,34 +51,10 @@ class GeminiProvider(AIProvider):
 
         try:
             # Determine which model to use
-            model = request.model if request.model and 'gemini' in request.model else self.default_model
+            model, model_path = self._resolve_model(request)
             print(f"🔍 GEMINI PROVIDER: Selected model='{model}' (request had '{request.model}', default is '{self.default_model}')")
 
-            # Ensure model name doesn't already have "models/" prefix
-            if not model.startswith('models/'):
-                model_path = f"models/{model}"
-            else:
-                model_path = model
-
-            # Prepare the prompt
-            full_prompt = request.prompt
-            if request.system_prompt:
-                full_prompt = f"{request.system_prompt}\n\n{request.prompt}"
-
-            # Gemini API payload format
-            payload = {
-                "contents": [{
-                    "parts": [{
-                        "text": full_prompt
-                    }]
-                }],
-                "generationConfig": {
-                    "temperature": request.temperature,
-                    "maxOutputTokens": request.max_tokens,
-                    "topP": 0.95,
-                    "topK": 40
-                }
-            }
+            payload = self._build_payload(request)
 
             # API endpoint with proper model path
             endpoint = f"{self.base_url}/{model_path}:generateContent?key={self.api_key}"
@@ -85,8 +62,8 @@ class GeminiProvider(AIProvider):
 
             # Make request to Gemini
             timeout = aiohttp.ClientTimeout(total=request.timeout_seconds)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(endpoint, json=payload) as response:
+            async with provider_session(self.name) as session:
+                async with session.post(endpoint, json=payload, timeout=timeout) as response:
                     response_text = await response.text()
 
                     if response.status != 200:
@@ -178,6 +155,74 @@ class GeminiProvider(AIProvider):
                 error=f"Gemini connection error: {str(e)}"
             )
 
+    def _resolve_model(self, request: AIRequest) -> tuple[str, str]:
+        """Model name and its "models/..." API path"""
+        model = request.model if request.model and 'gemini' in request.model else self.default_model
+
+        # Ensure model name doesn't already have "models/" prefix
+        if not model.startswith('models/'):
+            model_path = f"models/{model}"
+        else:
+            model_path = model
+        return model, model_path
+
+    def _build_payload(self, request: AIRequest) -> Dict[str, Any]:
+        """Gemini API payload format"""
+        # Prepare the prompt
+        full_prompt = request.prompt
+        if request.system_prompt:
+            full_prompt = f"{request.system_prompt}\n\n{request.prompt}"
+
+        return {
+            "contents": [{
+                "parts": [{
+                    "text": full_prompt
+                }]
+            }],
+            "generationConfig": {
+                "temperature": request.temperature,
+                "maxOutputTokens": request.max_tokens,
+                "topP": 0.95,
+                "topK": 40
+            }
+        }
+
+    async def generate_stream(self, request: AIRequest) -> AsyncIterator[str]:
+        """Stream text chunks via streamGenerateContent (server-sent events)"""
+        if not self.api_key:
+            raise AIProviderError("Gemini API key not configured")
+
+        _, model_path = self._resolve_model(request)
+        endpoint = f"{self.base_url}/{model_path}:streamGenerateContent?alt=sse&key={self.api_key}"
+        print(f"🚀 GEMINI PROVIDER: Streaming from {self.base_url}/{model_path}:streamGenerateContent")
+
+        try:
+            timeout = aiohttp.ClientTimeout(total=request.timeout_seconds)
+            async with provider_session(self.name) as session:
+                async with session.post(endpoint, json=self._build_payload(request), timeout=timeout) as response:
+                    if response.status != 200:
+                        response_text = await response.text()
+                        try:
+                            error_message = json.loads(response_text).get('error', {}).get('message', response_text)
+                        except ValueError:
+                            error_message = response_text
+                        raise AIProviderError(f"Gemini API error ({response.status}): {error_message}")
+
+                    async for raw_line in response.content:
+                        line = raw_line.decode('utf-8').strip()
+                        if not line.startswith('data:'):
+                            continue
+                        data = json.loads(line[5:])
+                        for candidate in data.get('candidates', [])[:1]:
+                            for part in candidate.get('content', {}).get('parts', []):
+                                if part.get('text'):
+                                    yield part['text']
+
+        except asyncio.TimeoutError:
+            raise AIProviderError("Request timed out")
+        except aiohttp.ClientError as e:
+            raise AIProviderError(f"Gemini connection error: {str(e)}")
+
     def check_availability(self) -> bool:
         """Check if Gemini API is available"""
         if not self.api_key:
@@ -6,10 +6,11 @@ import asyncio
 import aiohttp
 import json
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 
-from ..ai_providers import AIProvider, AIRequest, AIResponse
+from ..ai_providers import AIProvider, AIRequest, AIResponse, AIProviderError
+from ..async_runtime import provider_session
 from ..config import DEFAULT_AI_MODEL
 
 
@@ -53,36 +54,14 @@ class GroqProvider(AIProvider):
 
         try:
             # Determine which model to use
-            model = request.model if request.model and 'llama' in request.model.lower() or 'mixtral' in request.model.lower() or 'gemma' in request.model.lower() else self.default_model
-
-            # Build messages array
-            messages = []
-            if request.system_prompt:
-                messages.append({
-                    "role": "system",
-                    "content": request.system_prompt
-                })
-            messages.append({
-                "role": "user",
-                "content": request.prompt
-            })
-
-            # Prepare request payload (OpenAI-compatible format)
-            payload = {
-                "model": model,
-                "messages": messages,
-                "temperature": request.temperature,
-                "max_tokens": request.max_tokens,
-            }
+            model = self._resolve_model(request)
+            payload = self._build_payload(request, model)
 
             # Make async HTTP request
             endpoint = f"{self.base_url}/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            headers = self._headers()
 
-            async with aiohttp.ClientSession() as session:
+            async with provider_session(self.name) as session:
                 async with session.post(
                     endpoint,
                     headers=headers,
@@ -165,6 +144,73 @@ class GroqProvider(AIProvider):
                 error=f"Groq API unexpected error: {str(e)}"
             )
 
+    def _resolve_model(self, request: AIRequest) -> str:
+        return request.model if request.model and 'llama' in request.model.lower() or 'mixtral' in request.model.lower() or 'gemma' in request.model.lower() else self.default_model
+
+    def _build_payload(self, request: AIRequest, model: str) -> Dict[str, Any]:
+        """Request payload (OpenAI-compatible format)"""
+        # Build messages array
+        messages = []
+        if request.system_prompt:
+            messages.append({
+                "role": "system",
+                "content": request.system_prompt
+            })
+        messages.append({
+            "role": "user",
+            "content": request.prompt
+        })
+
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens,
+        }
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def generate_stream(self, request: AIRequest) -> AsyncIterator[str]:
+        """Stream text chunks (OpenAI-compatible "stream": true server-sent events)"""
+        if not self.api_key:
+            raise AIProviderError("Groq API key not configured")
+
+        payload = self._build_payload(request, self._resolve_model(request))
+        payload["stream"] = True
+
+        try:
+            async with provider_session(self.name) as session:
+                async with session.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self._headers(),
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=request.timeout_seconds)
+                ) as response:
+                    if response.status == 429:
+                        raise AIProviderError(f"Groq API rate limit (429): {await response.text()}")
+                    if response.status != 200:
+                        raise AIProviderError(f"Groq API error ({response.status}): {await response.text()}")
+
+                    async for raw_line in response.content:
+                        line = raw_line.decode('utf-8').strip()
+                        if not line.startswith('data:'):
+                            continue
+                        line = line[5:].strip()
+                        if line == '[DONE]':
+                            break
+                        delta = json.loads(line).get('choices', [{}])[0].get('delta', {})
+                        if delta.get('content'):
+                            yield delta['content']
+
+        except asyncio.TimeoutError:
+            raise AIProviderError("Groq API request timed out")
+        except aiohttp.ClientError as e:
+            raise AIProviderError(f"Groq API connection error: {str(e)}")
+
     def check_availability(self) -> bool:
         """Check if Groq API is available"""
         if not self.api_key:
@@ -6,10 +6,11 @@ import asyncio
 import aiohttp
 import json
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 
-from ..ai_providers import AIProvider, AIRequest, AIResponse
+from ..ai_providers import AIProvider, AIRequest, AIResponse, AIProviderError
+from ..async_runtime import provider_session
 from ..config import OLLAMA_BASE_URL, DEFAULT_AI_MODEL
 
 
@@ -44,10 +45,11 @@ class OllamaProvider(AIProvider):
             
             # Make request to Ollama
             timeout = aiohttp.ClientTimeout(total=request.timeout_seconds)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with provider_session(self.name) as session:
                 async with session.post(
                     f"{self.base_url}/api/generate",
-                    json=payload
+                    json=payload,
+                    timeout=timeout
                 ) as response:
                     if response.status != 200:
                         error_text = await response.text()
@@ -100,6 +102,45 @@ class OllamaProvider(AIProvider):
                 error=f"Ollama connection error: {str(e)}"
             )
     
+    async def generate_stream(self, request: AIRequest) -> AsyncIterator[str]:
+        """Stream text chunks ("stream": true returns one JSON object per line)"""
+        full_prompt = request.prompt
+        if request.system_prompt:
+            full_prompt = f"{request.system_prompt}\n\n{request.prompt}"
+        
+        payload = {
+            "model": request.model or DEFAULT_AI_MODEL,
+            "prompt": full_prompt,
+            "stream": True,
+            "options": {
+                "temperature": request.temperature,
+                "num_predict": request.max_tokens
+            }
+        }
+        
+        try:
+            timeout = aiohttp.ClientTimeout(total=request.timeout_seconds)
+            async with provider_session(self.name) as session:
+                async with session.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout) as response:
+                    if response.status != 200:
+                        raise AIProviderError(f"Ollama API error: {response.status} - {await response.text()}")
+                    
+                    async for raw_line in response.content:
+                        if not raw_line.strip():
+                            continue
+                        data = json.loads(raw_line)
+                        if data.get("error"):
+                            raise AIProviderError(f"Ollama API error: {data['error']}")
+                        if data.get("response"):
+                            yield data["response"]
+                        if data.get("done"):
+                            break
+                    
+        except asyncio.TimeoutError:
+            raise AIProviderError("Request timed out")
+        except aiohttp.ClientError as e:
+            raise AIProviderError(f"Ollama connection error: {str(e)}")
+    
     def check_availability(self) -> bool:
         """Check if Ollama server is available"""
         try:
@@ -5,13 +5,14 @@ Handles SQL generation, execution, and result formatting
 import asyncio
 import json
 import time
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from flask import current_app
 
 from .ai_providers import provider_manager, AIRequest
 from .security import QueryExecutor, PIIDetector
-from .config import MAX_QUERY_TIMEOUT_SECONDS
+from .sql_cache import sql_cache, schema_fingerprint
+from .schema_context import schema_context
+from .config import MAX_QUERY_TIMEOUT_SECONDS, DEFAULT_AI_MODEL
 
 
 class QueryEngine:
@@ -20,24 +21,49 @@ class QueryEngine:
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.executor = QueryExecutor(db_path)
-        self.schema_cache = None
-        self.schema_cache_time = None
     
     async def process_question(self, question: str, admin_email: str,
                              preferred_provider: Optional[str] = None,
-                             preferred_model: Optional[str] = None) -> Dict[str, Any]:
-        """Process a natural language question and return structured results"""
+                             preferred_model: Optional[str] = None,
+                             on_sql: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Process a natural language question and return structured results.
+        on_sql(sql_result) is called once per question for the SQL that actually runs (used for streaming):
+        freshly generated SQL is announced before it runs, a cached one only after it has succeeded.
+        """
 
         start_time = time.time()
 
         try:
-            # 1. Generate SQL from natural language
-            sql_result = await self._generate_sql(question, preferred_provider, preferred_model)
-            if not sql_result['success']:
-                return sql_result
-            
-            # 2. Execute the SQL query
-            query_result = self.executor.execute_query(sql_result['sql'])
+            # 1. Reuse SQL generated earlier for the same question, else ask the LLM
+            cache_model = preferred_model or DEFAULT_AI_MODEL
+            schema_hash = await asyncio.to_thread(self._get_schema_hash)
+            # Off the loop: the first lookup per schema/model warms the cache from QueryLog
+            sql_result = await asyncio.to_thread(self._get_cached_sql, question, schema_hash, cache_model)
+            query_result = None
+
+            if sql_result:
+                query_result = await asyncio.to_thread(self.executor.execute_query, sql_result['sql'])
+                if not query_result['success']:
+                    # Stale entry (e.g. data-dependent SQL that now fails) - regenerate below
+                    sql_cache.evict(question, schema_hash, cache_model)
+                    sql_result = query_result = None
+                elif on_sql:
+                    # Only announced once it has run, so a stale entry never reaches the client
+                    on_sql(sql_result)
+
+            if sql_result is None:
+                sql_result = await self._generate_sql(question, preferred_provider, preferred_model, schema_hash)
+                if not sql_result['success']:
+                    return sql_result
+                if on_sql:
+                    on_sql(sql_result)
+
+                # 2. Execute the SQL query (off the event loop so other questions keep moving)
+                query_result = await asyncio.to_thread(self.executor.execute_query, sql_result['sql'])
+                if query_result['success'] and schema_hash:
+                    sql_cache.put(question, schema_hash, cache_model, sql_result['sql'],
+                                  ai_provider=sql_result.get('ai_provider'), ai_model=sql_result.get('ai_model'))
             
             # 3. Format and enrich the results
             formatted_result = self._format_results(query_result, question)
@@ -54,13 +80,14 @@ class QueryEngine:
                 'ai_model': sql_result.get('ai_model'),
                 'tokens_used': sql_result.get('tokens_used', 0),
                 'cost_cents': sql_result.get('cost_cents', 0),
+                'sql_cache_hit': sql_result.get('cache_hit', False),
                 'processing_time_ms': total_time_ms,
                 'admin_email': admin_email,
                 **formatted_result
             }
 
-            # 6. Log the query for monitoring
-            log_id = self._log_query(final_result)
+            # 6. Log the query for monitoring (a DB commit - kept off the shared event loop)
+            log_id = await asyncio.to_thread(self._log_query, final_result)
             if log_id:
                 final_result['query_log_id'] = log_id
 
@@ -75,16 +102,58 @@ class QueryEngine:
                 'processing_time_ms': int((time.time() - start_time) * 1000)
             }
     
+    def _get_schema_hash(self) -> Optional[str]:
+        """Fingerprint of the current schema (None if the database can't be read)"""
+        pool = self.executor.pool
+        try:
+            conn = pool.acquire()
+        except Exception:
+            return None
+        try:
+            return schema_fingerprint(conn)
+        except Exception:
+            return None
+        finally:
+            pool.release(conn)
+
+    def _get_cached_sql(self, question: str, schema_hash: Optional[str], model: str) -> Optional[Dict[str, Any]]:
+        """SQL previously generated for this question/schema/model, shaped like _generate_sql's result"""
+        if not schema_hash:
+            return None
+
+        try:
+            warmed = sql_cache.warm_from_query_log(schema_hash, model)
+            if warmed:
+                print(f"🧊 SQL cache warmed with {warmed} queries from QueryLog")
+        except Exception as e:
+            current_app.logger.warning(f"SQL cache warm-up failed: {e}")
+
+        entry = sql_cache.get(question, schema_hash, model)
+        if not entry:
+            return None
+
+        print(f"⚡ SQL cache hit: {entry['sql']}")
+        return {
+            'success': True,
+            'sql': entry['sql'],
+            'ai_provider': entry.get('ai_provider'),
+            'ai_model': entry.get('ai_model'),
+            'tokens_used': 0,
+            'cost_cents': 0,
+            'cache_hit': True
+        }
+
     async def _generate_sql(self, question: str, preferred_provider: Optional[str] = None,
-                          preferred_model: Optional[str] = None) -> Dict[str, Any]:
+                          preferred_model: Optional[str] = None,
+                          schema_hash: Optional[str] = None) -> Dict[str, Any]:
         """Generate SQL query from natural language question"""
 
         try:
-            # Get database schema
-            schema = self._get_database_schema()
+            # Only the tables relevant to this question, within the token budget
+            schema_text = await asyncio.to_thread(self._get_schema_context, question, schema_hash)
 
             # Create simple system prompt with schema
-            system_prompt = self._create_system_prompt(schema)
+            system_prompt = self._create_system_prompt(schema_text)
 
             # Create AI request
             final_model = preferred_model or 'dolphin-mistral:latest'
@@ -101,7 +170,11 @@ class QueryEngine:
 
             # Generate SQL using AI
             print(f"🚀 QUERY_ENGINE DEBUG: Calling provider_manager.generate(preferred_provider='{preferred_provider}', model='{final_model}')")
-            ai_response = await provider_manager.generate(ai_request, preferred_provider)
+            # Hedged across providers: the first answer that contains a SELECT wins
+            ai_response = await provider_manager.generate(
+                ai_request, preferred_provider,
+                validate=lambda response: self._looks_like_sql(response.content)
+            )
             print(f"📥 QUERY_ENGINE DEBUG: Got response from provider='{ai_response.provider}', model='{ai_response.model}', error='{ai_response.error}'")
             
             if ai_response.error:
@@ -131,59 +204,26 @@ class QueryEngine:
                 'error': f"SQL generation error: {str(e)}"
             }
     
-    def _get_database_schema(self) -> Dict[str, List[Dict[str, str]]]:
-        """Get database schema information with caching"""
-        
-        # Return cached schema if still valid (cache for 1 hour)
-        if (self.schema_cache and self.schema_cache_time and 
-            (datetime.now() - self.schema_cache_time).seconds < 3600):
-            return self.schema_cache
-        
-        try:
-            import sqlite3
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            schema = {}
-
-            # Get all table and view names
-            cursor.execute("""
-                SELECT name, type FROM sqlite_master
-                WHERE (type='table' OR type='view') AND name NOT LIKE 'sqlite_%'
-                ORDER BY type DESC, name
-            """)
-
-            objects = cursor.fetchall()
-
-            for (object_name, object_type) in objects:
-                # Get column information for each table/view
-                cursor.execute(f"PRAGMA table_info({object_name})")
-                columns = cursor.fetchall()
-
-                schema[object_name] = [
-                    {
-                        'name': col[1],
-                        'type': col[2],
-                        'nullable': not col[3],
-                        'primary_key': bool(col[5])
-                    }
-                    for col in columns
-                ]
-            
-            conn.close()
-            
-            # Cache the schema
-            self.schema_cache = schema
-            self.schema_cache_time = datetime.now()
-            
-            print(f"✅ Schema fetched successfully: {len(schema)} tables")
-            return schema
-            
-        except Exception as e:
-            # Return a basic schema if we can't fetch the real one
-            current_app.logger.error(f"Failed to fetch database schema from {self.db_path}: {e}")
-            print(f"❌ Schema fetch failed: {e}")
-            return self._get_fallback_schema()
+    def _get_schema_context(self, question: str, schema_hash: Optional[str]) -> str:
+        """Compact schema text for the prompt (table fragments cached per schema fingerprint)"""
+        if schema_hash:
+            pool = self.executor.pool
+            try:
+                conn = pool.acquire()
+                try:
+                    return schema_context.build(question, schema_hash, conn)
+                finally:
+                    pool.release(conn)
+            except Exception as e:
+                current_app.logger.error(f"Failed to fetch database schema from {self.db_path}: {e}")
+                print(f"❌ Schema fetch failed: {e}")
+
+        # Return a basic schema if we can't fetch the real one
+        fallback = {
+            name: {'type': 'table', 'columns': columns, 'foreign_keys': {}}
+            for name, columns in self._get_fallback_schema().items()
+        }
+        return schema_context.select(question, fallback)
     
     def _get_fallback_schema(self) -> Dict[str, List[Dict[str, str]]]:
         """Fallback schema when we can't fetch from database"""
@@ -265,19 +305,9 @@ class QueryEngine:
             ]
         }
     
-    def _create_system_prompt(self, schema: Dict[str, List[Dict[str, str]]]) -> str:
+    def _create_system_prompt(self, schema_text: str) -> str:
         """Create minimal system prompt with just schema and basic rules"""
 
-        schema_text = "DATABASE SCHEMA:\n\n"
-
-        for table_name, columns in schema.items():
-            schema_text += f"Table: {table_name}\n"
-            for col in columns:
-                pk_marker = " (PRIMARY KEY)" if col['primary_key'] else ""
-                null_marker = " (NULLABLE)" if col['nullable'] else " (NOT NULL)"
-                schema_text += f"  - {col['name']}: {col['type']}{pk_marker}{null_marker}\n"
-            schema_text += "\n"
-
         return f"""You are a SQL query generator for a Minipass activity management platform.
 
 {schema_text}
@@ -323,6 +353,10 @@ QUERY RULES:
 
 Generate the SQL query for the following question:"""
 
+    def _looks_like_sql(self, raw_sql: str) -> bool:
+        """Cheap sanity check used to reject non-SQL answers from a provider"""
+        return self._clean_generated_sql(raw_sql or '').upper().startswith(('SELECT', 'WITH'))
+
     def _clean_generated_sql(self, raw_sql: str) -> str:
         """Clean and normalize generated SQL"""
 
@@ -476,6 +510,7 @@ Generate the SQL query for the following question:"""
             'columns': formatted_columns,  # Return formatted column names
             'rows': rows,  # Return formatted rows
             'row_count': len(data),
+            'truncated': query_result.get('truncated', False),
             'chart_suggestion': chart_suggestion,
             'sql_executed': query_result.get('sql_executed')
         }
@@ -0,0 +1,161 @@
+"""
+Result cache for chatbot SQL, keyed by data version
+Triggers on the tracked tables bump per-table counters in data_version (see
+task45 in migrations/upgrade_production_database.py). A cached result is served
+while the counters of every table the query reads are unchanged, so repeated
+questions over the financial views skip re-running the query until the data
+actually changes. The tables a query reads are collected by SQLite itself
+(an authorizer while the statement is prepared), so comma joins, quoted names,
+subqueries, CTEs and views are all covered. Queries touching untracked tables
+are never cached.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from .config import (
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_NOW_TTL_SECONDS
+)
+
+TIME_DEPENDENT_PATTERN = re.compile(r"(?i)'now'|\bcurrent_(?:date|time|timestamp)\b")
+
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace- and keyword-case-insensitive form of a query (string literals kept as-is)"""
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(';'))
+    return ''.join(part if part.startswith("'") else ' '.join(part.split()).lower() for part in parts)
+
+
+def read_tables(conn: sqlite3.Connection, sql: str) -> Optional[set]:
+    """
+    Base tables a query reads, as reported by SQLite (SQLITE_READ) while it
+    prepares EXPLAIN <sql> - nothing is executed. Views are reported along with
+    their source tables and are dropped. None if the statement can't be prepared.
+    """
+    found = set()
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        if action == sqlite3.SQLITE_READ and arg1:
+            found.add(arg1.lower())
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.set_authorizer(None)
+
+    views = {name.lower() for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+    return found - views
+
+
+def read_data_versions(conn: sqlite3.Connection) -> Optional[Dict[str, int]]:
+    """Current per-table counters, or None when the data_version table is not installed"""
+    try:
+        return {name: version for name, version in conn.execute("SELECT table_name, version FROM data_version")}
+    except sqlite3.OperationalError:
+        return None
+
+
+def advance_data_versions(db_path: str, past: Optional[Dict[str, int]]) -> None:
+    """
+    After the database file was replaced (restore), lift every counter above the
+    highest one read before (`past`): the restored counters are older, and once
+    they climbed back to a value cached earlier - in any worker process - the
+    pre-restore results would match their version key again.
+    """
+    if not past:
+        return
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE data_version SET version = version + ?", (max(past.values()) + 1,))
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass  # Restored database predates the data_version table
+    finally:
+        conn.close()
+
+
+class QueryResultCache:
+    """Thread-safe LRU of query results, bounded by entry count and approximate bytes"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version_key(tables: Optional[set], versions: Optional[Dict[str, int]]) -> Optional[Tuple]:
+        """Versions of every table the query reads (see read_tables); None if any of them is not tracked"""
+        if versions is None or tables is None:
+            return None
+        if not tables or not tables.issubset(versions):
+            return None
+        return tuple(sorted((table, versions[table]) for table in tables))
+
+    def get(self, sql: str, version_key: Tuple) -> Optional[Dict[str, Any]]:
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry['version_key'] != version_key or time.monotonic() > entry['expires_at']:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['result']
+
+    def put(self, sql: str, version_key: Tuple, result: Dict[str, Any]):
+        size = result.get('result_bytes') or 0
+        if size > self.max_bytes // 4:
+            return  # One huge result would evict everything else
+
+        ttl = RESULT_CACHE_NOW_TTL_SECONDS if TIME_DEPENDENT_PATTERN.search(sql) else RESULT_CACHE_TTL_SECONDS
+        key = normalize_sql(sql)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                'version_key': version_key,
+                'expires_at': time.monotonic() + ttl,
+                'size': size,
+                'result': result,
+            }
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Process-wide cache shared by every QueryExecutor
+result_cache = QueryResultCache()
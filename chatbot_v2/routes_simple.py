@@ -2,18 +2,22 @@
 Gemini AI Analytics Chatbot Routes
 Uses analytics_chatbot_simple.html template (the modern, clean UI)
 """
-import json
 import asyncio
+import json
 import re
 import traceback
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app
+from flask import (
+    Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app,
+    Response, stream_with_context
+)
 from datetime import datetime
 import os
 
 from .providers.gemini import create_gemini_provider
-from .config import GOOGLE_AI_API_KEY, CHATBOT_ENABLE_GEMINI
+from .config import GOOGLE_AI_API_KEY, CHATBOT_ENABLE_GEMINI, STREAM_IDLE_TIMEOUT_SECONDS
 from .query_engine import create_query_engine
 from .ai_providers import AIRequest
+from .async_runtime import run_async, iter_async
 
 # Create the blueprint
 chatbot_bp = Blueprint('chatbot', __name__, url_prefix='/chatbot')
@@ -105,10 +109,24 @@ def index():
     )
 
 
-@chatbot_bp.route('/ask', methods=['POST'])
-def ask_question():
-    """Process a user question using Gemini and query engine"""
+CONVERSATION_SYSTEM_PROMPT = """You are a helpful AI assistant for Minipass, a platform that helps manage activities, users, and revenue.
+
+When users greet you or ask conversational questions:
+- Respond naturally and professionally
+- Remind them you can help analyze their data about users, activities, revenue, signups, and passports
+- Keep responses brief (1-2 sentences)
+- Be friendly and encouraging"""
+
+ANSWER_SYSTEM_PROMPT = "You are a helpful data analyst. Answer questions about business data clearly and concisely."
 
+NO_RESULTS_ANSWER = "I didn't find any results for that query. Try asking in a different way or check if the data exists."
+
+
+def _read_ask_request():
+    """
+    Shared auth + input validation for /ask and /ask/stream.
+    Returns (admin_email, data, question, model, None) or (..., error_response).
+    """
     # Strict auth check - require valid admin session
     admin_email = session.get('admin')
     if not admin_email:
@@ -118,10 +136,10 @@ def ask_question():
             admin_email = "test@example.com"
         else:
             # Production: require authentication
-            return jsonify({
+            return None, None, None, None, (jsonify({
                 'error': 'Authentication required',
                 'message': 'Please log in to use the AI chatbot'
-            }), 401
+            }), 401)
 
     # Get question from request
     if request.content_type and 'application/json' in request.content_type:
@@ -145,16 +163,110 @@ def ask_question():
 
     # Basic validation
     if not question:
-        return jsonify({
+        return admin_email, data, question, model, (jsonify({
             'success': False,
             'error': 'Question is required'
-        }), 400
+        }), 400)
 
     if len(question) > 2000:
-        return jsonify({
+        return admin_email, data, question, model, (jsonify({
             'success': False,
             'error': 'Question is too long (max 2000 characters)'
-        }), 400
+        }), 400)
+
+    return admin_email, data, question, model, None
+
+
+def _get_db_path() -> str:
+    """Database path from Flask config, made absolute"""
+    db_path = current_app.config.get('DATABASE_PATH', 'instance/minipass.db')
+    if not db_path.startswith('/'):
+        db_path = os.path.join(current_app.root_path, db_path)
+    return db_path
+
+
+def _conversation_request(question: str, model: str) -> AIRequest:
+    return AIRequest(
+        prompt=question,
+        system_prompt=CONVERSATION_SYSTEM_PROMPT,
+        model=model,
+        temperature=0.7,
+        max_tokens=150
+    )
+
+
+def _answer_request(question: str, result: dict) -> AIRequest:
+    """Prompt asking the AI to turn query results into a natural language answer"""
+    row_count = result.get('row_count', 0)
+    rows = result.get('rows', [])
+    columns = result.get('columns', [])
+    truncated = result.get('truncated', False)
+
+    # Prepare data for AI to analyze
+    # Convert rows to readable format (limit to first 10 rows for token efficiency)
+    data_sample = rows[:10] if len(rows) > 10 else rows
+    data_str = json.dumps(data_sample, indent=2, default=str)
+
+    # Create prompt for AI to answer the question
+    answer_prompt = f"""Answer this user question based on the query results below.
+
+User Question: {question}
+
+SQL Query Results ({'at least ' if truncated else ''}{row_count} total rows, showing up to 10):
+Columns: {', '.join(columns)}
+Data:
+{data_str}
+
+Instructions:
+- Provide a direct, natural language answer to the user's question
+- Use specific numbers and data from the results
+- Be concise (2-3 sentences max)
+- Don't mention SQL, queries, or technical details
+- Format numbers nicely (e.g., $1,234.56)
+
+Answer:"""
+
+    return AIRequest(
+        prompt=answer_prompt,
+        system_prompt=ANSWER_SYSTEM_PROMPT,
+        model=WORKING_GEMINI_MODELS[0],
+        temperature=0.3,
+        max_tokens=200
+    )
+
+
+def _provider_note(actual_provider: str) -> str:
+    """Subtle provider info appended to the answer (only if NOT Gemini)"""
+    if actual_provider == 'groq':
+        return "\n\n_Using Groq fallback - Gemini unavailable_"
+    elif actual_provider != 'gemini':
+        return f"\n\n_Using {actual_provider}_"
+    # Don't add anything if Gemini is used (expected behavior)
+    return ""
+
+
+def _result_payload(result: dict, model: str) -> dict:
+    """Fields of a successful data answer shared by /ask and the streamed 'result' event"""
+    return {
+        'sql': result.get('sql', ''),
+        'rows': result.get('rows', []),
+        'columns': result.get('columns', []),
+        'row_count': result.get('row_count', 0),
+        'truncated': result.get('truncated', False),
+        'conversational': False,
+        'model': result.get('ai_model', model),
+        'conversation_id': result.get('conversation_id'),
+        'provider': result.get('ai_provider', 'unknown')  # ← REAL provider, not hardcoded!
+    }
+
+
+@chatbot_bp.route('/ask', methods=['POST'])
+def ask_question():
+    """Process a user question using Gemini and query engine"""
+
+    admin_email, data, question, model, error_response = _read_ask_request()
+    if error_response:
+        return error_response
 
     # Import provider_manager for fallback support
     from .ai_providers import provider_manager
@@ -163,30 +275,12 @@ def ask_question():
         # Check if this is a greeting or conversational question
         if is_greeting_or_conversation(question):
             # Handle conversational questions using provider_manager (with fallback)
-            system_prompt = """You are a helpful AI assistant for Minipass, a platform that helps manage activities, users, and revenue.
-
-When users greet you or ask conversational questions:
-- Respond naturally and professionally
-- Remind them you can help analyze their data about users, activities, revenue, signups, and passports
-- Keep responses brief (1-2 sentences)
-- Be friendly and encouraging"""
+            ai_request = _conversation_request(question, model)
 
-            ai_request = AIRequest(
-                prompt=question,
-                system_prompt=system_prompt,
-                model=model,
-                temperature=0.7,
-                max_tokens=150
-            )
-
-            # Run async with provider_manager (has Groq fallback)
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            result = loop.run_until_complete(
+            # Run async with provider_manager (has Groq fallback) on the shared loop
+            result = run_async(
                 provider_manager.generate(ai_request, preferred_provider='gemini')
             )
-            loop.close()
 
             if result.error:
                 return jsonify({
@@ -208,23 +302,13 @@ When users greet you or ask conversational questions:
             return jsonify(response)
 
         # Otherwise, handle as a data query
-        # Get database path from Flask config
-        db_path = current_app.config.get('DATABASE_PATH', 'instance/minipass.db')
-        if not db_path.startswith('/'):
-            # Make it absolute path
-            import os
-            db_path = os.path.join(current_app.root_path, db_path)
-
         # Create query engine and process question using Gemini
-        query_engine = create_query_engine(db_path)
+        query_engine = create_query_engine(_get_db_path())
 
         print(f"🚀 ROUTE DEBUG: Calling query_engine with preferred_provider='gemini', preferred_model='{model}'")
 
-        # Run async query processing - simple and direct
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        result = loop.run_until_complete(
+        # Run async query processing on the shared loop (pooled provider connections)
+        result = run_async(
             query_engine.process_question(
                 question,  # Pass raw question directly - trust the AI
                 admin_email,
@@ -232,7 +316,6 @@ When users greet you or ask conversational questions:
                 preferred_model=model
             )
         )
-        loop.close()
 
         print(f"📥 ROUTE DEBUG: Result - provider={result.get('ai_provider')}, model={result.get('ai_model')}, success={result.get('success')}")
 
@@ -245,53 +328,16 @@ When users greet you or ask conversational questions:
         if result.get('success'):
             # Generate natural language answer from results using AI
             row_count = result.get('row_count', 0)
-            rows = result.get('rows', [])
-            columns = result.get('columns', [])
 
             if row_count == 0:
-                answer = "I didn't find any results for that query. Try asking in a different way or check if the data exists."
+                answer = NO_RESULTS_ANSWER
             else:
                 # Call AI to generate natural language answer from the data (with fallback)
                 try:
-                    # Prepare data for AI to analyze
-                    # Convert rows to readable format (limit to first 10 rows for token efficiency)
-                    data_sample = rows[:10] if len(rows) > 10 else rows
-                    data_str = json.dumps(data_sample, indent=2, default=str)
-
-                    # Create prompt for AI to answer the question
-                    answer_prompt = f"""Answer this user question based on the query results below.
-
-User Question: {question}
-
-SQL Query Results ({row_count} total rows, showing up to 10):
-Columns: {', '.join(columns)}
-Data:
-{data_str}
-
-Instructions:
-- Provide a direct, natural language answer to the user's question
-- Use specific numbers and data from the results
-- Be concise (2-3 sentences max)
-- Don't mention SQL, queries, or technical details
-- Format numbers nicely (e.g., $1,234.56)
-
-Answer:"""
-
-                    ai_request = AIRequest(
-                        prompt=answer_prompt,
-                        system_prompt="You are a helpful data analyst. Answer questions about business data clearly and concisely.",
-                        model=WORKING_GEMINI_MODELS[0],
-                        temperature=0.3,
-                        max_tokens=200
-                    )
-
                     # Run async AI call with provider_manager (has Groq fallback)
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    ai_response = loop.run_until_complete(
-                        provider_manager.generate(ai_request, preferred_provider='gemini')
+                    ai_response = run_async(
+                        provider_manager.generate(_answer_request(question, result), preferred_provider='gemini')
                     )
-                    loop.close()
 
                     if ai_response and ai_response.content and not ai_response.error:
                         answer = ai_response.content
@@ -303,15 +349,8 @@ Answer:"""
                     answer = f"I found {row_count} results for your question."
 
             # Format response for the simple template
-            actual_provider = result.get('ai_provider', 'unknown')
-            actual_model = result.get('ai_model', model)
-
-            # Add subtle provider info at the end (only if NOT Gemini)
-            if actual_provider == 'groq':
-                answer = f"{answer}\n\n_Using Groq fallback - Gemini unavailable_"
-            elif actual_provider != 'gemini':
-                answer = f"{answer}\n\n_Using {actual_provider}_"
-            # Don't add anything if Gemini is used (expected behavior)
+            payload = _result_payload(result, model)
+            answer += _provider_note(payload['provider'])
 
             # Update query log with the REAL answer for debugging
             if result.get('query_log_id'):
@@ -322,15 +361,8 @@ Answer:"""
                 'success': True,
                 'question': question,
                 'answer': answer,
-                'sql': result.get('sql', ''),
-                'rows': result.get('rows', []),
-                'columns': result.get('columns', []),
-                'row_count': row_count,
-                'conversational': False,
-                'model': actual_model,
-                'conversation_id': result.get('conversation_id'),
                 'timestamp': datetime.now().isoformat(),
-                'provider': actual_provider  # ← REAL provider, not hardcoded!
+                **payload
             }
             return jsonify(response)
         else:
@@ -357,6 +389,156 @@ Answer:"""
         }), 500
 
 
+def _sse(event: str, data: dict) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _stream_answer_events(question: str, admin_email: str, model: str, conversation_id: str):
+    """
+    Async generator of (event, data) for /ask/stream: 'sql' as soon as the SQL is
+    generated, 'result' once it has run, then 'token' chunks of the answer and 'done'.
+    """
+    from .ai_providers import provider_manager, AIProviderError
+
+    if is_greeting_or_conversation(question):
+        answer, provider = "", None
+        try:
+            async for chunk in provider_manager.generate_stream(_conversation_request(question, model),
+                                                               preferred_provider='gemini'):
+                answer += chunk.content
+                provider = chunk.provider
+                yield 'token', {'text': chunk.content}
+        except AIProviderError as e:
+            if not answer:
+                yield 'error', {'error': f'⚠️ AI Analytics temporarily unavailable: {e}'}
+                return
+        yield 'done', {
+            'success': True,
+            'question': question,
+            'answer': answer,
+            'conversational': True,
+            'model': model,
+            'conversation_id': conversation_id,
+            'timestamp': datetime.now().isoformat(),
+            'provider': provider
+        }
+        return
+
+    # SQL generation + execution run as a task so the SQL can be sent while the query executes
+    sql_events: asyncio.Queue = asyncio.Queue()
+    query_engine = create_query_engine(_get_db_path())
+    task = asyncio.ensure_future(query_engine.process_question(
+        question, admin_email,
+        preferred_provider='gemini',
+        preferred_model=model,
+        on_sql=sql_events.put_nowait
+    ))
+    try:
+        while not task.done() or not sql_events.empty():
+            if sql_events.empty():
+                get_sql = asyncio.ensure_future(sql_events.get())
+                await asyncio.wait([task, get_sql], return_when=asyncio.FIRST_COMPLETED)
+                if not get_sql.done():
+                    get_sql.cancel()
+                    continue
+                sql_result = get_sql.result()
+            else:
+                sql_result = sql_events.get_nowait()
+            yield 'sql', {
+                'sql': sql_result['sql'],
+                'provider': sql_result.get('ai_provider'),
+                'model': sql_result.get('ai_model'),
+                'sql_cache_hit': sql_result.get('cache_hit', False)
+            }
+        result = task.result()
+    finally:
+        task.cancel()
+
+    if not result.get('success'):
+        error_msg = result.get('error', 'Failed to process question')
+        current_app.logger.error(f"Query processing failed: {error_msg}")
+        yield 'error', {'error': f'Query failed: {error_msg}'}
+        return
+
+    result['conversation_id'] = conversation_id
+    payload = _result_payload(result, model)
+    yield 'result', {'success': True, 'question': question, **payload}
+
+    row_count = result.get('row_count', 0)
+    if row_count == 0:
+        answer = NO_RESULTS_ANSWER
+        yield 'token', {'text': answer}
+    else:
+        answer = ""
+        try:
+            async for chunk in provider_manager.generate_stream(_answer_request(question, result),
+                                                               preferred_provider='gemini'):
+                answer += chunk.content
+                yield 'token', {'text': chunk.content}
+        except AIProviderError as e:
+            current_app.logger.error(f"Failed to generate natural language answer: {e}")
+        if not answer:
+            answer = f"I found {row_count} results for your question."
+            yield 'token', {'text': answer}
+
+    note = _provider_note(payload['provider'])
+    if note:
+        answer += note
+        yield 'token', {'text': note}
+
+    # Update query log with the REAL answer for debugging
+    if result.get('query_log_id'):
+        from chatbot_v2.query_engine import QueryEngine
+        await asyncio.to_thread(QueryEngine.update_query_log_answer, result['query_log_id'], answer)
+
+    yield 'done', {
+        'success': True,
+        'question': question,
+        'answer': answer,
+        'timestamp': datetime.now().isoformat(),
+        **payload
+    }
+
+
+@chatbot_bp.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Same as /ask, streamed as Server-Sent Events (sql -> result -> token... -> done),
+    so the table shows up as soon as the query has run and the answer types itself out.
+    """
+    admin_email, data, question, model, error_response = _read_ask_request()
+    if error_response:
+        return error_response
+
+    conversation_id = data.get('conversation_id', 'gemini')
+
+    def generate():
+        events = iter_async(
+            _stream_answer_events(question, admin_email, model, conversation_id),
+            timeout=STREAM_IDLE_TIMEOUT_SECONDS
+        )
+        try:
+            for event, payload in events:
+                yield _sse(event, payload)
+        except Exception as e:
+            current_app.logger.error(f"Error streaming answer: {e}")
+            current_app.logger.error(f"Full traceback:\n{traceback.format_exc()}")
+            yield _sse('error', {'error': f'Debug Error: {str(e)} - Check Flask logs for details'})
+        finally:
+            # Client went away or stream finished: stop the pipeline on the loop
+            events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Don't let a reverse proxy hold back the events
+        }
+    )
+
+
 @chatbot_bp.route('/status')
 def status():
     """Check Gemini API status"""
@@ -408,14 +590,10 @@ def list_models():
 @chatbot_bp.route('/model-status')
 def model_status():
     """Model status endpoint for frontend LED indicator - TESTS ACTUAL GENERATION"""
-    import asyncio
     from .ai_providers import provider_manager, AIRequest
 
     # TEST ACTUAL GENERATION (not just model listing)
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
         # Try a tiny test request with Gemini
         test_request = AIRequest(
             prompt="test",
@@ -426,10 +604,9 @@ def model_status():
             timeout_seconds=5
         )
 
-        result = loop.run_until_complete(
+        result = run_async(
             provider_manager.generate(test_request, preferred_provider='gemini')
         )
-        loop.close()
 
         # Check if Gemini actually worked
         if result.provider == 'gemini' and result.error is None:
@@ -0,0 +1,210 @@
+"""
+Compact schema context for SQL generation
+Instead of pasting every table and view into each prompt, the tables are ranked
+against the question (keywords, entities, foreign keys) and only the relevant
+ones are rendered, with short column descriptions, under a token budget.
+Rendered per-table fragments are cached per schema fingerprint.
+"""
+import fnmatch
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import SCHEMA_CONTEXT_TOKEN_BUDGET, SCHEMA_CONTEXT_EXCLUDED_TABLES, SCHEMA_CONTEXT_HIDDEN_COLUMNS
+from .utils import extract_entities
+
+# Words (English/French prefixes) that point at a table or view beyond its own name and columns
+TABLE_KEYWORDS = {
+    'monthly_financial_summary': ['revenue', 'revenu', 'income', 'profit', 'cash', 'flow', 'net', 'total',
+                                  'sales', 'vente', 'expense', 'depense', 'dépense', 'financ', 'money', 'argent',
+                                  'month', 'mois', 'receivable', 'payable'],
+    'monthly_transactions_detail': ['transaction', 'unpaid', 'impay', 'invoice', 'factur', 'ledger',
+                                    'receivable', 'payable', 'owe', 'outstanding'],
+    'passport': ['passport', 'passeport', 'pass', 'sold', 'vendu', 'bought', 'achet', 'remaining',
+                 'restant', 'session', 'unpaid', 'paid', 'pay'],
+    'passport_type': ['type', 'price', 'prix', 'tarif', 'plan', 'substitute', 'permanent'],
+    'user': ['user', 'utilisateur', 'client', 'customer', 'member', 'membre', 'participant', 'people',
+             'person', 'who', 'qui', 'email', 'courriel', 'phone', 'contact'],
+    'activity': ['activit', 'event', 'évén', 'evenement', 'course', 'cours', 'league', 'ligue', 'program'],
+    'signup': ['signup', 'sign', 'inscri', 'registr', 'register', 'pending', 'attente', 'approv'],
+    'income': ['income', 'revenu', 'sponsor', 'donation'],
+    'expense': ['expense', 'depense', 'dépense', 'cost', 'coût', 'cout', 'spent', 'bill', 'facture'],
+    'redemption': ['redeem', 'redemption', 'used', 'utilis', 'attendance', 'présence', 'presence', 'check'],
+    'stripe_transaction': ['stripe', 'card', 'carte', 'credit', 'fee', 'frais', 'payout'],
+    'survey': ['survey', 'sondage'],
+    'survey_response': ['survey', 'sondage', 'response', 'réponse', 'answer', 'feedback'],
+}
+
+# Used when nothing in the question matches a table
+DEFAULT_TABLES = ['monthly_financial_summary', 'passport', 'user', 'activity', 'signup']
+
+# Short hints for columns whose meaning isn't obvious from the name
+COLUMN_DESCRIPTIONS = {
+    'passport.sold_amt': 'amount the customer actually paid',
+    'passport.uses_remaining': 'sessions left on the passport',
+    'passport.paid': '1 = paid',
+    'passport.passport_type_name': 'type name at time of sale',
+    'passport_type.price_per_user': 'listed price (may differ from sold_amt)',
+    'passport_type.type': "'permanent' or 'substitute'",
+    'passport_type.status': "'active', 'archived' or 'deleted'",
+    'signup.status': "'pending', 'approved', 'rejected', ...",
+    'signup.paid': '1 = paid',
+    'signup.requested_amount': 'price x requested_sessions',
+    'activity.status': "'active' or 'archived'",
+    'activity.goal_revenue': 'revenue target',
+    'activity.reserved_sessions': "sessions taken: uses_remaining of its passports + requested_sessions "
+                                  "of signups still 'pending'/'stripe_processing' without a passport (not sold count)",
+    'expense.payment_status': "'unpaid', 'paid' or 'cancelled'",
+    'income.payment_status': "'pending', 'received' or 'cancelled'",
+    'stripe_transaction.status': "'pending', 'paid_out' or 'refunded'",
+    'monthly_financial_summary.month': "'YYYY-MM'",
+    'monthly_financial_summary.account': 'activity name; one row per activity per month',
+    'monthly_transactions_detail.payment_status': "e.g. 'Unpaid (AR)'",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def load_schema(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """Tables and views the chatbot may use, with columns and foreign keys"""
+    schema = {}
+    objects = conn.execute("""
+        SELECT name, type FROM sqlite_master
+        WHERE (type='table' OR type='view') AND name NOT LIKE 'sqlite_%'
+        ORDER BY type DESC, name
+    """).fetchall()
+
+    for object_name, object_type in objects:
+        if any(fnmatch.fnmatch(object_name, pattern) for pattern in SCHEMA_CONTEXT_EXCLUDED_TABLES):
+            continue
+
+        columns = conn.execute(f'PRAGMA table_info("{object_name}")').fetchall()
+        foreign_keys = {
+            fk[3]: f"{fk[2]}.{fk[4] or 'id'}"
+            for fk in conn.execute(f'PRAGMA foreign_key_list("{object_name}")').fetchall()
+        }
+        schema[object_name] = {
+            'type': object_type,
+            'columns': [
+                {
+                    'name': col[1],
+                    'type': col[2],
+                    'nullable': not col[3],
+                    'primary_key': bool(col[5])
+                }
+                for col in columns
+            ],
+            'foreign_keys': foreign_keys,
+        }
+    return schema
+
+
+def render_table(name: str, info: Dict[str, Any]) -> str:
+    """Prompt fragment for one table/view"""
+    lines = [f"{'View' if info.get('type') == 'view' else 'Table'}: {name}"]
+    foreign_keys = info.get('foreign_keys', {})
+    for col in info['columns']:
+        if any(fnmatch.fnmatch(col['name'], pattern) for pattern in SCHEMA_CONTEXT_HIDDEN_COLUMNS):
+            continue
+        line = f"  - {col['name']}: {col['type'] or 'ANY'}"
+        if col['primary_key']:
+            line += " (PRIMARY KEY)"
+        if col['name'] in foreign_keys:
+            line += f" -> {foreign_keys[col['name']]}"
+        description = COLUMN_DESCRIPTIONS.get(f"{name}.{col['name']}")
+        if description:
+            line += f"  -- {description}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def rank_tables(question: str, schema: Dict[str, Dict[str, Any]]) -> List[Tuple[float, str]]:
+    """(score, name) for every table the question seems to be about, best first"""
+    entities = extract_entities(question)
+    keywords = set(entities['keywords'])
+
+    scores = {}
+    for name, info in schema.items():
+        name_parts = set(name.split('_'))
+        column_names = {col['name'] for col in info['columns']}
+        hints = TABLE_KEYWORDS.get(name, [])
+
+        score = 0.0
+        for word in keywords:
+            singular = word[:-1] if word.endswith('s') else word
+            if word in name_parts or singular in name_parts:
+                score += 3
+            if any(word.startswith(hint) for hint in hints):
+                score += 2
+            if word in column_names or singular in column_names:
+                score += 1
+        if entities['emails'] and 'email' in column_names:
+            score += 2
+        if score and entities['dates'] and any('date' in col or col.endswith('_at') or col == 'month' for col in column_names):
+            score += 0.5
+        if score:
+            scores[name] = score
+
+    # Tables referenced by a matched table are likely needed for the JOIN
+    for name, score in list(scores.items()):
+        for target in schema[name].get('foreign_keys', {}).values():
+            target_table = target.split('.')[0]
+            if target_table in schema:
+                scores[target_table] = max(scores.get(target_table, 0), score / 2)
+
+    return sorted(((score, name) for name, score in scores.items()), key=lambda item: (-item[0], item[1]))
+
+
+class SchemaContextBuilder:
+    """Caches rendered table fragments for the current schema fingerprint"""
+
+    def __init__(self, token_budget: int = SCHEMA_CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._schema_hash: Optional[str] = None
+        self._schema: Dict[str, Dict[str, Any]] = {}
+        self._fragments: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, schema_hash: str, conn: sqlite3.Connection):
+        with self._lock:
+            if schema_hash == self._schema_hash:
+                return self._schema, self._fragments
+
+        schema = load_schema(conn)
+        fragments = {name: render_table(name, info) for name, info in schema.items()}
+        with self._lock:
+            self._schema_hash, self._schema, self._fragments = schema_hash, schema, fragments
+        print(f"✅ Schema context cached: {len(schema)} tables/views (schema {schema_hash})")
+        return schema, fragments
+
+    def build(self, question: str, schema_hash: str, conn: sqlite3.Connection) -> str:
+        """Schema text for the prompt, limited to the tables relevant to this question"""
+        schema, fragments = self._load(schema_hash, conn)
+        return self.select(question, schema, fragments)
+
+    def select(self, question: str, schema: Dict[str, Dict[str, Any]],
+               fragments: Optional[Dict[str, str]] = None) -> str:
+        if fragments is None:
+            fragments = {name: render_table(name, info) for name, info in schema.items()}
+
+        ranked = [name for _, name in rank_tables(question, schema)]
+        if not ranked:
+            ranked = [name for name in DEFAULT_TABLES if name in schema] or list(schema)
+
+        chosen, used = [], 0
+        for name in ranked:
+            cost = estimate_tokens(fragments[name])
+            if chosen and used + cost > self.token_budget:
+                continue  # A smaller, lower-ranked table may still fit
+            chosen.append(name)
+            used += cost
+
+        print(f"📐 Schema context: {chosen} (~{used} tokens of {self.token_budget})")
+        return "DATABASE SCHEMA:\n\n" + "\n".join(fragments[name] for name in chosen)
+
+
+# Process-wide builder shared by every QueryEngine instance
+schema_context = SchemaContextBuilder()
@@ -2,12 +2,21 @@
 Security module for SQL validation and sanitization
 Prevents SQL injection and enforces read-only access
 """
+import os
+import queue
 import re
 import sqlite3
+import threading
+import time
 from typing import Optional, Tuple, List, Dict, Any
 from dataclasses import dataclass
+from urllib.parse import quote
 
-from .config import ALLOWED_SQL_KEYWORDS, BLOCKED_SQL_KEYWORDS, MAX_RESULT_ROWS
+from .config import (
+    ALLOWED_SQL_KEYWORDS, BLOCKED_SQL_KEYWORDS, MAX_RESULT_ROWS, MAX_RESULT_BYTES,
+    MAX_QUERY_TIMEOUT_SECONDS, QUERY_POOL_SIZE, QUERY_PROGRESS_INTERVAL
+)
+from .result_cache import result_cache, read_data_versions, read_tables
 
 
 @dataclass
@@ -178,14 +187,83 @@ class SQLSecurity:
         return sql.strip()
 
 
+class ReadOnlyConnectionPool:
+    """Small per-process pool of read-only (mode=ro) SQLite connections"""
+    
+    _pools: Dict[Tuple[int, str], 'ReadOnlyConnectionPool'] = {}
+    _pools_lock = threading.Lock()
+    
+    def __init__(self, db_path: str, size: int = QUERY_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    @classmethod
+    def for_path(cls, db_path: str) -> 'ReadOnlyConnectionPool':
+        """Shared pool per database path; keyed by PID so forked workers never reuse a parent's handles"""
+        key = (os.getpid(), os.path.abspath(db_path))
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls._pools[key] = cls(db_path)
+            return pool
+    
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=5)
+        conn.row_factory = sqlite3.Row  # Enable column name access
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, conn: sqlite3.Connection, discard: bool = False):
+        conn.set_progress_handler(None, 0)
+        if not discard:
+            try:
+                self._idle.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+
 class QueryExecutor:
     """Secure SQL query executor"""
     
-    def __init__(self, db_path: str):
+    FETCH_BATCH_SIZE = 200
+    
+    def __init__(self, db_path: str, timeout_seconds: float = MAX_QUERY_TIMEOUT_SECONDS,
+                 max_rows: int = MAX_RESULT_ROWS, max_bytes: int = MAX_RESULT_BYTES):
         self.db_path = db_path
+        self.timeout_seconds = timeout_seconds
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.pool = ReadOnlyConnectionPool.for_path(db_path)
+    
+    @staticmethod
+    def _row_size(row: sqlite3.Row) -> int:
+        """Approximate memory held by one row once converted to a dict"""
+        size = 64
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                size += 48 + len(value)
+            else:
+                size += 24
+        return size
     
-    def execute_query(self, sql: str) -> Dict[str, Any]:
-        """Execute SQL query with security validation"""
+    def execute_query(self, sql: str, cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Execute SQL query with security validation.
+        Runs on a pooled read-only connection and is interrupted by SQLite itself when the
+        deadline passes or cancel_event is set. At most max_rows rows / max_bytes are kept;
+        'truncated' tells the caller there was more. Results are reused from result_cache
+        while the data_version counters of the tables read are unchanged ('cached': True).
+        """
         
         # Validate SQL security
         security_result = SQLSecurity.validate_sql(sql)
@@ -196,44 +274,103 @@ class QueryExecutor:
                 'blocked_reason': security_result.blocked_reason
             }
         
+        started = time.monotonic()
+        deadline = started + self.timeout_seconds
+        
+        def should_abort():
+            # Non-zero return makes SQLite abort the statement with "interrupted"
+            return int(time.monotonic() > deadline or (cancel_event is not None and cancel_event.is_set()))
+        
         # Execute the sanitized query
+        conn = None
+        discard = False
+        sql = security_result.sanitized_sql
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Enable column name access
-            cursor = conn.cursor()
-            
-            # Set query timeout (SQLite doesn't support this directly, but we can use a timeout)
-            cursor.execute(security_result.sanitized_sql)
+            conn = self.pool.acquire()
             
-            # Fetch results
-            rows = cursor.fetchall()
+            # Serve the previous result while the tables it reads are unchanged
+            versions = read_data_versions(conn)
+            version_key = result_cache.version_key(read_tables(conn, sql) if versions else None, versions)
+            if version_key is not None:
+                cached = result_cache.get(sql, version_key)
+                if cached is not None:
+                    return {
+                        **cached,
+                        'cached': True,
+                        'execution_time_ms': int((time.monotonic() - started) * 1000)
+                    }
             
-            # Convert to list of dictionaries
+            conn.set_progress_handler(should_abort, QUERY_PROGRESS_INTERVAL)
+            cursor = conn.execute(sql)
             columns = [description[0] for description in cursor.description] if cursor.description else []
-            data = [dict(row) for row in rows] if rows else []
             
-            conn.close()
+            # Fetch in batches up to the row and memory budgets
+            data = []
+            result_bytes = 0
+            truncated_reason = None
+            while truncated_reason is None:
+                rows = cursor.fetchmany(self.FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if len(data) >= self.max_rows:
+                        truncated_reason = 'row_limit'
+                        break
+                    result_bytes += self._row_size(row)
+                    if result_bytes > self.max_bytes:
+                        truncated_reason = 'memory_limit'
+                        break
+                    data.append(dict(row))
+            cursor.close()
             
-            return {
+            result = {
                 'success': True,
                 'columns': columns,
                 'data': data,
                 'row_count': len(data),
-                'sql_executed': security_result.sanitized_sql
+                'truncated': truncated_reason is not None,
+                'truncated_reason': truncated_reason,
+                'result_bytes': result_bytes,
+                'execution_time_ms': int((time.monotonic() - started) * 1000),
+                'sql_executed': sql,
+                'cached': False
             }
+            if version_key is not None:
+                result_cache.put(sql, version_key, result)
+            return result
             
+        except sqlite3.OperationalError as e:
+            if 'interrupted' in str(e).lower():
+                cancelled = cancel_event is not None and cancel_event.is_set()
+                return {
+                    'success': False,
+                    'error': "Query was cancelled" if cancelled else
+                             f"Query took longer than {self.timeout_seconds:g} seconds and was stopped",
+                    'error_type': 'cancelled' if cancelled else 'timeout'
+                }
+            discard = True
+            return {
+                'success': False,
+                'error': f"Database error: {str(e)}",
+                'error_type': 'database_error'
+            }
         except sqlite3.Error as e:
+            discard = True
             return {
                 'success': False,
                 'error': f"Database error: {str(e)}",
                 'error_type': 'database_error'
             }
         except Exception as e:
+            discard = True
             return {
                 'success': False,
                 'error': f"Execution error: {str(e)}",
                 'error_type': 'execution_error'
             }
+        finally:
+            if conn is not None:
+                self.pool.release(conn, discard=discard)
 
 
 class PIIDetector:
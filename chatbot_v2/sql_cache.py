@@ -0,0 +1,179 @@
+"""
+Question -> SQL cache for the analytics chatbot
+Repeated questions ("revenue this month") reuse previously generated SQL instead
+of calling the LLM again. Entries are keyed by the normalized question, the
+database schema fingerprint and the model, so any schema change (migration,
+restore) makes old entries unreachable; they are dropped as soon as a new
+fingerprint is seen. The cache is warmed from recent successful QueryLog rows
+(see warm_from_query_log).
+
+Questions about a relative period ("this month", "ce mois", "today") are only
+cached when their SQL computes the period from the clock ('now', 'start of
+month', ...). SQL with the period written out as a literal date would answer
+for the wrong month after the boundary, so it is never cached.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Tuple
+
+from .config import (
+    SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS, SQL_CACHE_WARM_LIMIT, SQL_CACHE_WARM_MAX_AGE_SECONDS
+)
+
+# Periods relative to today, in normalize_question() form (lowercase, accents stripped), EN + FR
+RELATIVE_QUESTION_PATTERN = re.compile(
+    r"\b(?:today|tonight|yesterday|tomorrow|now|current(?:ly)?|recent(?:ly)?|ago|so far|to date|ytd|mtd"
+    r"|(?:this|last|next|past|previous) (?:\d+ )?(?:day|week|month|quarter|year|season)s?"
+    r"|aujourd ?hui|hier|demain|maintenant|actuel(?:le)?s?|recent(?:e|s|es)?|depuis"
+    r"|(?:ce|cette|cet) (?:jour|semaine|mois|trimestre|annee|saison)"
+    r"|(?:jour|semaine|mois|trimestre|annee|saison)s? (?:dernier|derniere|passee?|prochaine?|en cours)"
+    r"|(?:dernier|derniere|derniers|dernieres) (?:\d+ )?(?:jour|semaine|mois|trimestre|annee)s?)\b"
+)
+
+# A date written out in the SQL: '2026', '2026-10', '2026-10-19 ...'
+LITERAL_DATE_PATTERN = re.compile(r"'\d{4}(?:-\d{2}){0,2}\b")
+
+
+def normalize_question(question: str) -> str:
+    """Case-, accent-, punctuation- and whitespace-insensitive form of a question"""
+    text = unicodedata.normalize('NFKD', question or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w%$]+", ' ', text)
+    return ' '.join(text.split())
+
+
+def schema_fingerprint(conn: sqlite3.Connection) -> str:
+    """Hash of every table/view definition - one cheap query against sqlite_master"""
+    rows = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+    ).fetchall()
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def is_cacheable(question: str, sql: str) -> bool:
+    """False for a relative-period question whose SQL pins the period to literal dates"""
+    return not (RELATIVE_QUESTION_PATTERN.search(normalize_question(question))
+                and LITERAL_DATE_PATTERN.search(sql or ''))
+
+
+class SQLGenerationCache:
+    """Thread-safe LRU + TTL cache of generated SQL"""
+
+    def __init__(self, max_entries: int = SQL_CACHE_MAX_ENTRIES, ttl_seconds: int = SQL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._schema_hash: Optional[str] = None
+        self._warmed: set = set()  # (schema_hash, model) already loaded from QueryLog
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(question: str, schema_hash: str, model: str) -> Tuple[str, str, str]:
+        return (normalize_question(question), schema_hash, model or '')
+
+    def _use_schema(self, schema_hash: str):
+        # Called with the lock held: a new fingerprint invalidates everything cached so far
+        if schema_hash != self._schema_hash:
+            self._entries.clear()
+            self._schema_hash = schema_hash
+
+    def get(self, question: str, schema_hash: str, model: str) -> Optional[Dict[str, Any]]:
+        key = self._key(question, schema_hash, model)
+        with self._lock:
+            self._use_schema(schema_hash)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry['stored_at'] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, question: str, schema_hash: str, model: str, sql: str,
+            ai_provider: Optional[str] = None, ai_model: Optional[str] = None, age_seconds: float = 0):
+        key = self._key(question, schema_hash, model)
+        if not key[0] or not sql or not is_cacheable(question, sql):
+            return
+        with self._lock:
+            self._use_schema(schema_hash)
+            self._entries[key] = {
+                'sql': sql,
+                'ai_provider': ai_provider,
+                'ai_model': ai_model,
+                'stored_at': time.monotonic() - age_seconds,  # TTL counts from when the SQL was generated
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, question: str, schema_hash: str, model: str):
+        with self._lock:
+            self._entries.pop(self._key(question, schema_hash, model), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._warmed.clear()
+
+    def warm_from_query_log(self, schema_hash: str, model: str, limit: int = SQL_CACHE_WARM_LIMIT,
+                            max_age_seconds: int = SQL_CACHE_WARM_MAX_AGE_SECONDS) -> int:
+        """
+        Load recent successful, non-empty QueryLog runs for the lookup key model
+        (preferred_model or DEFAULT_AI_MODEL), once per schema fingerprint and model.
+        Only rows answered by that model itself are used: QueryLog does not record
+        the requested model, and rows answered by a fallback would sit under keys no
+        lookup uses. Rows put() would not cache (see is_cacheable) are skipped.
+        Needs an app context. Returns the number of entries added.
+        """
+        with self._lock:
+            if (schema_hash, model) in self._warmed:
+                return 0
+            self._warmed.add((schema_hash, model))
+
+        from models import QueryLog
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)  # created_at is stored as naive UTC
+        rows = QueryLog.query.with_entities(
+            QueryLog.original_question, QueryLog.generated_sql, QueryLog.ai_provider, QueryLog.created_at
+        ).filter(
+            QueryLog.execution_status == 'success',
+            QueryLog.rows_returned > 0,
+            QueryLog.ai_model == model,
+            QueryLog.created_at >= now - timedelta(seconds=max_age_seconds),
+        ).order_by(QueryLog.created_at.desc()).limit(limit).all()
+
+        # Oldest first so the most recent answer for a question wins and ends up most-recently-used
+        added = 0
+        for question, sql, ai_provider, created_at in reversed(rows):
+            if not is_cacheable(question, sql):
+                continue
+            age = max((now - created_at).total_seconds(), 0) if created_at else 0
+            self.put(question, schema_hash, model, sql, ai_provider=ai_provider, ai_model=model, age_seconds=age)
+            added += 1
+        return added
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'schema_hash': self._schema_hash,
+            }
+
+
+# Process-wide cache shared by every QueryEngine instance
+sql_cache = SQLGenerationCache()
@@ -116,6 +116,16 @@ def detect_query_intent(question: str) -> str:
         return 'general'
 
 
+# Words that carry no meaning for picking tables (English/French)
+QUESTION_STOPWORDS = {
+    'the', 'a', 'an', 'of', 'in', 'on', 'for', 'by', 'and', 'or', 'to', 'is', 'are', 'was', 'what', 'which',
+    'how', 'many', 'much', 'show', 'me', 'list', 'give', 'get', 'all', 'this', 'that', 'last', 'my', 'our',
+    'with', 'from', 'per', 'de', 'la', 'le', 'les', 'des', 'du', 'un', 'une', 'et', 'ou', 'par', 'pour', 'en',
+    'combien', 'quel', 'quelle', 'quels', 'quelles', 'montre', 'moi', 'liste', 'mes', 'nos', 'avec', 'est',
+    'sont', 'ce', 'cette', 'ces', 'dans', 'sur', 'au', 'aux', 'il', 'y', 'a'
+}
+
+
 def extract_entities(question: str) -> Dict[str, List[str]]:
     """Extract entities from user question (basic implementation)"""
     import re
@@ -124,7 +134,8 @@ def extract_entities(question: str) -> Dict[str, List[str]]:
         'dates': [],
         'activities': [],
         'numbers': [],
-        'emails': []
+        'emails': [],
+        'keywords': []
     }
     
     # Extract dates (simple patterns)
@@ -147,6 +158,10 @@ def extract_entities(question: str) -> Dict[str, List[str]]:
     email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
     entities['emails'] = re.findall(email_pattern, question)
     
+    # Remaining content words (lowercase, in order, no duplicates) for table/column matching
+    words = re.findall(r"[^\W\d_]+", question.lower())
+    entities['keywords'] = list(dict.fromkeys(w for w in words if len(w) > 1 and w not in QUESTION_STOPWORDS))
+    
     return entities
 
 
@@ -0,0 +1,263 @@
+"""
+Data Retention - Archival engine for the append-only log tables
+Old rows from admin_action_log, email_log, ebank_payment, reminder_log and
+query_log are moved into monthly gzip JSONL files under instance/archive/,
+their per-month counts are kept in log_archive_summary, and the live tables
+stay small enough that the full scans in the activity log stay cheap.
+
+Runs daily from the scheduler (see init_scheduler in app.py). Retention
+windows can be overridden per table with RETENTION_DAYS_<TABLE> settings,
+and the whole job disabled with ENABLE_DATA_RETENTION=False.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join("instance", "archive")
+BATCH_SIZE = 1000
+INCREMENTAL_VACUUM_PAGES = 2000  # Pages released per run (4KB each = ~8MB)
+
+# table_name -> policy
+#   model:        models.py class name
+#   time_column:  column compared against the retention cutoff
+#   days:         default retention window
+#   group_column: optional column whose value is counted separately in the summary
+#   keep_values:  group_column values that are never archived (rows still needing attention)
+#   entity_columns: optional columns identifying one logical record logged several times
+#                 (e.g. a payment email seen NO_MATCH, then MATCHED). Its rows are archived
+#                 together, only once its latest row is past the window and not in keep_values,
+#                 so "latest row per record" queries never see an older state resurface.
+RETENTION_POLICIES = {
+    "admin_action_log": {"model": "AdminActionLog", "time_column": "timestamp", "days": 365,
+                         "group_column": None, "keep_values": ()},
+    "email_log": {"model": "EmailLog", "time_column": "timestamp", "days": 180,
+                  "group_column": "result", "keep_values": ("FAILED",)},
+    "ebank_payment": {"model": "EbankPayment", "time_column": "timestamp", "days": 365,
+                      "group_column": "result", "keep_values": ("NO_MATCH",),
+                      "entity_columns": ("bank_info_name", "bank_info_amt", "from_email")},
+    "reminder_log": {"model": "ReminderLog", "time_column": "reminder_sent_at", "days": 365,
+                     "group_column": None, "keep_values": ()},
+    "query_log": {"model": "QueryLog", "time_column": "created_at", "days": 90,
+                  "group_column": "execution_status", "keep_values": ()},
+}
+
+
+def get_retention_days(table_name):
+    """Retention window for a table, overridable with RETENTION_DAYS_<TABLE_NAME>."""
+    from utils import get_setting
+
+    default = RETENTION_POLICIES[table_name]["days"]
+    try:
+        days = int(get_setting(f"RETENTION_DAYS_{table_name.upper()}", str(default)))
+    except (TypeError, ValueError):
+        return default
+    return max(days, 1)
+
+
+def _archive_path(table_name, month):
+    return os.path.join(ARCHIVE_DIR, table_name, f"{month}.jsonl.gz")
+
+
+def _row_month(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m")
+    return str(value or "")[:7] or "unknown"
+
+
+def _append_to_archive(table_name, rows_by_month):
+    """Append rows to their monthly archive files and fsync before the live rows are deleted."""
+    for month, rows in rows_by_month.items():
+        path = _archive_path(table_name, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Appending creates a new gzip member; gzip.open reads multi-member files transparently
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _update_summary(table_name, counts):
+    from models import db, LogArchiveSummary
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    now = datetime.now(timezone.utc)
+    for (month, group_value), count in counts.items():
+        stmt = sqlite_insert(LogArchiveSummary).values(
+            table_name=table_name, month=month, group_value=group_value,
+            row_count=count, last_archived_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["table_name", "month", "group_value"],
+            set_={
+                "row_count": LogArchiveSummary.row_count + stmt.excluded.row_count,
+                "last_archived_at": stmt.excluded.last_archived_at,
+            },
+        )
+        db.session.execute(stmt)
+
+
+def archive_table(table_name, retention_days=None):
+    """
+    Move rows older than the retention window out of one live table.
+    Must run inside an app context. Returns the number of rows archived.
+    """
+    import models
+    from models import db
+    from sqlalchemy import and_, delete, exists, func, select
+
+    policy = RETENTION_POLICIES[table_name]
+    model = getattr(models, policy["model"])
+    table = model.__table__
+    time_col = table.c[policy["time_column"]]
+    group_col = table.c[policy["group_column"]] if policy["group_column"] else None
+
+    days = retention_days or get_retention_days(table_name)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    conditions = [time_col < cutoff]
+    if policy.get("entity_columns"):
+        # Whole records only: their latest row (max id, as the sidebar's unmatched count reads it)
+        # must itself be archivable, then every old row of the record goes with it
+        names = policy["entity_columns"]
+        latest_id = select(func.max(table.c.id).label("id")).group_by(*[table.c[n] for n in names]).subquery()
+        latest = table.alias("latest")
+        latest_conditions = [latest.c[policy["time_column"]] < cutoff]
+        if policy["keep_values"]:
+            latest_group = latest.c[policy["group_column"]]
+            latest_conditions.append(latest_group.is_(None) | latest_group.notin_(policy["keep_values"]))
+        conditions.append(exists().select_from(latest.join(latest_id, latest.c.id == latest_id.c.id)).where(
+            and_(*latest_conditions, *[latest.c[n].isnot_distinct_from(table.c[n]) for n in names])
+        ))
+    elif group_col is not None and policy["keep_values"]:
+        conditions.append((group_col.is_(None)) | (group_col.notin_(policy["keep_values"])))
+
+    archived = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table).where(*conditions, table.c.id > last_id).order_by(table.c.id).limit(BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+
+        rows_by_month = {}
+        counts = {}
+        for row in rows:
+            month = _row_month(row[policy["time_column"]])
+            rows_by_month.setdefault(month, []).append(dict(row))
+            group_value = str(row[policy["group_column"]] or "") if group_col is not None else ""
+            counts[(month, group_value)] = counts.get((month, group_value), 0) + 1
+
+        ids = [row["id"] for row in rows]
+        last_id = ids[-1]
+
+        # Files are durable before the delete commits; a crash in between can only duplicate, never lose
+        _append_to_archive(table_name, rows_by_month)
+        try:
+            _update_summary(table_name, counts)
+            db.session.execute(delete(table).where(table.c.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        archived += len(ids)
+
+    return archived
+
+
+def incremental_vacuum(pages=INCREMENTAL_VACUUM_PAGES):
+    """
+    Return freed pages to the filesystem without a blocking full VACUUM.
+    Only effective when the database uses auto_vacuum=INCREMENTAL (see enable_incremental_vacuum).
+    """
+    from models import db
+    from sqlalchemy import text
+
+    mode = db.session.execute(text("PRAGMA auto_vacuum")).scalar()
+    if mode != 2:
+        return False
+    db.session.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+    db.session.commit()
+    return True
+
+
+def enable_incremental_vacuum(app):
+    """
+    One-time switch to auto_vacuum=INCREMENTAL. Requires a full VACUUM, so run it
+    from a maintenance shell, not from a web worker.
+    """
+    from models import db
+    from sqlalchemy import text
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+
+
+def run_data_retention(app):
+    """Scheduled job: archive every table per its policy, then release free pages."""
+    from models import db
+    from utils import get_setting
+
+    with app.app_context():
+        if get_setting("ENABLE_DATA_RETENTION", "True") != "True":
+            print("⚪ Data retention scheduled run: DISABLED (skipping)")
+            return {}
+
+        results = {}
+        for table_name in RETENTION_POLICIES:
+            try:
+                results[table_name] = archive_table(table_name)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Data retention failed for {table_name}: {e}")
+                results[table_name] = 0
+
+        try:
+            incremental_vacuum()
+        except Exception as e:
+            logger.error(f"Incremental vacuum failed: {e}")
+
+        total = sum(results.values())
+        if total:
+            print(f"🗄️ Data retention archived {total} rows: {results}")
+        return results
+
+
+def get_archive_summary(table_name=None):
+    """Archived row counts per table/month/group, for reports on data no longer in the live tables."""
+    from models import LogArchiveSummary
+
+    query = LogArchiveSummary.query
+    if table_name:
+        query = query.filter(LogArchiveSummary.table_name == table_name)
+
+    return [
+        {
+            "table_name": s.table_name,
+            "month": s.month,
+            "group_value": s.group_value,
+            "row_count": s.row_count,
+        }
+        for s in query.order_by(LogArchiveSummary.table_name, LogArchiveSummary.month.desc()).all()
+    ]
+
+
+def read_archived_rows(table_name, month):
+    """Yield archived rows (as dicts) for one table and month."""
+    path = _archive_path(table_name, month)
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,106 @@
+"""
+Database Snapshot - Consistent online copies of the live SQLite database
+Backups used to zip instance/minipass.db directly while Gunicorn workers and
+the scheduler could be writing to it, which can capture a torn file. This
+module copies it with SQLite's online backup API instead: a few pages per
+step, with a short sleep between steps so writers are never starved, then
+checks the copy with PRAGMA integrity_check before it goes into an archive.
+
+In rollback-journal mode any write from another connection restarts a stepped
+backup from the first page, so under steady write traffic it could never
+finish. After SNAPSHOT_MAX_RESTARTS restarts the copy is redone in a single
+step, which holds one read lock for the whole copy and always completes.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PAGES_PER_STEP = 256    # Pages copied per step (4KB pages = 1MB)
+SNAPSHOT_STEP_SLEEP = 0.02       # Seconds between steps; writers get the lock in between
+SNAPSHOT_BUSY_TIMEOUT_MS = 5000
+SNAPSHOT_MAX_RESTARTS = 3        # Restarts tolerated before falling back to a single-step copy
+
+
+class SnapshotError(Exception):
+    """The snapshot could not be taken or failed its integrity check"""
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abandon a stepped backup"""
+
+
+def snapshot_database(db_path, dest_path, pages=SNAPSHOT_PAGES_PER_STEP, step_sleep=SNAPSHOT_STEP_SLEEP):
+    """
+    Copy the database at db_path to dest_path with the online backup API and verify it.
+    Returns {"pages", "bytes", "duration_ms"}; raises SnapshotError on failure.
+    """
+    if not os.path.exists(db_path):
+        raise SnapshotError(f"Database not found: {db_path}")
+
+    started = time.monotonic()
+    progress_state = {"pages": 0, "remaining": None, "restarts": 0}
+
+    def throttle(status, remaining, total):
+        progress_state["pages"] = total
+        last_remaining = progress_state["remaining"]
+        progress_state["remaining"] = remaining
+        if last_remaining is not None and remaining > last_remaining:
+            # A write to the source sent the backup back to the first page
+            progress_state["restarts"] += 1
+            if progress_state["restarts"] >= SNAPSHOT_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        if remaining:
+            time.sleep(step_sleep)
+
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.execute(f"PRAGMA busy_timeout = {SNAPSHOT_BUSY_TIMEOUT_MS}")
+        try:
+            source.backup(dest, pages=pages, progress=throttle)
+        except _TooManyRestarts:
+            logger.info(f"[SNAPSHOT] {db_path} restarted {progress_state['restarts']} times, copying in one step")
+            source.backup(dest, pages=-1, progress=throttle)
+
+        result = dest.execute("PRAGMA integrity_check").fetchone()
+        if not result or result[0] != "ok":
+            raise SnapshotError(f"Snapshot failed integrity check: {result[0] if result else 'no result'}")
+    except sqlite3.Error as e:
+        raise SnapshotError(f"Snapshot failed: {e}") from e
+    finally:
+        dest.close()
+        source.close()
+
+    stats = {
+        "pages": progress_state["pages"],
+        "bytes": os.path.getsize(dest_path),
+        "duration_ms": int((time.monotonic() - started) * 1000),
+    }
+    logger.info(f"[SNAPSHOT] {db_path} -> {dest_path}: {stats['bytes']} bytes in {stats['duration_ms']}ms")
+    return stats
+
+
+@contextmanager
+def database_snapshot(db_path, temp_dir=None):
+    """
+    Yield the path of a verified snapshot of db_path, deleted on exit.
+
+    Usage:
+        with database_snapshot(db_path) as snapshot_path:
+            zipf.write(snapshot_path, "database/minipass.db")
+    """
+    fd, snapshot_path = tempfile.mkstemp(prefix="minipass_snapshot_", suffix=".db", dir=temp_dir)
+    os.close(fd)
+    try:
+        snapshot_database(db_path, snapshot_path)
+        yield snapshot_path
+    finally:
+        try:
+            os.remove(snapshot_path)
+        except OSError:
+            pass
@@ -91,31 +91,40 @@ def validate_json(schema_class):
     return decorator
 
 def log_api_call(f):
-    """Decorator to log API calls for audit purposes"""
+    """
+    Decorator to log API calls for audit purposes.
+    Events are queued and written in batches by audit_writer's background
+    flusher, so the decorated request never writes to the database itself.
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        from models import db, AdminActionLog
-        
-        admin_email = session.get('admin_email', 'unknown')
+        from flask import current_app
+        from audit_writer import record_api_call
+        import time
+
+        admin_email = session.get('admin_email') or session.get('admin') or 'unknown'
         endpoint = request.endpoint
         method = request.method
-        
-        # Log the API call
-        log = AdminActionLog(
-            admin_email=admin_email,
-            action=f"API Call: {method} {endpoint}",
-            timestamp=datetime.now()
-        )
-        db.session.add(log)
-        
+        started = time.perf_counter()
+        status_code = 500
+
         try:
             result = f(*args, **kwargs)
-            db.session.commit()
+            if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+                status_code = result[1]
+            else:
+                status_code = getattr(result, 'status_code', 200)
             return result
-        except Exception as e:
-            db.session.rollback()
-            raise
-    
+        finally:
+            record_api_call(
+                current_app._get_current_object(),
+                admin_email=admin_email,
+                method=method,
+                endpoint=endpoint,
+                status_code=status_code,
+                duration_ms=int((time.perf_counter() - started) * 1000),
+            )
+
     return decorated_function
 
 def cache_response(timeout=300):
@@ -0,0 +1,416 @@
+"""
+Export Jobs - Background builds for exports too slow for a web request
+The request only records an ExportJob row and hands it to a per-process
+worker thread; the file is built in instance/exports/, progress is written
+back to the row, and the admin polls /exports/<job_id> and downloads when
+the job is ready. Job state lives in the database so any Gunicorn worker
+can answer the poll. Artifacts expire after ARTIFACT_TTL_HOURS and are
+removed by the scheduled expire_export_jobs() run.
+"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zipfile import ZipFile, ZIP_DEFLATED
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_DIR = os.path.join("instance", "exports")
+ARTIFACT_TTL_HOURS = 24          # Ready artifacts are downloadable this long
+STALE_JOB_HOURS = 6              # Queued/running jobs older than this died with their worker
+MAX_WORKERS = 1                  # Concurrent builds per process (keeps disk I/O off the web threads)
+PROGRESS_INTERVAL_SECONDS = 1.0  # Min delay between progress writes
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """One executor per process (Gunicorn forks after import)."""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    with _executor_lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="export-job")
+            _executor_pid = pid
+    return _executor
+
+
+def artifact_path(job_id):
+    return os.path.join(EXPORT_JOB_DIR, f"{job_id}.artifact")
+
+
+# ================================
+# 🧾 FINANCIAL ZIP (CSV + RECEIPTS)
+# ================================
+
+def generate_smart_filename(source_type, record_id, date, amount, original_filename):
+    """
+    Generate smart filename for ZIP export: {TYPE}-{ID}_{DATE}_{AMOUNT}_{original}.{ext}
+    Example: INCOME-42_2025-01-15_150_00_receipt.jpg
+    """
+    import re
+    from werkzeug.utils import secure_filename
+
+    # Extract extension
+    ext = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else 'file'
+
+    # Extract original base name (remove UUID prefix if present)
+    original_base = original_filename.rsplit('.', 1)[0]
+    original_base = re.sub(r'^(income|expense)_[a-f0-9]{32}', '', original_base)
+    if not original_base:
+        original_base = 'receipt'
+    original_base = secure_filename(original_base) or 'receipt'
+
+    # Format date
+    if hasattr(date, 'strftime'):
+        date_str = date.strftime('%Y-%m-%d')
+    else:
+        date_str = str(date).split()[0]
+
+    # Format amount (replace . with _ for filename safety)
+    amount_str = f"{float(amount):.2f}".replace('.', '_')
+
+    # Build filename
+    type_prefix = source_type.upper()
+    return f"{type_prefix}-{record_id}_{date_str}_{amount_str}_{original_base}.{ext}"
+
+
+FINANCIAL_ZIP_QUERY = """
+    SELECT
+        strftime('%Y-%m', COALESCE(p.paid_date, p.created_dt)) as month,
+        a.name as project,
+        'Income' as transaction_type,
+        COALESCE(p.paid_date, p.created_dt) as transaction_date,
+        u.name as customer,
+        CASE
+            WHEN p.payment_method IN ('cash', 'pos', 'cheque')
+            THEN CASE WHEN p.notes IS NOT NULL AND p.notes != '' THEN p.notes || ' | ' ELSE '' END
+                 || CASE p.payment_method
+                        WHEN 'cash' THEN 'Cash'
+                        WHEN 'pos' THEN 'POS/TPV'
+                        WHEN 'cheque' THEN 'Cheque'
+                    END
+            WHEN p.payment_method = 'interac'
+            THEN CASE WHEN p.notes IS NOT NULL AND p.notes != '' THEN p.notes || ' | ' ELSE '' END || 'E-Transfer'
+            ELSE p.notes
+        END as memo,
+        p.pass_code AS passport_number,
+        p.sold_amt as amount,
+        CASE WHEN p.paid = 1 THEN 'Paid' ELSE 'Unpaid (AR)' END as payment_status,
+        'Passport System' as entered_by,
+        NULL as record_id,
+        'passport' as source_type,
+        NULL as receipt_filename
+    FROM passport p
+    JOIN activity a ON p.activity_id = a.id
+    LEFT JOIN user u ON p.user_id = u.id
+
+    UNION ALL
+
+    SELECT
+        strftime('%Y-%m', i.date) as month,
+        a.name as project,
+        'Income' as transaction_type,
+        i.date as transaction_date,
+        u_stripe.name as customer,
+        CASE
+            WHEN st.id IS NOT NULL
+            THEN 'Stripe Credit Card' || CASE WHEN p_stripe.pass_code IS NOT NULL THEN ' | ' || p_stripe.pass_code ELSE '' END
+            ELSE i.note
+        END as memo,
+        p_stripe.pass_code AS passport_number,
+        i.amount,
+        CASE WHEN i.payment_status = 'received' THEN 'Paid' ELSE 'Unpaid (AR)' END as payment_status,
+        COALESCE(i.created_by, 'System') as entered_by,
+        i.id as record_id,
+        'income' as source_type,
+        i.receipt_filename
+    FROM income i
+    JOIN activity a ON i.activity_id = a.id
+    LEFT JOIN stripe_transaction st ON st.income_id = i.id
+    LEFT JOIN signup sg ON sg.id = st.signup_id
+    LEFT JOIN user u_stripe ON u_stripe.id = sg.user_id
+    LEFT JOIN passport p_stripe ON p_stripe.id = st.passport_id
+
+    UNION ALL
+
+    SELECT
+        strftime('%Y-%m', e.date) as month,
+        a.name as project,
+        'Expense' as transaction_type,
+        e.date as transaction_date,
+        u_stripe.name as customer,
+        CASE
+            WHEN st.id IS NOT NULL
+            THEN 'Stripe processing fee' || CASE WHEN p_stripe.pass_code IS NOT NULL THEN ' | ' || p_stripe.pass_code ELSE '' END
+            ELSE e.description
+        END as memo,
+        p_stripe.pass_code AS passport_number,
+        e.amount,
+        CASE WHEN e.payment_status = 'paid' THEN 'Paid' ELSE 'Unpaid (AP)' END as payment_status,
+        COALESCE(e.created_by, 'System') as entered_by,
+        e.id as record_id,
+        'expense' as source_type,
+        e.receipt_filename
+    FROM expense e
+    JOIN activity a ON e.activity_id = a.id
+    LEFT JOIN stripe_transaction st ON st.id = e.stripe_transaction_id
+    LEFT JOIN signup sg ON sg.id = st.signup_id
+    LEFT JOIN user u_stripe ON u_stripe.id = sg.user_id
+    LEFT JOIN passport p_stripe ON p_stripe.id = st.passport_id
+"""
+
+
+def build_financial_zip(job, path, progress):
+    """
+    ZIP export with all documents (exports ALL data, ignores filters).
+    The CSV is spooled to disk while receipts are added, then stored last.
+    """
+    from flask import current_app
+    from models import db
+    from sqlalchemy import text
+    from export_engine import iter_sql
+
+    total = db.session.execute(text(f"SELECT COUNT(*) FROM ({FINANCIAL_ZIP_QUERY})")).scalar() or 0
+    progress(0, total)
+
+    documents_added = set()
+    receipts_dir = os.path.abspath(os.path.join(current_app.static_folder, 'uploads', 'receipts'))
+    csv_path = path + ".csv"
+
+    try:
+        with ZipFile(path, 'w') as zipf:
+            with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+                writer = csv.writer(csv_file)
+
+                # Write header with document_filename column
+                writer.writerow([
+                    'month',
+                    'project',
+                    'transaction_type',
+                    'transaction_date',
+                    'customer',
+                    'memo',
+                    'passport_number',
+                    'amount',
+                    'payment_status',
+                    'entered_by',
+                    'document_filename'
+                ])
+
+                rows = iter_sql(f"{FINANCIAL_ZIP_QUERY} ORDER BY transaction_date DESC")
+                for done, row in enumerate(rows, start=1):
+                    doc_filename = ''
+
+                    if row.receipt_filename:
+                        # Generate smart filename
+                        doc_filename = generate_smart_filename(
+                            source_type=row.source_type,
+                            record_id=row.record_id,
+                            date=row.transaction_date,
+                            amount=row.amount,
+                            original_filename=row.receipt_filename
+                        )
+
+                        # Add document to ZIP if not already added and file exists
+                        if doc_filename not in documents_added:
+                            # Security: verify path is within receipts directory
+                            receipt_path = os.path.abspath(os.path.join(receipts_dir, row.receipt_filename))
+                            if receipt_path.startswith(receipts_dir) and os.path.exists(receipt_path):
+                                zipf.write(receipt_path, f'documents/{doc_filename}')
+                                documents_added.add(doc_filename)
+                            else:
+                                # File missing - skip silently, leave doc_filename empty
+                                doc_filename = ''
+
+                    writer.writerow([
+                        row.month,
+                        row.project,
+                        row.transaction_type,
+                        row.transaction_date,
+                        row.customer or '',
+                        row.memo or '',
+                        row.passport_number or '',
+                        f"{row.amount:.2f}",
+                        row.payment_status,
+                        row.entered_by or '',
+                        doc_filename
+                    ])
+                    progress(done, total)
+
+            # Add CSV to ZIP (receipts are already compressed, the CSV is not)
+            zipf.write(csv_path, 'financial_report.csv', compress_type=ZIP_DEFLATED)
+    finally:
+        if os.path.exists(csv_path):
+            os.remove(csv_path)
+
+    progress(total, total)
+
+
+# job_type -> builder(job, artifact_path, progress(current, total)) and download mimetype
+EXPORT_JOB_TYPES = {
+    "financial_zip": {"builder": build_financial_zip, "mimetype": "application/zip"},
+}
+
+
+# ================================
+# ⚙️ JOB LIFECYCLE
+# ================================
+
+def enqueue_export_job(app, job_type, filename, created_by=None, params=None):
+    """Record a queued ExportJob and start building it in the background. Returns the job."""
+    from models import db, ExportJob
+
+    if job_type not in EXPORT_JOB_TYPES:
+        raise ValueError(f"Unknown export job type: {job_type}")
+
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        job_type=job_type,
+        params=json.dumps(params or {}),
+        status="queued",
+        filename=filename,
+        created_by=created_by,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _get_executor().submit(_run_job, app, job.id)
+    return job
+
+
+def _run_job(app, job_id):
+    from models import db, ExportJob
+
+    with app.app_context():
+        try:
+            job = db.session.get(ExportJob, job_id)
+            if job is None:
+                return
+            job.status = "running"
+            job.started_at = datetime.now(timezone.utc)
+            db.session.commit()
+
+            os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+            final_path = artifact_path(job_id)
+            part_path = final_path + ".part"
+            last_write = [0.0]
+
+            def progress(current, total):
+                # Own short transaction on its own connection: the builder's session
+                # is never committed (objects expired, connection released) mid-read
+                now = time.monotonic()
+                if current < total and now - last_write[0] < PROGRESS_INTERVAL_SECONDS:
+                    return
+                last_write[0] = now
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        ExportJob.__table__.update()
+                        .where(ExportJob.__table__.c.id == job_id)
+                        .values(progress_current=current, progress_total=total)
+                    )
+
+            try:
+                EXPORT_JOB_TYPES[job.job_type]["builder"](job, part_path, progress)
+                os.replace(part_path, final_path)
+            except Exception:
+                db.session.rollback()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+
+            now = datetime.now(timezone.utc)
+            job = db.session.get(ExportJob, job_id)
+            job.status = "ready"
+            job.file_size = os.path.getsize(final_path)
+            job.completed_at = now
+            job.expires_at = now + timedelta(hours=ARTIFACT_TTL_HOURS)
+            db.session.commit()
+            print(f"📦 Export job {job_id} ({job.job_type}) ready: {job.file_size} bytes")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Export job {job_id} failed: {e}")
+            db.session.query(ExportJob).filter_by(id=job_id).update({
+                "status": "failed",
+                "error": str(e)[:1000],
+                "completed_at": datetime.now(timezone.utc),
+                "expires_at": datetime.now(timezone.utc) + timedelta(hours=ARTIFACT_TTL_HOURS),
+            })
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def export_job_to_dict(job):
+    """JSON-safe status for the polling endpoint."""
+    percent = 0
+    if job.status == "ready":
+        percent = 100
+    elif job.progress_total:
+        percent = int(job.progress_current * 100 / job.progress_total)
+
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "progress_current": job.progress_current,
+        "progress_total": job.progress_total,
+        "percent": min(percent, 100),
+        "filename": job.filename,
+        "file_size": job.file_size,
+        "error": job.error,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+    }
+
+
+def expire_export_jobs(app):
+    """
+    Scheduled job: delete expired artifacts and their rows, fail jobs whose
+    worker died, and remove artifact files no job refers to.
+    Returns the number of jobs removed.
+    """
+    from models import db, ExportJob
+
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+
+        ExportJob.query.filter(
+            ExportJob.status.in_(("queued", "running")),
+            ExportJob.created_at < now - timedelta(hours=STALE_JOB_HOURS),
+        ).update({
+            "status": "failed",
+            "error": "Export was interrupted (server restarted). Please start it again.",
+            "completed_at": now,
+            "expires_at": now + timedelta(hours=ARTIFACT_TTL_HOURS),
+        }, synchronize_session=False)
+
+        expired = ExportJob.query.filter(ExportJob.expires_at < now).all()
+        for job in expired:
+            path = artifact_path(job.id)
+            if os.path.exists(path):
+                os.remove(path)
+            db.session.delete(job)
+        db.session.commit()
+
+        # Orphans: artifacts whose row is gone (e.g. database restored from a backup)
+        if os.path.isdir(EXPORT_JOB_DIR):
+            known = {job_id for (job_id,) in db.session.query(ExportJob.id).all()}
+            cutoff = time.time() - STALE_JOB_HOURS * 3600
+            for name in os.listdir(EXPORT_JOB_DIR):
+                job_id = name.split(".", 1)[0]
+                path = os.path.join(EXPORT_JOB_DIR, name)
+                if job_id not in known and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+
+        if expired:
+            print(f"🧹 Removed {len(expired)} expired export job(s)")
+        return len(expired)
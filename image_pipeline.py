@@ -0,0 +1,356 @@
+"""
+Image Pipeline - Store uploads now, build optimized images in a process pool
+Uploaded images used to be decoded, LANCZOS-resized and re-encoded inside the
+request, which takes seconds for a 10+ MP phone photo and holds a Gunicorn
+thread the whole time. Now the upload is written to disk untouched as
+<prefix>_<id>.orig.<ext> and that filename is used right away; once the
+request has finished, a process pool builds the optimized image (same
+max_size/format as before), a WebP twin and any extra sizes. JPEGs are decoded
+with Image.draft() at the smallest scale still covering max_size. When the
+derivative is ready, the model column still pointing at the original is
+switched to it (swap_reference) and the original is removed.
+
+Formats browsers cannot show (TIFF, BMP, ...) and hosts where the pool cannot
+start are processed inline, as before. A pool broken by a crashed worker is
+replaced and the job retried once.
+
+Activity images also get width-bound thumb/card sizes (ACTIVITY_IMAGE_SIZES)
+in JPEG and WebP; image_variant()/srcset_entries() pick them for templates
+once they exist, and the files are served as immutable.
+"""
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = max(1, min(2, (os.cpu_count() or 1) - 1))  # Leave a core for the web threads
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+ORIGINAL_SUFFIX = ".orig"
+BROWSER_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp", "MPO": "jpg"}
+OUTPUT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png"}
+
+ACTIVITY_IMAGE_FOLDER = os.path.join("static", "uploads", "activity_images")
+ACTIVITY_IMAGE_MAX_SIZE = (1200, 800)
+ACTIVITY_IMAGE_SIZES = {"thumb": (320, 800), "card": (720, 800)}  # Width-bound: the main image is at most 800 high
+VARIANT_SIZES = ("thumb", "card", "full")                          # srcset candidates, smallest first ("full" = the main image)
+IMMUTABLE_VARIANT = re.compile(r"(?<!\.orig)\.webp$|_(thumb|card)\.jpg$")  # Written once under a unique stem
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """One pool per process (Gunicorn forks after import); spawned children don't inherit web threads."""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    with _executor_lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            _executor_pid = pid
+    return _executor
+
+
+def _discard_executor(broken):
+    """Forget a pool whose worker died so the next _get_executor() starts a fresh one."""
+    global _executor
+
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+
+
+# ================================
+# 🖼️ DERIVATIVES (run in the pool)
+# ================================
+
+def _prepare(img, fmt):
+    """Normalize mode for the output format: JPEG gets transparency flattened onto white."""
+    from PIL import Image
+
+    if fmt == "PNG":
+        if img.mode == 'P' or img.mode not in ('RGBA', 'RGB'):
+            img = img.convert('RGBA')
+        return img
+
+    if img.mode in ('RGBA', 'P', 'LA'):
+        img = img.convert('RGBA')
+        bg = Image.new('RGB', img.size, (255, 255, 255))
+        bg.paste(img, mask=img.split()[3])
+        return bg
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def _save(img, path, fmt):
+    """Write atomically so a half-written file is never served."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == "JPEG":
+        img.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        img.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        img.save(tmp_path, 'PNG', optimize=True)
+    os.replace(tmp_path, path)
+
+
+def build_derivatives(source_path, dest_folder, stem, fmt="JPEG", max_size=(1200, 800), sizes=None,
+                      write_main=True):
+    """
+    Build <stem>.<ext> (fitted to max_size), <stem>.webp and <stem>_<name>.<ext|webp>
+    for each extra size. Returns the main filename and every file written.
+    write_main=False leaves an existing main image as it is (backfills).
+    """
+    from PIL import Image, features
+
+    ext = OUTPUT_EXTENSIONS[fmt]
+    webp = features.check('webp')
+    written = []
+
+    def emit(img, name, main=False):
+        filename = f"{name}.{ext}"
+        if write_main or not main:
+            _save(img, os.path.join(dest_folder, filename), fmt)
+            written.append(filename)
+        if webp:
+            _save(img, os.path.join(dest_folder, f"{name}.webp"), "WEBP")
+            written.append(f"{name}.webp")
+
+    with Image.open(source_path) as img:
+        if img.format in ('JPEG', 'MPO'):
+            img.draft('RGB', max_size)  # DCT scaling: decode at 1/2, 1/4 or 1/8 when that still covers max_size
+        main = _prepare(img, fmt)
+        main.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    emit(main, stem, main=True)
+    for name, size in (sizes or {}).items():
+        variant = main.copy()
+        variant.thumbnail(size, Image.Resampling.LANCZOS)
+        emit(variant, f"{stem}_{name}")
+
+    return {"filename": f"{stem}.{ext}", "files": written}
+
+
+# ================================
+# 📥 UPLOADS
+# ================================
+
+def process_image_upload(file_stream, dest_folder, prefix="upload", max_size=(1200, 800), fmt="JPEG",
+                         sizes=None, on_ready=None):
+    """
+    Store an uploaded image and queue its derivatives; returns the filename to reference now.
+
+    on_ready(original, filename) runs in this process once the derivative exists
+    (see swap_reference). Raises if the stream is not an image PIL can read.
+    """
+    from PIL import Image
+
+    with Image.open(file_stream) as probe:  # Header only - the pixels are decoded in the pool
+        source_format = probe.format
+    file_stream.seek(0)
+
+    stem = f"{prefix}_{uuid.uuid4().hex[:10]}"
+    os.makedirs(dest_folder, exist_ok=True)
+
+    if source_format not in BROWSER_FORMATS:
+        tmp_path = os.path.join(dest_folder, f"{stem}{ORIGINAL_SUFFIX}.tmp")
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(file_stream, f)
+        try:
+            return build_derivatives(tmp_path, dest_folder, stem, fmt, max_size, sizes)["filename"]
+        finally:
+            os.remove(tmp_path)
+
+    original = f"{stem}{ORIGINAL_SUFFIX}.{BROWSER_FORMATS[source_format]}"
+    with open(os.path.join(dest_folder, original), "wb") as f:
+        shutil.copyfileobj(file_stream, f)
+
+    job = (os.path.join(dest_folder, original), dest_folder, stem, fmt, max_size, sizes)
+    _after_request(lambda: _submit(job, original, on_ready))
+    return original
+
+
+def _after_request(func):
+    """Queue once the view has committed, so on_ready finds the row it has to update."""
+    from flask import has_request_context, after_this_request
+
+    if not has_request_context():
+        func()
+        return
+
+    @after_this_request
+    def _queue(response):
+        func()
+        return response
+
+
+def _submit(job, original, on_ready, retry=True):
+    executor = None
+    try:
+        executor = _get_executor()
+        future = executor.submit(build_derivatives, *job)
+    except BrokenProcessPool as e:
+        _discard_executor(executor)
+        if retry:
+            logger.warning(f"Image pool broken ({e}), restarting it for {original}")
+            _submit(job, original, on_ready, retry=False)
+            return
+        logger.warning(f"Image pool broken again ({e}), processing {original} inline")
+        _finish(original, job[1], on_ready, lambda: build_derivatives(*job))
+        return
+    except Exception as e:  # Pool can't start (restricted host) - do it here instead
+        logger.warning(f"Image pool unavailable ({e}), processing {original} inline")
+        _finish(original, job[1], on_ready, lambda: build_derivatives(*job))
+        return
+
+    def _done(f):
+        if retry and isinstance(f.exception(), BrokenProcessPool):
+            # A worker died mid-job (e.g. OOM on a huge image): the whole pool is unusable now
+            _discard_executor(executor)
+            logger.warning(f"Image pool broke while processing {original}, retrying once")
+            _submit(job, original, on_ready, retry=False)
+            return
+        _finish(original, job[1], on_ready, f.result)
+
+    future.add_done_callback(_done)
+
+
+def _finish(original, dest_folder, on_ready, result):
+    try:
+        filename = result()["filename"]
+    except Exception as e:
+        logger.error(f"Image derivatives failed for {original}, keeping the original: {e}")
+        return
+
+    print(f"🖼️ Image ready: {original} → {filename}")
+    if on_ready is None:
+        return
+    try:
+        swapped = on_ready(original, filename)
+    except Exception as e:
+        logger.error(f"Could not switch {original} to {filename}: {e}")
+        return
+    if swapped:
+        try:
+            os.remove(os.path.join(dest_folder, original))
+        except OSError:
+            pass
+
+
+def swap_reference(model, column, after=None, **criteria):
+    """
+    on_ready callback: rows of model (filtered by criteria) whose column still holds
+    the original get the derivative's filename; after(filename) then runs in the
+    same app context. Returns the number of rows switched.
+    """
+    from flask import current_app
+
+    app = current_app._get_current_object()
+
+    def _swap(original, filename):
+        from models import db
+
+        with app.app_context():
+            query = model.query.filter_by(**criteria).filter(getattr(model, column) == original)
+            count = query.update({column: filename}, synchronize_session=False)
+            db.session.commit()
+            if count and after:
+                after(filename)
+            return count
+
+    return _swap
+
+
+def ready_image(dest_folder, filename, fmt="JPEG"):
+    """
+    Derivative filename for an original whose derivatives already exist (the
+    original is then deleted, as swap_reference would have), else filename unchanged.
+    """
+    if not filename:
+        return filename
+    stem, _ = os.path.splitext(filename)
+    if not stem.endswith(ORIGINAL_SUFFIX):
+        return filename
+    derivative = f"{stem[:-len(ORIGINAL_SUFFIX)]}.{OUTPUT_EXTENSIONS[fmt]}"
+    if not os.path.exists(os.path.join(dest_folder, derivative)):
+        return filename
+    try:
+        os.remove(os.path.join(dest_folder, filename))
+    except OSError:
+        pass
+    return derivative
+
+
+# ================================
+# 📐 RESPONSIVE VARIANTS
+# ================================
+
+_variants_ready = set()  # (folder, filename) known to have every variant - derivative files never change
+_variant_widths = {}     # (folder, filename) -> [(size, actual pixel width)], read once from the built files
+
+
+def has_variants(filename, folder=ACTIVITY_IMAGE_FOLDER):
+    """True once the WebP twin and the thumb/card JPEG+WebP of filename exist."""
+    if not filename or f"{ORIGINAL_SUFFIX}." in filename:
+        return False
+    if (folder, filename) in _variants_ready:
+        return True
+
+    stem = os.path.splitext(filename)[0]
+    names = [f"{stem}.webp"] + [f"{stem}_{size}.{ext}" for size in ACTIVITY_IMAGE_SIZES for ext in ("jpg", "webp")]
+    if all(os.path.exists(os.path.join(folder, name)) for name in names):
+        _variants_ready.add((folder, filename))
+        return True
+    return False
+
+
+def image_variant(filename, size="full", ext="jpg", folder=ACTIVITY_IMAGE_FOLDER):
+    """Filename of the size ("thumb", "card", "full") / format ("jpg", "webp") variant, or filename if none were built."""
+    if not has_variants(filename, folder):
+        return filename
+    stem = os.path.splitext(filename)[0]
+    if size == "full":
+        return filename if ext == "jpg" else f"{stem}.{ext}"
+    return f"{stem}_{size}.{ext}"
+
+
+def _read_variant_widths(filename, folder):
+    """
+    Real widths of the JPEG variants (WebP twins share them), read from the file
+    headers: the sizes are bounds, so a 4:3 or portrait image comes out narrower.
+    Sizes no wider than a smaller one (e.g. card == full for portraits) are dropped.
+    """
+    from PIL import Image
+
+    key = (folder, filename)
+    if key not in _variant_widths:
+        widths = []
+        for size in VARIANT_SIZES:
+            with Image.open(os.path.join(folder, image_variant(filename, size, "jpg", folder))) as img:
+                width = img.width
+            if not widths or width > widths[-1][1]:
+                widths.append((size, width))
+        _variant_widths[key] = widths
+    return _variant_widths[key]
+
+
+def srcset_entries(filename, ext="jpg", folder=ACTIVITY_IMAGE_FOLDER):
+    """[(variant filename, actual width)] smallest first, or [] if no variants exist (or they can't be read)."""
+    if not has_variants(filename, folder):
+        return []
+    try:
+        widths = _read_variant_widths(filename, folder)
+    except (OSError, ImportError):
+        return []
+    return [(image_variant(filename, size, ext, folder), width) for size, width in widths]
@@ -3200,6 +3200,500 @@ def task39_add_announcement_log(cursor):
         raise
 
 
+# ============================================================================
+# TASK 40: API audit tables (log_api_call writes here in batches)
+# ============================================================================
+def task40_add_api_audit_tables(cursor):
+    """Create api_audit_log + api_audit_hourly and move legacy 'API Call:' rows out of admin_action_log."""
+    log("📋", "TASK 40: API audit tables", Colors.BLUE)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS api_audit_log (
+                id INTEGER NOT NULL PRIMARY KEY,
+                timestamp DATETIME,
+                admin_email VARCHAR(150),
+                method VARCHAR(10),
+                endpoint VARCHAR(150),
+                status_code INTEGER,
+                duration_ms INTEGER
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_api_audit_log_timestamp ON api_audit_log (timestamp)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS api_audit_hourly (
+                id INTEGER NOT NULL PRIMARY KEY,
+                hour DATETIME NOT NULL,
+                endpoint VARCHAR(150) NOT NULL,
+                method VARCHAR(10) NOT NULL,
+                call_count INTEGER NOT NULL DEFAULT 0,
+                CONSTRAINT uq_api_audit_hourly_bucket UNIQUE (hour, endpoint, method)
+            )
+        """)
+        log("✅", "  api_audit_log / api_audit_hourly created (or already existed)", Colors.GREEN)
+
+        # Legacy rows look like "API Call: GET get_kpi_data_api" ("API Call: " is 10 characters)
+        cursor.execute("SELECT COUNT(*) FROM admin_action_log WHERE action LIKE 'API Call: % %'")
+        legacy = cursor.fetchone()[0]
+        if legacy == 0:
+            log("⏭️ ", "  No legacy API call rows in admin_action_log", Colors.YELLOW)
+            return True
+
+        cursor.execute("""
+            INSERT INTO api_audit_log (timestamp, admin_email, method, endpoint)
+            SELECT timestamp,
+                   admin_email,
+                   substr(action, 11, instr(substr(action, 11), ' ') - 1),
+                   substr(action, 11 + instr(substr(action, 11), ' '))
+            FROM admin_action_log
+            WHERE action LIKE 'API Call: % %'
+        """)
+        # Roll up only the rows moved here: api_audit_log may already hold rows the
+        # running app wrote and rolled up itself
+        cursor.execute("""
+            INSERT INTO api_audit_hourly (hour, endpoint, method, call_count)
+            SELECT hour, endpoint, method, COUNT(*)
+            FROM (
+                SELECT strftime('%Y-%m-%d %H:00:00.000000', timestamp) AS hour,
+                       substr(action, 11 + instr(substr(action, 11), ' ')) AS endpoint,
+                       substr(action, 11, instr(substr(action, 11), ' ') - 1) AS method
+                FROM admin_action_log
+                WHERE action LIKE 'API Call: % %' AND timestamp IS NOT NULL
+            )
+            GROUP BY hour, endpoint, method
+            ON CONFLICT (hour, endpoint, method) DO UPDATE SET call_count = call_count + excluded.call_count
+        """)
+        cursor.execute("DELETE FROM admin_action_log WHERE action LIKE 'API Call: % %'")
+        log("✅", f"  Moved {legacy} legacy API call rows out of admin_action_log", Colors.GREEN)
+        return True
+    except sqlite3.OperationalError as e:
+        log("❌", f"  Task 40 failed: {e}", Colors.RED)
+        raise
+
+
+# ============================================================================
+# TASK 41: Log archive summary table (data_retention.py)
+# ============================================================================
+def task41_add_log_archive_summary(cursor):
+    """Create log_archive_summary for per-month counts of archived log rows."""
+    log("🗄️ ", "TASK 41: log_archive_summary table", Colors.BLUE)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS log_archive_summary (
+                id INTEGER NOT NULL PRIMARY KEY,
+                table_name VARCHAR(50) NOT NULL,
+                month VARCHAR(7) NOT NULL,
+                group_value VARCHAR(50) NOT NULL DEFAULT '',
+                row_count INTEGER NOT NULL DEFAULT 0,
+                last_archived_at DATETIME,
+                CONSTRAINT uq_log_archive_summary_bucket UNIQUE (table_name, month, group_value)
+            )
+        """)
+        log("✅", "  log_archive_summary table created (or already existed)", Colors.GREEN)
+        return True
+    except sqlite3.OperationalError as e:
+        log("❌", f"  Task 41 failed: {e}", Colors.RED)
+        raise
+
+
+# ============================================================================
+# TASK 42: Activity.reserved_sessions counter + passport triggers
+# ============================================================================
+def task42_add_reserved_sessions_counter(cursor):
+    """Add activity.reserved_sessions (= SUM(passport.uses_remaining)) kept current by triggers."""
+    log("🎟️ ", "TASK 42: Activity reserved_sessions counter", Colors.BLUE)
+
+    if check_column_exists(cursor, 'activity', 'reserved_sessions'):
+        log("⏭️ ", "  Activity.reserved_sessions already exists", Colors.YELLOW)
+    else:
+        cursor.execute("ALTER TABLE activity ADD COLUMN reserved_sessions INTEGER DEFAULT 0")
+        log("✅", "  Added Activity.reserved_sessions", Colors.GREEN)
+
+    # Triggers run inside the writing transaction, so every path that touches
+    # uses_remaining (ORM, bulk .update(), deletes) keeps the counter exact
+    triggers = [
+        ("trg_passport_reserved_insert", """
+            CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_insert
+            AFTER INSERT ON passport
+            BEGIN
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.uses_remaining, 0)
+                WHERE id = NEW.activity_id;
+            END
+        """),
+        ("trg_passport_reserved_update", """
+            CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_update
+            AFTER UPDATE OF uses_remaining, activity_id ON passport
+            BEGIN
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.uses_remaining, 0)
+                WHERE id = OLD.activity_id;
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.uses_remaining, 0)
+                WHERE id = NEW.activity_id;
+            END
+        """),
+        ("trg_passport_reserved_delete", """
+            CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_delete
+            AFTER DELETE ON passport
+            BEGIN
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.uses_remaining, 0)
+                WHERE id = OLD.activity_id;
+            END
+        """),
+    ]
+    for name, sql in triggers:
+        cursor.execute(sql)
+        log("✅", f"  Trigger {name} created (or already existed)", Colors.GREEN)
+
+    # Backfill (idempotent: recomputes from scratch)
+    cursor.execute("""
+        UPDATE activity
+        SET reserved_sessions = (
+            SELECT COALESCE(SUM(passport.uses_remaining), 0)
+            FROM passport WHERE passport.activity_id = activity.id
+        )
+    """)
+    log("✅", f"  Backfilled reserved_sessions for {cursor.rowcount} activities", Colors.GREEN)
+    return True
+
+
+# ============================================================================
+# TASK 43: FTS5 search index for the admin search boxes
+# ============================================================================
+# rowid = source id * 8 + entity code (must match SEARCH_ENTITY_CODES in utils.py)
+SEARCH_INDEX_SOURCES = [
+    # (table, entity code, {fts column: SQL expression over {r}}, columns watched by the UPDATE trigger)
+    ('"user"', 1, {
+        'name': "COALESCE({r}.name, '')",
+        'email': "COALESCE({r}.email, '')",
+        'code': "''",
+        'body': "COALESCE({r}.phone_number, '')",
+    }, "name, email, phone_number"),
+    ('passport', 2, {
+        'name': "''",
+        'email': "''",
+        'code': "COALESCE({r}.pass_code, '')",
+        'body': "COALESCE({r}.notes, '')",
+    }, "pass_code, notes"),
+    ('signup', 3, {
+        'name': "''",
+        'email': "''",
+        'code': "COALESCE({r}.signup_code, '')",
+        'body': "COALESCE({r}.subject, '') || ' ' || COALESCE({r}.description, '') || ' ' || COALESCE({r}.form_data, '')",
+    }, "signup_code, subject, description, form_data"),
+    ('activity', 4, {
+        'name': "COALESCE({r}.name, '')",
+        'email': "''",
+        'code': "''",
+        'body': "''",
+    }, "name"),
+    ('ebank_payment', 5, {
+        'name': "COALESCE({r}.bank_info_name, '')",
+        'email': "COALESCE({r}.from_email, '') || ' ' || COALESCE({r}.reply_to_email, '')",
+        'code': "''",
+        'body': "COALESCE({r}.subject, '') || ' ' || COALESCE({r}.matched_name, '')",
+    }, "bank_info_name, from_email, reply_to_email, subject, matched_name"),
+]
+
+
+def task43_add_search_index(cursor):
+    """Create the search_index FTS5 table, its sync triggers, and (re)build its content."""
+    log("🔍", "TASK 43: FTS5 search index", Colors.BLUE)
+
+    try:
+        # remove_diacritics 2 folds accents like utils.normalize_name()
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                name, email, code, body,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        log("⚠️ ", f"  FTS5 not available in this SQLite build ({e}) - search keeps using LIKE", Colors.YELLOW)
+        return True
+
+    _create_search_sync(cursor, "search_index", "trg_search", SEARCH_INDEX_SOURCES, ('name', 'email', 'code', 'body'))
+    return True
+
+
+def _create_search_sync(cursor, fts_table, trigger_prefix, sources, fts_columns):
+    """Sync triggers from each source table into fts_table, then rebuild its rows."""
+    columns = ", ".join(("rowid",) + fts_columns)
+    for table, code, exprs, watched in sources:
+        plain = table.strip('"')
+
+        def values(r):
+            return ", ".join([f"{r}.id * 8 + {code}"] + [exprs[c].format(r=r) for c in fts_columns])
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_{plain}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts_table} ({columns}) VALUES ({values('NEW')});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_{plain}_update AFTER UPDATE OF {watched} ON {table}
+            BEGIN
+                DELETE FROM {fts_table} WHERE rowid = OLD.id * 8 + {code};
+                INSERT INTO {fts_table} ({columns}) VALUES ({values('NEW')});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_{plain}_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM {fts_table} WHERE rowid = OLD.id * 8 + {code};
+            END
+        """)
+
+        # Rebuild this source's rows (idempotent)
+        cursor.execute(f"DELETE FROM {fts_table} WHERE rowid % 8 = {code}")
+        cursor.execute(f"INSERT INTO {fts_table} ({columns}) SELECT {values('t')} FROM {table} t")
+        log("✅", f"  Indexed {cursor.rowcount} {plain} rows into {fts_table} (+ sync triggers)", Colors.GREEN)
+
+
+# ============================================================================
+# TASK 44: Background export jobs (export_jobs.py)
+# ============================================================================
+def task44_add_export_job_table(cursor):
+    """Create export_job to track background exports and their downloadable artifacts."""
+    log("📦", "TASK 44: export_job table", Colors.BLUE)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS export_job (
+                id VARCHAR(32) NOT NULL PRIMARY KEY,
+                job_type VARCHAR(50) NOT NULL,
+                params TEXT,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                progress_current INTEGER NOT NULL DEFAULT 0,
+                progress_total INTEGER NOT NULL DEFAULT 0,
+                filename VARCHAR(255),
+                file_size INTEGER,
+                error TEXT,
+                created_by VARCHAR(150),
+                created_at DATETIME,
+                started_at DATETIME,
+                completed_at DATETIME,
+                expires_at DATETIME
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_export_job_expires_at ON export_job (expires_at)")
+        log("✅", "  export_job table created (or already existed)", Colors.GREEN)
+        return True
+    except sqlite3.OperationalError as e:
+        log("❌", f"  Task 44 failed: {e}", Colors.RED)
+        raise
+
+
+# ============================================================================
+# TASK 45: Per-table data version counters (chatbot result cache)
+# ============================================================================
+DATA_VERSION_TABLES = [
+    'passport', 'signup', 'income', 'expense', 'stripe_transaction',
+    'user', 'activity', 'passport_type',
+]
+
+
+def task45_add_data_version_tracking(cursor):
+    """Create data_version (one counter per table) bumped by triggers on every write."""
+    log("🔢", "TASK 45: data_version counters", Colors.BLUE)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            table_name VARCHAR(50) NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    for table in DATA_VERSION_TABLES:
+        if not check_table_exists(cursor, table):
+            log("⏭️ ", f"  Table {table} not found, skipping", Colors.YELLOW)
+            continue
+
+        cursor.execute("INSERT OR IGNORE INTO data_version (table_name, version) VALUES (?, 0)", (table,))
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_{op.lower()}
+                AFTER {op} ON "{table}"
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
+        log("✅", f"  {table}: version counter + triggers", Colors.GREEN)
+
+    return True
+
+
+# ============================================================================
+# TASK 46: Responsive Variants for Existing Activity Images
+# ============================================================================
+def task46_add_activity_image_variants(cursor):
+    """Build thumb/card/full WebP + JPEG variants for existing activity images (the main file is kept)."""
+    from image_pipeline import (
+        build_derivatives, has_variants, ACTIVITY_IMAGE_MAX_SIZE, ACTIVITY_IMAGE_SIZES, ORIGINAL_SUFFIX
+    )
+
+    log("🖼️ ", "TASK 46: Responsive activity image variants", Colors.BLUE)
+
+    upload_dir = os.path.normpath(
+        os.path.join(os.path.dirname(__file__), '..', 'static', 'uploads', 'activity_images')
+    )
+    if not os.path.isdir(upload_dir):
+        log("⏭️ ", f"  Upload dir not found: {upload_dir}", Colors.YELLOW)
+        return True
+
+    cursor.execute("SELECT id, image_filename FROM activity WHERE image_filename IS NOT NULL")
+    activities = cursor.fetchall()
+
+    processed = skipped = failed = 0
+    variant_kb = 0
+
+    for activity_id, image_filename in activities:
+        filepath = os.path.join(upload_dir, image_filename)
+        if not os.path.isfile(filepath):
+            log("⚠️ ", f"  Missing file: {image_filename}", Colors.YELLOW)
+            continue
+
+        if has_variants(image_filename, upload_dir):
+            skipped += 1
+            continue
+
+        stem, _ = os.path.splitext(image_filename)
+        pending = stem.endswith(ORIGINAL_SUFFIX)  # Upload whose derivatives never ran: build the main image too
+        if pending:
+            stem = stem[:-len(ORIGINAL_SUFFIX)]
+
+        try:
+            result = build_derivatives(filepath, upload_dir, stem, "JPEG", ACTIVITY_IMAGE_MAX_SIZE,
+                                       ACTIVITY_IMAGE_SIZES, write_main=pending)
+            kb = sum(os.path.getsize(os.path.join(upload_dir, f)) for f in result["files"]) / 1024
+            variant_kb += kb
+            log("✅", f"  {image_filename}: {len(result['files'])} variants ({kb:.0f}KB)", Colors.GREEN)
+
+            if pending:
+                cursor.execute(
+                    "UPDATE activity SET image_filename = ? WHERE id = ?",
+                    (result["filename"], activity_id)
+                )
+                log("🔄", f"  DB updated: {image_filename} → {result['filename']}", Colors.BLUE)
+                # NOTE: the .orig upload is kept on disk, like task 29 kept replaced files
+
+            processed += 1
+
+        except Exception as e:
+            log("❌", f"  Failed {image_filename}: {e}", Colors.RED)
+            failed += 1
+
+    log("📊", f"  Processed: {processed}, Already done: {skipped}, Failed: {failed}")
+    log("💾", f"  Variants written: {variant_kb/1024:.1f}MB", Colors.GREEN)
+    return True
+
+
+# ============================================================================
+# TASK 47: Signup capacity holds on Activity.reserved_sessions
+# ============================================================================
+def task47_add_signup_capacity_holds(cursor):
+    """Count open signups in activity.reserved_sessions; triggers release the hold."""
+    log("🎟️ ", "TASK 47: Signup capacity holds", Colors.BLUE)
+
+    # Must match SIGNUP_HOLDS_CAPACITY_SQL / RESERVED_SESSIONS_TRIGGERS in utils.py.
+    # The hold itself is taken by reserve_capacity() in the signup transaction.
+    holds = "{t}.status IN ('pending', 'stripe_processing') AND {t}.passport_id IS NULL"
+    triggers = [
+        ("trg_signup_reserved_update", f"""
+            CREATE TRIGGER IF NOT EXISTS trg_signup_reserved_update
+            AFTER UPDATE OF status, passport_id, requested_sessions, activity_id ON signup
+            BEGIN
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.requested_sessions, 0)
+                WHERE id = OLD.activity_id AND {holds.format(t='OLD')};
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.requested_sessions, 0)
+                WHERE id = NEW.activity_id AND {holds.format(t='NEW')};
+            END
+        """),
+        ("trg_signup_reserved_delete", f"""
+            CREATE TRIGGER IF NOT EXISTS trg_signup_reserved_delete
+            AFTER DELETE ON signup
+            BEGIN
+                UPDATE activity
+                SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.requested_sessions, 0)
+                WHERE id = OLD.activity_id AND {holds.format(t='OLD')};
+            END
+        """),
+    ]
+    for name, sql in triggers:
+        cursor.execute(sql)
+        log("✅", f"  Trigger {name} created (or already existed)", Colors.GREEN)
+
+    # Recount: passports + open signups (idempotent)
+    cursor.execute(f"""
+        UPDATE activity
+        SET reserved_sessions = (
+            SELECT COALESCE(SUM(passport.uses_remaining), 0)
+            FROM passport WHERE passport.activity_id = activity.id
+        ) + (
+            SELECT COALESCE(SUM(signup.requested_sessions), 0)
+            FROM signup WHERE signup.activity_id = activity.id AND {holds.format(t='signup')}
+        )
+    """)
+    log("✅", f"  Recounted reserved_sessions for {cursor.rowcount} activities", Colors.GREEN)
+    return True
+
+
+# ============================================================================
+# TASK 48: Trigram search index (mid-word fragments of names, emails, codes)
+# ============================================================================
+SEARCH_TRIGRAM_SOURCES = [
+    # Short identifying fields only: pass/signup codes, emails, phone numbers and names
+    # are what people search by fragment; long text stays word-prefix only (search_index)
+    ('"user"', 1, {
+        'name': "COALESCE({r}.name, '')",
+        'email': "COALESCE({r}.email, '')",
+        'code': "COALESCE({r}.phone_number, '')",
+    }, "name, email, phone_number"),
+    ('passport', 2, {
+        'name': "''",
+        'email': "''",
+        'code': "COALESCE({r}.pass_code, '')",
+    }, "pass_code"),
+    ('signup', 3, {
+        'name': "''",
+        'email': "''",
+        'code': "COALESCE({r}.signup_code, '')",
+    }, "signup_code"),
+    ('activity', 4, {
+        'name': "COALESCE({r}.name, '')",
+        'email': "''",
+        'code': "''",
+    }, "name"),
+    ('ebank_payment', 5, {
+        'name': "COALESCE({r}.bank_info_name, '')",
+        'email': "COALESCE({r}.from_email, '') || ' ' || COALESCE({r}.reply_to_email, '')",
+        'code': "''",
+    }, "bank_info_name, from_email, reply_to_email"),
+]
+
+
+def task48_add_search_trigram_index(cursor):
+    """Create search_trigram (FTS5 trigram tokenizer) so searches match inside words, like the old LIKE '%q%'."""
+    log("🔍", "TASK 48: FTS5 trigram search index", Colors.BLUE)
+
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_trigram USING fts5(
+                name, email, code,
+                tokenize = 'trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        log("⚠️ ", f"  Trigram tokenizer not available (SQLite < 3.34: {e}) - word-prefix search only", Colors.YELLOW)
+        return True
+
+    _create_search_sync(cursor, "search_trigram", "trg_searchtri", SEARCH_TRIGRAM_SOURCES, ('name', 'email', 'code'))
+    return True
+
+
 # ============================================================================
 # MAIN UPGRADE FUNCTION
 # ============================================================================
@@ -3259,6 +3753,15 @@ def main():
         ("Fix entered_by in Financial View", task37_fix_entered_by_in_view),
         ("Passport Number in Financial View", task38_add_passport_number_to_financial_view),
         ("Announcement Log Table", task39_add_announcement_log),
+        ("API Audit Tables", task40_add_api_audit_tables),
+        ("Log Archive Summary Table", task41_add_log_archive_summary),
+        ("Reserved Sessions Counter", task42_add_reserved_sessions_counter),
+        ("Search Index (FTS5)", task43_add_search_index),
+        ("Export Job Table", task44_add_export_job_table),
+        ("Data Version Counters", task45_add_data_version_tracking),
+        ("Activity Image Variants", task46_add_activity_image_variants),
+        ("Signup Capacity Holds", task47_add_signup_capacity_holds),
+        ("Search Trigram Index", task48_add_search_trigram_index),
     ]
 
     completed = 0
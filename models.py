@@ -47,6 +47,74 @@ class AdminActionLog(db.Model):
     action = db.Column(db.Text)
 
 
+class ApiAuditLog(db.Model):
+    """Raw API audit events, written in batches by audit_writer (off the request path)"""
+    __tablename__ = "api_audit_log"
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    admin_email = db.Column(db.String(150))
+    method = db.Column(db.String(10))
+    endpoint = db.Column(db.String(150))
+    status_code = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_api_audit_log_timestamp', 'timestamp'),
+    )
+
+
+class ApiAuditHourly(db.Model):
+    """Hourly rollup of API calls per endpoint (kept after raw rows are pruned)"""
+    __tablename__ = "api_audit_hourly"
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)  # UTC, truncated to the hour
+    endpoint = db.Column(db.String(150), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    call_count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'endpoint', 'method', name='uq_api_audit_hourly_bucket'),
+    )
+
+
+class LogArchiveSummary(db.Model):
+    """Per-month row counts for log rows moved out of the live tables by data_retention"""
+    __tablename__ = "log_archive_summary"
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    month = db.Column(db.String(7), nullable=False)            # "YYYY-MM" of the archived rows
+    group_value = db.Column(db.String(50), nullable=False, default="")  # e.g. EmailLog.result, "" when ungrouped
+    row_count = db.Column(db.Integer, default=0, nullable=False)
+    last_archived_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('table_name', 'month', 'group_value', name='uq_log_archive_summary_bucket'),
+    )
+
+
+class ExportJob(db.Model):
+    """Background export (see export_jobs.py); the built file lives in instance/exports until expires_at"""
+    __tablename__ = "export_job"
+    id = db.Column(db.String(32), primary_key=True)            # uuid4 hex, used in download URLs
+    job_type = db.Column(db.String(50), nullable=False)        # key of export_jobs.EXPORT_JOB_TYPES
+    params = db.Column(db.Text, nullable=True)                 # JSON
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, ready, failed
+    progress_current = db.Column(db.Integer, default=0, nullable=False)
+    progress_total = db.Column(db.Integer, default=0, nullable=False)
+    filename = db.Column(db.String(255), nullable=True)        # Download name
+    file_size = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(150), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_export_job_expires_at', 'expires_at'),
+    )
+
+
 class PushSubscription(db.Model):
     """Stores push notification subscriptions for admins"""
     id = db.Column(db.Integer, primary_key=True)
@@ -120,6 +188,7 @@ class Activity(db.Model):
     is_quantity_limited = db.Column(db.Boolean, default=False)
     max_sessions = db.Column(db.Integer, nullable=True)                 # Total capacity
     show_remaining_quantity = db.Column(db.Boolean, default=False)      # Display "X left" on form
+    reserved_sessions = db.Column(db.Integer, default=0, nullable=True)  # Passport uses_remaining + open signup holds, kept by DB triggers
 
     # Stripe credit card payments
     accept_credit_card = db.Column(db.Boolean, default=False)
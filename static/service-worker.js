@@ -1,5 +1,42 @@
-// Minipass Service Worker - Push Notifications Only
-// No caching, no complexity
+// Minipass Service Worker - Push Notifications + precached app shell
+// Only the fingerprinted assets listed below are cached; pages and API calls always go to the network
+
+// Filled in by /service-worker.js from static/asset-manifest.json (python -m static_assets)
+const PRECACHE_REVISION = null;
+const PRECACHE_URLS = [];
+
+const PRECACHE_PREFIX = 'minipass-precache-';
+const PRECACHE = PRECACHE_PREFIX + PRECACHE_REVISION;
+const PRECACHED = new Set(PRECACHE_URLS);
+
+self.addEventListener('install', (event) => {
+  if (!PRECACHE_URLS.length) return;
+  event.waitUntil(
+    caches.open(PRECACHE).then((cache) => cache.addAll(PRECACHE_URLS))
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  // Fingerprinted names change with their content, so older precaches are simply dropped
+  event.waitUntil(
+    caches.keys().then((keys) => Promise.all(
+      keys
+        .filter((key) => key.startsWith(PRECACHE_PREFIX) && key !== PRECACHE)
+        .map((key) => caches.delete(key))
+    ))
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin || !PRECACHED.has(url.pathname)) {
+    return;
+  }
+  // Cache-first: a fingerprinted URL never changes content (?v= query strings are ignored)
+  event.respondWith(
+    caches.match(url.pathname, { cacheName: PRECACHE }).then((cached) => cached || fetch(event.request))
+  );
+});
 
 self.addEventListener('push', (event) => {
   const data = event.data ? event.data.json() : { title: 'Minipass', body: 'New notification' };
@@ -0,0 +1,261 @@
+"""
+Static Assets - Fingerprinted, precompressed files with far-future caching
+Everything under static/ used to be served under its plain name with Flask's
+default caching, so browsers revalidated on every page and the service worker
+could not tell a stale file from a fresh one. The build step (run once per
+deploy, see dockerfile):
+
+    python -m static_assets
+
+copies each asset to <name>.<content hash>.<ext> next to the original (CSS
+url() references are rewritten to the hashed names first), writes .gz and,
+when the brotli package is installed, .br siblings for text assets, and
+records everything in static/asset-manifest.json.
+
+At runtime url_for('static', filename=...) resolves to the fingerprinted name
+through a url_defaults hook, send_asset() serves it with Content-Encoding
+picked from Accept-Encoding and Cache-Control: immutable, and
+/service-worker.js gets the PRECACHE_ASSETS URLs inlined. Without a manifest
+(development) everything falls back to the plain files.
+"""
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = "asset-manifest.json"
+MANIFEST_VERSION = 1
+HASH_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+ASSET_EXTENSIONS = {".css", ".js", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp",
+                    ".woff", ".woff2", ".ttf", ".eot", ".wav"}
+COMPRESS_EXTENSIONS = {".css", ".js", ".svg", ".ttf", ".eot"}  # Already-compressed formats gain nothing
+COMPRESS_MIN_BYTES = 1024
+SKIP_PATHS = ("uploads/", "backups/", "tinymce/", "tabler/icons/svg/", "service-worker.js")
+# tinymce/ loads its plugins by name relative to tinymce.min.js; icons/svg/ is 6000+ files nobody links
+
+PRECACHE_ASSETS = (  # App shell, fetched by the service worker at install
+    "tabler/css/tabler.min.css",
+    "tabler/js/tabler.min.js",
+    "tabler/icons/tabler-icons.min.css",
+    "tabler/icons/fonts/tabler-icons.woff2",
+    "minipass.css",
+    "css/*.css",
+    "js/*.js",
+    "favicon.*",
+    "icons/*",
+    "beep.wav",
+)
+
+FINGERPRINTED_RE = re.compile(r"\.[0-9a-f]{%d}\.[^./]+$" % HASH_LENGTH)  # Outputs of earlier builds
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def _fingerprinted_name(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def _iter_assets(static_folder):
+    """Static paths (relative, '/'-separated) to fingerprint, fonts/images before CSS"""
+    found = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            if (os.path.splitext(name)[1].lower() in ASSET_EXTENSIONS and not rel.startswith(SKIP_PATHS)
+                    and not FINGERPRINTED_RE.search(name) and os.path.isfile(path)):  # isfile: skips dangling symlinks
+                found.append(rel)
+    return sorted(found, key=lambda rel: rel.endswith(".css"))  # CSS last: it references the others
+
+
+def _rewrite_css(path, content, assets):
+    """Point relative url() references at fingerprinted names so the CSS hash covers them."""
+    base = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        target, sep, suffix = url, "", ""
+        split = re.search(r"[?#]", url)
+        if split:
+            target, sep, suffix = url[:split.start()], split.group(0), url[split.end():]
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in assets:
+            return match.group(0)
+        hashed = posixpath.relpath(assets[resolved], base) if base else assets[resolved]
+        return f"url({quote}{hashed}{sep}{suffix}{quote})"
+
+    return CSS_URL_RE.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+
+def _write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_once(path, data):
+    """Write a content-addressed output unless an earlier build already did."""
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        return False  # Same name means same content hash
+    _write(path, data)
+    return True
+
+
+def _precompress(path, data):
+    """Write .gz/.br siblings that are actually smaller; returns the encodings written."""
+    encodings = []
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        _write_once(f"{path}.gz", gz)
+        encodings.append("gzip")
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            _write_once(f"{path}.br", br)
+            encodings.append("br")
+    return encodings
+
+
+def build(static_folder="static"):
+    """Fingerprint + precompress every asset and write the manifest; returns the manifest."""
+    previous = _read_manifest(static_folder)
+    assets, encodings = {}, {}
+    written = 0
+
+    for rel in _iter_assets(static_folder):
+        with open(os.path.join(static_folder, rel), "rb") as f:
+            data = f.read()
+        if rel.endswith(".css"):
+            data = _rewrite_css(rel, data, assets)
+
+        hashed = _fingerprinted_name(rel, hashlib.sha256(data).hexdigest())
+        hashed_path = os.path.join(static_folder, hashed)
+        written += _write_once(hashed_path, data)
+        assets[rel] = hashed
+
+        if os.path.splitext(rel)[1].lower() in COMPRESS_EXTENSIONS and len(data) >= COMPRESS_MIN_BYTES:
+            encodings[hashed] = _precompress(hashed_path, data)
+
+    # Drop outputs of earlier builds that are no longer referenced
+    current = set(assets.values())
+    for old in set((previous or {}).get("assets", {}).values()) - current:
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(static_folder, old + suffix))
+            except OSError:
+                pass
+
+    precache = sorted(hashed for rel, hashed in assets.items()
+                      if any(fnmatch.fnmatch(rel, pattern) for pattern in PRECACHE_ASSETS))
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "assets": assets,
+        "encodings": {name: enc for name, enc in encodings.items() if enc},
+        "precache": precache,
+        "precache_revision": hashlib.sha256("\n".join(precache).encode()).hexdigest()[:HASH_LENGTH],
+    }
+    _write(os.path.join(static_folder, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    print(f"📦 Static assets: {len(assets)} fingerprinted ({written} new), "
+          f"{len(manifest['encodings'])} precompressed, {len(precache)} precached"
+          f"{'' if brotli else ' (brotli not installed: gzip only)'}")
+    return manifest
+
+
+# ================================
+# 🌐 RUNTIME
+# ================================
+
+_manifest_cache = {}  # static_folder -> (mtime, manifest, fingerprinted names)
+
+
+def _read_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def load_manifest(static_folder):
+    """Manifest for static_folder, reloaded when the build rewrites it; None when there is no build."""
+    try:
+        mtime = os.stat(os.path.join(static_folder, MANIFEST_NAME)).st_mtime
+    except OSError:
+        return None
+    cached = _manifest_cache.get(static_folder)
+    if cached is None or cached[0] != mtime:
+        manifest = _read_manifest(static_folder)
+        cached = (mtime, manifest, set(manifest["assets"].values()) if manifest else set())
+        _manifest_cache[static_folder] = cached
+    return cached[1]
+
+
+def asset_path(static_folder, filename):
+    """Fingerprinted name for a static filename (unchanged when it isn't a built asset)."""
+    manifest = load_manifest(static_folder)
+    if not manifest:
+        return filename
+    return manifest["assets"].get(filename, filename)
+
+
+def send_asset(static_folder, filename):
+    """Static view: fingerprinted files are sent precompressed when accepted and cached as immutable."""
+    from flask import current_app, request, send_from_directory
+
+    manifest = load_manifest(static_folder)
+    if not manifest or filename not in _manifest_cache[static_folder][2]:
+        return current_app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    available = manifest["encodings"].get(filename, [])
+    response = None
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in available and request.accept_encodings[encoding]:
+            response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = send_from_directory(static_folder, filename, mimetype=mimetype)
+
+    if available:
+        response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def precache_manifest(static_folder, static_url_path="/static"):
+    """(revision, URLs) the service worker precaches; (None, []) without a build."""
+    manifest = load_manifest(static_folder)
+    if not manifest:
+        return None, []
+    return manifest["precache_revision"], [f"{static_url_path}/{name}" for name in manifest["precache"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static assets")
+    parser.add_argument("--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    args = parser.parse_args(argv)
+    build(args.static)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
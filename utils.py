@@ -535,6 +535,105 @@ def save_setting(key, value, changed_by=None, change_reason=None):
             return value
 
 
+# A signup holds its requested sessions until it gets a passport (which then counts
+# through uses_remaining) or is approved, rejected or cancelled. This includes
+# pending Interac signups: unlike before, a signup awaiting e-transfer takes its
+# spots right away, so an activity can show sold out before every pass is issued.
+SIGNUP_HOLDS_CAPACITY_SQL = "{t}.status IN ('pending', 'stripe_processing') AND {t}.passport_id IS NULL"
+
+# Stripe Checkout sessions are created with this lifetime (Stripe's minimum is 30 min);
+# an unpaid 'stripe_processing' signup older than that can no longer complete
+STRIPE_CHECKOUT_EXPIRY_SECONDS = 3600
+
+RESERVED_SESSIONS_SQL = f"""
+    (SELECT COALESCE(SUM(passport.uses_remaining), 0)
+     FROM passport WHERE passport.activity_id = activity.id)
+    + (SELECT COALESCE(SUM(signup.requested_sessions), 0)
+       FROM signup WHERE signup.activity_id = activity.id
+       AND {SIGNUP_HOLDS_CAPACITY_SQL.format(t='signup')})
+"""
+
+# activity.reserved_sessions = passport uses_remaining + sessions held by open signups.
+# Holds are taken by reserve_capacity() in the signup transaction and released here.
+RESERVED_SESSIONS_TRIGGERS = [
+    ("trg_passport_reserved_insert", """
+        CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_insert
+        AFTER INSERT ON passport
+        BEGIN
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.uses_remaining, 0)
+            WHERE id = NEW.activity_id;
+        END
+    """),
+    ("trg_passport_reserved_update", """
+        CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_update
+        AFTER UPDATE OF uses_remaining, activity_id ON passport
+        BEGIN
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.uses_remaining, 0)
+            WHERE id = OLD.activity_id;
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.uses_remaining, 0)
+            WHERE id = NEW.activity_id;
+        END
+    """),
+    ("trg_passport_reserved_delete", """
+        CREATE TRIGGER IF NOT EXISTS trg_passport_reserved_delete
+        AFTER DELETE ON passport
+        BEGIN
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.uses_remaining, 0)
+            WHERE id = OLD.activity_id;
+        END
+    """),
+    ("trg_signup_reserved_update", f"""
+        CREATE TRIGGER IF NOT EXISTS trg_signup_reserved_update
+        AFTER UPDATE OF status, passport_id, requested_sessions, activity_id ON signup
+        BEGIN
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.requested_sessions, 0)
+            WHERE id = OLD.activity_id AND {SIGNUP_HOLDS_CAPACITY_SQL.format(t='OLD')};
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) + COALESCE(NEW.requested_sessions, 0)
+            WHERE id = NEW.activity_id AND {SIGNUP_HOLDS_CAPACITY_SQL.format(t='NEW')};
+        END
+    """),
+    ("trg_signup_reserved_delete", f"""
+        CREATE TRIGGER IF NOT EXISTS trg_signup_reserved_delete
+        AFTER DELETE ON signup
+        BEGIN
+            UPDATE activity
+            SET reserved_sessions = COALESCE(reserved_sessions, 0) - COALESCE(OLD.requested_sessions, 0)
+            WHERE id = OLD.activity_id AND {SIGNUP_HOLDS_CAPACITY_SQL.format(t='OLD')};
+        END
+    """),
+]
+
+
+def ensure_reserved_sessions_triggers():
+    """
+    Create the reserved_sessions triggers if missing (databases built with
+    db.create_all() never ran upgrade task 42) and recount the counter when any
+    had to be created. Called at startup; returns the number of triggers created.
+    """
+    from sqlalchemy import text
+
+    names = [name for name, _ in RESERVED_SESSIONS_TRIGGERS]
+    existing = {row[0] for row in db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    )}
+    missing = [name for name in names if name not in existing]
+    if not missing:
+        return 0
+
+    for name, sql in RESERVED_SESSIONS_TRIGGERS:
+        if name in missing:
+            db.session.execute(text(sql))
+    db.session.commit()
+    reconcile_reserved_sessions()
+    return len(missing)
+
+
 def get_remaining_capacity(activity_id):
     """
     Calculate remaining capacity for a quantity-limited activity.
@@ -548,23 +647,85 @@ def get_remaining_capacity(activity_id):
     Returns:
         int or None: Remaining spots, or None if not quantity-limited
     """
-    from models import Activity, Passport
-    from sqlalchemy import func
+    from models import Activity
+    from sqlalchemy import text
 
     activity = Activity.query.get(activity_id)
     if not activity or not activity.is_quantity_limited or not activity.max_sessions:
         return None
 
-    # Sum all uses_remaining from active passports for this activity
-    # This counts total sessions sold/reserved
-    total_sold = db.session.query(func.coalesce(func.sum(Passport.uses_remaining), 0))\
-        .filter(Passport.activity_id == activity_id)\
-        .scalar()
+    # Sessions sold/held, maintained on activity.reserved_sessions by triggers on
+    # the passport and signup tables (see RESERVED_SESSIONS_TRIGGERS).
+    # Fall back to the aggregate if never populated.
+    total_sold = activity.reserved_sessions
+    if total_sold is None:
+        total_sold = db.session.execute(
+            text(f"SELECT {RESERVED_SESSIONS_SQL} FROM activity WHERE id = :id"), {"id": activity_id}
+        ).scalar()
 
     remaining = activity.max_sessions - total_sold
     return max(0, remaining)
 
 
+def reserve_capacity(activity_id, sessions):
+    """
+    Hold sessions for a new signup: one conditional UPDATE, so concurrent signups
+    cannot both pass the capacity check. Runs in the caller's transaction (commit
+    together with the Signup insert, roll back on failure). Returns False when a
+    quantity-limited activity does not have that many sessions left.
+    """
+    from sqlalchemy import text
+
+    result = db.session.execute(text("""
+        UPDATE activity
+        SET reserved_sessions = COALESCE(reserved_sessions, 0) + :sessions
+        WHERE id = :id
+          AND (COALESCE(is_quantity_limited, 0) = 0 OR COALESCE(max_sessions, 0) = 0
+               OR COALESCE(reserved_sessions, 0) + :sessions <= max_sessions)
+    """), {"id": activity_id, "sessions": sessions})
+    return result.rowcount == 1
+
+
+def release_stale_stripe_holds(max_age_seconds=STRIPE_CHECKOUT_EXPIRY_SECONDS):
+    """
+    Cancel 'stripe_processing' signups whose checkout has expired without payment
+    (missed checkout.session.expired webhook, or abandoned before Stripe was
+    reached), so their sessions go back on sale. Returns the number cancelled.
+    """
+    from datetime import datetime, timedelta, timezone
+    from models import Signup
+
+    # signed_up_at is stored naive UTC by SQLite
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds * 2)).replace(tzinfo=None)
+    stale = Signup.query.filter(
+        Signup.status == 'stripe_processing',
+        Signup.passport_id.is_(None),
+        Signup.signed_up_at < cutoff
+    ).all()
+    for signup in stale:
+        if not signup.paid:
+            signup.status = 'cancelled'
+    db.session.commit()
+    return sum(1 for signup in stale if signup.status == 'cancelled')
+
+
+def reconcile_reserved_sessions():
+    """
+    Recompute activity.reserved_sessions from the passport and signup tables and
+    fix any drift (e.g. rows changed while the triggers were missing). Returns the
+    number of activities corrected. Scheduled daily; safe to run any time.
+    """
+    from sqlalchemy import text
+
+    result = db.session.execute(text(f"""
+        UPDATE activity
+        SET reserved_sessions = {RESERVED_SESSIONS_SQL}
+        WHERE reserved_sessions IS NOT {RESERVED_SESSIONS_SQL}
+    """))
+    db.session.commit()
+    return result.rowcount
+
+
 def get_fiscal_year_range(reference_date=None):
     """
     Get the start and end dates for the fiscal year containing the reference date.
@@ -697,108 +858,124 @@ def get_placeholder_color(name):
     return PLACEHOLDER_SOLID_COLORS[idx]
 
 
-def generate_placeholder_cover_image(name, width=800, height=400):
-    from PIL import Image, ImageDraw, ImageFont
-    idx = get_placeholder_index(name)
-    _, c1_hex, c2_hex = PLACEHOLDER_GRADIENTS[idx]
+PLACEHOLDER_CACHE_DIR = os.path.join("instance", "placeholders")
+PLACEHOLDER_CACHE_VERSION = 1  # Bump when the drawing changes so old files are not served
+
+COVER_FONT_PATHS = ('/usr/share/fonts/TTF/Inter-Bold.ttf', '/usr/share/fonts/noto/NotoSans-Bold.ttf')
+LOGO_FONT_PATHS = ('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 
-    def hex_to_rgb(h):
-        h = h.lstrip('#')
-        return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
+def _hex_to_rgb(h):
+    h = h.lstrip('#')
+    return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
 
-    c1 = hex_to_rgb(c1_hex)
-    c2 = hex_to_rgb(c2_hex)
+
+@lru_cache(maxsize=32)
+def _placeholder_font(paths, size):
+    """First TrueType font that loads from paths, kept per (paths, size)"""
+    from PIL import ImageFont
+    for path in paths:
+        try:
+            return ImageFont.truetype(path, size)
+        except (IOError, OSError):
+            continue
+    return ImageFont.load_default()
+
+
+def _vertical_gradient(c1, c2, width, height):
+    """RGB image fading from c1 (top) to c2 (bottom), built in one step with NumPy when available"""
+    from PIL import Image, ImageDraw
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        ratio = np.arange(height, dtype=np.float64)[:, None] / height
+        rows = np.array(c1, dtype=np.float64) + (np.array(c2, dtype=np.float64) - np.array(c1, dtype=np.float64)) * ratio
+        pixels = np.ascontiguousarray(np.broadcast_to(rows.astype(np.uint8)[:, None, :], (height, width, 3)))
+        return Image.fromarray(pixels, 'RGB')
 
     img = Image.new('RGB', (width, height))
     draw = ImageDraw.Draw(img)
     for y in range(height):
         ratio = y / height
-        r = int(c1[0] + (c2[0] - c1[0]) * ratio)
-        g = int(c1[1] + (c2[1] - c1[1]) * ratio)
-        b = int(c1[2] + (c2[2] - c1[2]) * ratio)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
+        draw.line([(0, y), (width, y)], fill=tuple(int(c1[i] + (c2[i] - c1[i]) * ratio) for i in range(3)))
+    return img
 
-    letter = get_placeholder_letter(name)
-    try:
-        font = ImageFont.truetype('/usr/share/fonts/TTF/Inter-Bold.ttf', int(height * 0.4))
-    except (IOError, OSError):
-        try:
-            font = ImageFont.truetype('/usr/share/fonts/noto/NotoSans-Bold.ttf', int(height * 0.4))
-        except (IOError, OSError):
-            font = ImageFont.load_default()
 
+def _draw_centered_letter(img, letter, font, fill):
+    from PIL import ImageDraw
+    draw = ImageDraw.Draw(img)
     bbox = draw.textbbox((0, 0), letter, font=font)
     tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
-    x = (width - tw) / 2 - bbox[0]
-    y_pos = (height - th) / 2 - bbox[1]
-    draw.text((x, y_pos), letter, fill=(255, 255, 255, 230), font=font)
-
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return buf
+    x = (img.width - tw) / 2 - bbox[0]
+    y = (img.height - th) / 2 - bbox[1]
+    draw.text((x, y), letter, fill=fill, font=font)
 
 
-def generate_placeholder_logo_image(name, size=200):
-    from PIL import Image, ImageDraw, ImageFont
-    idx = get_placeholder_index(name)
-    color_hex = PLACEHOLDER_SOLID_COLORS[idx]
+def _render_cover(idx, letter, width, height):
+    _, c1_hex, c2_hex = PLACEHOLDER_GRADIENTS[idx]
+    img = _vertical_gradient(_hex_to_rgb(c1_hex), _hex_to_rgb(c2_hex), width, height)
+    _draw_centered_letter(img, letter, _placeholder_font(COVER_FONT_PATHS, int(height * 0.4)), (255, 255, 255, 230))
+    return img
 
-    def hex_to_rgb(h):
-        h = h.lstrip('#')
-        return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
 
-    color = hex_to_rgb(color_hex)
+def _render_logo(idx, letter, width, height):
+    from PIL import Image
+    img = Image.new('RGB', (width, height), _hex_to_rgb(PLACEHOLDER_SOLID_COLORS[idx]))
+    _draw_centered_letter(img, letter, _placeholder_font(LOGO_FONT_PATHS, int(width * 0.5)), (255, 255, 255))
+    return img
 
-    img = Image.new('RGB', (size, size), color)
-    draw = ImageDraw.Draw(img)
 
-    letter = get_placeholder_letter(name)
+@lru_cache(maxsize=256)
+def _placeholder_png(kind, idx, letter, width, height):
+    """
+    PNG bytes of a placeholder, keyed by (kind, gradient index, letter, size).
+    Served from memory, then from instance/placeholders/, and only rendered
+    when neither has it - the result is written to disk for the other workers.
+    """
+    filename = f"{kind}_v{PLACEHOLDER_CACHE_VERSION}_{idx}_{letter.encode().hex()}_{width}x{height}.png"
+    path = os.path.join(PLACEHOLDER_CACHE_DIR, filename)
     try:
-        font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', int(size * 0.5))
-    except (IOError, OSError):
-        try:
-            font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', int(size * 0.5))
-        except (IOError, OSError):
-            font = ImageFont.load_default()
-
-    bbox = draw.textbbox((0, 0), letter, font=font)
-    tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
-    x = (size - tw) / 2 - bbox[0]
-    y = (size - th) / 2 - bbox[1]
-    draw.text((x, y), letter, fill=(255, 255, 255), font=font)
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        pass
 
+    render = _render_cover if kind == "cover" else _render_logo
     buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return buf
+    render(idx, letter, width, height).save(buf, format='PNG', optimize=True)
+    data = buf.getvalue()
 
+    try:
+        os.makedirs(PLACEHOLDER_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not cache placeholder {filename}: {e}")
+    return data
 
-def save_optimized_image(file_stream, dest_folder, prefix="upload", max_size=(1200, 800)):
-    """Save uploaded image: resize to max dimensions, convert to JPEG quality=85.
 
-    Returns the saved filename. For PDF/SVG files, callers should skip this function.
-    """
-    from PIL import Image as _Image
+def generate_placeholder_cover_image(name, width=800, height=400):
+    return io.BytesIO(_placeholder_png("cover", get_placeholder_index(name), get_placeholder_letter(name), width, height))
+
 
-    img = _Image.open(file_stream)
+def generate_placeholder_logo_image(name, size=200):
+    return io.BytesIO(_placeholder_png("logo", get_placeholder_index(name), get_placeholder_letter(name), size, size))
 
-    # Flatten transparency to white background
-    if img.mode in ('RGBA', 'P'):
-        bg = _Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        bg.paste(img, mask=img.split()[3])
-        img = bg
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
 
-    img.thumbnail(max_size, _Image.Resampling.LANCZOS)
+def save_optimized_image(file_stream, dest_folder, prefix="upload", max_size=(1200, 800), on_ready=None):
+    """Store uploaded image as-is; resize to max dimensions and convert to JPEG quality=85 in the image pool.
 
-    filename = f"{prefix}_{uuid.uuid4().hex[:10]}.jpg"
-    os.makedirs(dest_folder, exist_ok=True)
-    img.save(os.path.join(dest_folder, filename), 'JPEG', quality=85, optimize=True)
-    return filename
+    Returns the filename to reference now (the original until on_ready swaps it).
+    For PDF/SVG files, callers should skip this function.
+    """
+    from image_pipeline import process_image_upload
+
+    return process_image_upload(file_stream, dest_folder, prefix=prefix, max_size=max_size, on_ready=on_ready)
 
 
 def generate_qr_code(pass_code):
@@ -2680,12 +2857,9 @@ def get_all_activity_logs():
 
     with current_app.app_context():
         # 🟢 Admin Actions (Passport Created, Activity Created, etc.)
-        for a in AdminActionLog.query.all():
-            # Skip specific API call logs that clutter the dashboard
-            if ("API Call: GET get_kpi_data_api" in a.action or 
-                "API Call: GET get_activity_dashboard_data" in a.action):
-                continue
-                
+        # API call audit events live in api_audit_log (see audit_writer.py);
+        # exclude any legacy "API Call:" rows in SQL instead of skipping in Python
+        for a in AdminActionLog.query.filter(~AdminActionLog.action.like("API Call:%")).all():
             action_text = a.action.lower()
 
             if "passport created" in action_text:
@@ -4178,6 +4352,344 @@ def notify_pass_event(app, *, event_type, pass_data, activity, admin_email=None,
     )
 
 
+# ================================
+# 🔍 SEARCH SERVICE (SQLite FTS5)
+# ================================
+# search_index is an FTS5 table kept in sync by triggers on user, passport,
+# signup, activity and ebank_payment (see upgrade task 43). Each row's rowid
+# encodes its source: rowid = source_id * 8 + entity code. The tokenizer
+# strips diacritics, so "helene" finds "Hélène" like normalize_name() does.
+# search_trigram (task 48) indexes names, emails, codes and phone numbers with
+# the trigram tokenizer, so a fragment from the middle of a pass code, email or
+# phone number still matches, as it did with LIKE '%q%'.
+
+SEARCH_ENTITY_CODES = {"user": 1, "passport": 2, "signup": 3, "activity": 4, "payment": 5}
+SEARCH_TRIGRAM_COLUMNS = ("name", "email", "code")
+TRIGRAM_MIN_LENGTH = 3  # Shorter fragments can't use the trigram index: LIKE over search_trigram
+
+_search_tables = set()  # Search tables found in the database (only positives are cached)
+
+
+def _available_search_tables():
+    from sqlalchemy import text as sql_text
+
+    if "search_index" not in _search_tables:
+        _search_tables.update(row[0] for row in db.session.execute(sql_text(
+            "SELECT name FROM sqlite_master WHERE name IN ('search_index', 'search_trigram')"
+        )))
+    return _search_tables
+
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    tokens = re.findall(r"\w+", normalize_name(text))
+    if not tokens:
+        return None
+    return " AND ".join(f'"{token}"*' for token in tokens)
+
+
+def _trigram_conditions(text, columns, suffix):
+    """WHERE conditions on search_trigram requiring every word of text as a substring."""
+    tokens = re.findall(r"\w+", text.lower())
+    columns = [c for c in (columns or SEARCH_TRIGRAM_COLUMNS) if c in SEARCH_TRIGRAM_COLUMNS]
+    if not tokens or not columns:
+        return None, {}
+
+    conditions, params = [], {}
+    long_tokens = [t for t in tokens if len(t) >= TRIGRAM_MIN_LENGTH]
+    if long_tokens:
+        match = " AND ".join(f'"{token}"' for token in long_tokens)
+        conditions.append(f"search_trigram MATCH :tq{suffix}")
+        params[f"tq{suffix}"] = f"{{{' '.join(columns)}}} : ({match})"
+    for i, token in enumerate(t for t in tokens if len(t) < TRIGRAM_MIN_LENGTH):
+        key = f"ts{suffix}_{i}"
+        conditions.append("(" + " OR ".join(f"{c} LIKE :{key} ESCAPE '\\'" for c in columns) + ")")
+        params[key] = _ilike_term(token)
+    return " AND ".join(conditions), params
+
+
+def search_entity_ids(text, entities, columns=None):
+    """
+    Resolve a search box query to a SELECT of matching IDs per entity, for use in
+    column.in_(...): the match runs inside the filtered list query, so paging and
+    totals see every hit. An entity matches when every word is a prefix of a word
+    (search_index) or a substring of a name/email/code (search_trigram).
+    `columns` optionally restricts matching to some of name/email/code/body.
+
+    Returns:
+        dict: {entity: TextualSelect of ids} for each requested entity,
+        or None if the search index is unavailable (callers fall back to ILIKE)
+    """
+    from sqlalchemy import text as sql_text, column, Integer
+
+    tables = _available_search_tables()
+    if "search_index" not in tables:
+        return None
+
+    fts_query = build_fts_query(text)
+    if fts_query is None:
+        nothing = sql_text("SELECT 0 AS id WHERE 0").columns(column("id", Integer))
+        return {entity: nothing for entity in entities}
+    if columns:
+        fts_query = f"{{{' '.join(columns)}}} : ({fts_query})"
+
+    results = {}
+    for entity in entities:
+        code = SEARCH_ENTITY_CODES[entity]
+        sql = f"SELECT rowid / 8 AS id FROM search_index WHERE search_index MATCH :q{code} AND rowid % 8 = {code}"
+        params = {f"q{code}": fts_query}
+        if "search_trigram" in tables:
+            conditions, trigram_params = _trigram_conditions(text, columns, code)
+            if conditions:
+                sql += f" UNION SELECT rowid / 8 FROM search_trigram WHERE {conditions} AND rowid % 8 = {code}"
+                params.update(trigram_params)
+        results[entity] = sql_text(sql).bindparams(**params).columns(column("id", Integer))
+    return results
+
+
+def _ilike_term(q):
+    escaped_q = q.replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped_q}%'
+
+
+def apply_passport_search(query, q):
+    """Filter a Passport query by the search box (holder name/email, pass code, notes)."""
+    from models import User
+
+    ids = search_entity_ids(q, ("user", "passport"))
+    if ids is None:
+        term = _ilike_term(q)
+        return query.join(User, Passport.user_id == User.id).filter(db.or_(
+            User.name.ilike(term, escape='\\'),
+            User.email.ilike(term, escape='\\'),
+            Passport.pass_code.ilike(term, escape='\\'),
+            Passport.notes.ilike(term, escape='\\'),
+        ))
+    return query.filter(db.or_(
+        Passport.user_id.in_(ids["user"]),
+        Passport.id.in_(ids["passport"]),
+    ))
+
+
+def apply_signup_search(query, q):
+    """
+    Filter a Signup query by the search box (user name/email, subject,
+    description, form data, activity name). The query must already join User and Activity.
+    """
+    from models import Signup, User
+
+    ids = search_entity_ids(q, ("user", "signup", "activity"))
+    if ids is None:
+        term = _ilike_term(q)
+        return query.filter(db.or_(
+            User.name.ilike(term, escape='\\'),
+            User.email.ilike(term, escape='\\'),
+            Signup.subject.ilike(term, escape='\\'),
+            Signup.description.ilike(term, escape='\\'),
+            Signup.form_data.ilike(term, escape='\\'),
+            Activity.name.ilike(term, escape='\\'),
+        ))
+    return query.filter(db.or_(
+        Signup.user_id.in_(ids["user"]),
+        Signup.id.in_(ids["signup"]),
+        Signup.activity_id.in_(ids["activity"]),
+    ))
+
+
+def apply_payment_search(query, q):
+    """Filter an EbankPayment query by bank name (search index) or amount."""
+    amount_match = db.cast(EbankPayment.bank_info_amt, db.String).ilike(_ilike_term(q), escape='\\')
+
+    ids = search_entity_ids(q, ("payment",), columns=("name",))
+    if ids is None:
+        return query.filter(db.or_(
+            EbankPayment.bank_info_name.ilike(_ilike_term(q), escape='\\'),
+            amount_match,
+        ))
+    # Only numeric input can match an amount - skip the cast scan otherwise
+    if re.fullmatch(r"[\d.,$ ]+", q):
+        return query.filter(db.or_(EbankPayment.id.in_(ids["payment"]), amount_match))
+    return query.filter(EbankPayment.id.in_(ids["payment"]))
+
+
+def apply_user_search(query, q):
+    """Filter a User query (or a query selecting from User) by name/email."""
+    from models import User
+
+    ids = search_entity_ids(q, ("user",))
+    if ids is None:
+        term = _ilike_term(q)
+        return query.filter(db.or_(
+            User.name.ilike(term, escape='\\'),
+            User.email.ilike(term, escape='\\'),
+        ))
+    return query.filter(User.id.in_(ids["user"]))
+
+
+# ================================
+# 📄 KEYSET PAGINATION
+# ================================
+
+KEYSET_APPROX_COUNT_CAP = 1000  # total="approx" stops counting here and shows "1000+"
+
+
+class KeysetPagination:
+    """
+    Page of results addressed by a (sort value, id) cursor instead of OFFSET.
+    Exposes the same attributes as Flask-SQLAlchemy's Pagination that
+    macros/pagination.html reads, plus the cursors for the prev/next links.
+    """
+    is_keyset = True
+
+    def __init__(self, items, page, per_page, total, total_is_approximate, next_cursor, prev_cursor):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_is_approximate = total_is_approximate
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+    @property
+    def prev_num(self):
+        return max(self.page - 1, 1)
+
+    @property
+    def pages(self):
+        if self.total and not self.total_is_approximate:
+            return max(1, -(-self.total // self.per_page))
+        return self.page + (1 if self.has_next else 0)
+
+
+def encode_keyset_cursor(direction, values):
+    """Opaque URL-safe cursor: direction ('next'/'prev') plus the boundary row's key values."""
+    payload = [direction] + [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_keyset_cursor(cursor, key_columns):
+    """Return (direction, values) or None for a missing/invalid cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction, raw_values = payload[0], payload[1:]
+        if direction not in ("next", "prev") or len(raw_values) != len(key_columns):
+            return None
+        values = []
+        for column, raw in zip(key_columns, raw_values):
+            if raw is not None and getattr(column.type, "python_type", None) is datetime:
+                raw = datetime.fromisoformat(raw)
+            values.append(raw)
+        return direction, values
+    except Exception:
+        return None
+
+
+def keyset_condition(id_column, sort_column, last, descending=True):
+    """
+    WHERE clause for the rows after `last` (the previous row's key values) in
+    ORDER BY sort_column, id_column. SQLite sorts NULL lowest (last when
+    descending, first when ascending), so rows without a sort value are paged
+    by id within that block instead of dropping out of a tuple comparison.
+    """
+    from sqlalchemy import and_, or_, literal
+
+    id_value = last[-1]
+    id_after = id_column < id_value if descending else id_column > id_value
+    if sort_column is None:
+        return id_after
+
+    sort_value = last[0]
+    if sort_value is None:
+        in_nulls = and_(sort_column.is_(None), id_after)
+        return in_nulls if descending else or_(in_nulls, sort_column.isnot(None))
+
+    bound = literal(sort_value, type_=sort_column.type)
+    after = or_(sort_column < bound if descending else sort_column > bound,
+                and_(sort_column == bound, id_after))
+    return or_(after, sort_column.is_(None)) if descending else after
+
+
+def keyset_paginate(query, id_column, sort_column=None, per_page=10, cursor=None, page=1,
+                    descending=True, total="approx"):
+    """
+    Paginate `query` by (sort_column, id_column) without OFFSET, so deep pages
+    cost the same as the first one.
+
+    Args:
+        query: Filtered query (any existing ORDER BY is replaced)
+        id_column: Unique tie-breaker, e.g. Passport.id
+        sort_column: Optional leading sort key, e.g. Passport.created_dt (NULLs sort last when descending)
+        cursor: Cursor from a previous page's next/prev link (None = first page)
+        page: Page number carried in the URL, for display only
+        descending: Newest first (default) or oldest first
+        total: "approx" (default: COUNT capped at KEYSET_APPROX_COUNT_CAP, shown as "1000+"),
+            "exact" (full COUNT, scans every matching row) or None (no total)
+
+    Returns:
+        KeysetPagination
+    """
+    from sqlalchemy import func
+
+    key_columns = [c for c in (sort_column, id_column) if c is not None]
+    decoded = decode_keyset_cursor(cursor, key_columns)
+    direction = decoded[0] if decoded else "next"
+    if decoded is None:
+        page = 1
+
+    # Walking backwards flips the comparison and the order, then the rows are reversed
+    forward = (direction == "next")
+    walk_desc = descending if forward else not descending
+    ordered = query.order_by(None).order_by(*[c.desc() if walk_desc else c.asc() for c in key_columns])
+
+    if decoded is not None:
+        ordered = ordered.filter(keyset_condition(id_column, sort_column, decoded[1], walk_desc))
+
+    rows = ordered.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def key_values(row):
+        return [getattr(row, c.key) for c in key_columns]
+
+    if forward:
+        has_next, has_prev = has_more, decoded is not None
+    else:
+        has_next, has_prev = True, has_more
+        if not has_more:
+            page = 1
+
+    next_cursor = encode_keyset_cursor("next", key_values(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_keyset_cursor("prev", key_values(rows[0])) if rows and has_prev else None
+
+    total_count, approximate = None, False
+    if total == "exact":
+        total_count = query.order_by(None).count()
+    elif total == "approx":
+        capped = query.order_by(None).with_entities(id_column).limit(KEYSET_APPROX_COUNT_CAP + 1).subquery()
+        total_count = db.session.query(func.count()).select_from(capped).scalar()
+        if total_count > KEYSET_APPROX_COUNT_CAP:
+            total_count, approximate = KEYSET_APPROX_COUNT_CAP, True
+
+    return KeysetPagination(rows, max(page, 1), per_page, total_count, approximate, next_cursor, prev_cursor)
+
+
 # ================================
 # 📋 SURVEY UTILITIES
 # ================================
@@ -4394,6 +4906,10 @@ def resize_hero_image(image_data, template_type, max_file_size_mb=2):
         except Exception as e:
             return None, f"Invalid image file: {str(e)}"
 
+        # JPEG: decode at the smallest DCT scale that still covers the canvas
+        if image.format == 'JPEG':
+            image.draft('RGB', (target_size, target_size))
+
         original_width, original_height = image.size
         print(f"🖼️ Resizing hero image: {original_width}x{original_height} → {target_size}x{target_size} RGBA")
 
@@ -5093,33 +5609,25 @@ def get_user_contact_report(search_query="", status_filter="", show_all=False):
         func.max(Passport.created_dt).label('last_activity_date')
     ).outerjoin(Passport, User.id == Passport.user_id)
 
+    # Apply search filter in SQL (search index, ILIKE fallback)
+    if search_query:
+        query = apply_user_search(query, search_query)
+
     # Group by name and email (aggregate duplicates)
     query = query.group_by(User.name, User.email)
 
-    # Execute query to get all users
+    # Apply status filter: only users with passports
+    if status_filter == "active" and not show_all:
+        query = query.having(func.count(Passport.id) > 0)
+
     all_user_data = query.all()
 
-    # Apply filters in Python for flexibility
     users = []
     total_users = 0
     active_users = 0
     total_revenue = 0
 
     for user in all_user_data:
-        # Apply status filter
-        if status_filter == "active" and not show_all:
-            # Only show users with passports
-            if user.passport_count == 0:
-                continue
-
-        # Apply search filter
-        if search_query:
-            search_lower = search_query.lower()
-            name_match = search_lower in (user.name or '').lower()
-            email_match = search_lower in (user.email or '').lower()
-            if not (name_match or email_match):
-                continue
-
         # Get all User IDs with this name/email combination
         user_ids = db.session.query(User.id).filter(
             User.name == user.name,
@@ -5217,27 +5725,36 @@ def export_user_contacts_csv(user_data):
     return output.getvalue()
 
 
-def export_user_contacts_raw_csv(search_query="", status_filter="", show_all=False):
+USER_CONTACTS_RAW_HEADER = [
+    'User Name',
+    'User Email',
+    'User Phone',
+    'Activity',
+    'Passport Type',
+    'Amount',
+    'Created Date',
+    'Paid',
+    'Paid Date',
+    'Uses Remaining',
+    'Pass Code',
+    'Notes',
+    'Email Opt-Out'
+]
+
+
+def iter_user_contacts_raw_rows(search_query=""):
     """
-    Export RAW passport data to CSV format - one row per passport, no aggregation.
+    Yield RAW passport rows for the user contacts export - one per passport, no aggregation.
+    Rows are fetched from the cursor in batches, so this is safe to stream.
 
     Args:
         search_query: Optional search filter for user name/email
-        status_filter: "active" to show only users with passports
-        show_all: If True, ignore status_filter
 
-    Returns:
-        str: CSV formatted string with raw passport data
+    Yields:
+        list: One CSV row matching USER_CONTACTS_RAW_HEADER
     """
-    import csv
-    from io import StringIO
-    from datetime import datetime, timezone
-    from models import User, Passport, Activity, PassportType
-
-    output = StringIO()
-    # Add UTF-8 BOM for Excel compatibility
-    output.write('\ufeff')
-    writer = csv.writer(output)
+    from models import User, Passport, Activity
+    from export_engine import iter_query
 
     # Query raw passport data with joins
     query = db.session.query(
@@ -5253,7 +5770,8 @@ def export_user_contacts_raw_csv(search_query="", status_filter="", show_all=Fal
         Passport.paid_date,
         Passport.uses_remaining,
         Passport.pass_code,
-        Passport.notes
+        Passport.notes,
+        Passport.id
     ).join(
         User, Passport.user_id == User.id
     ).join(
@@ -5262,39 +5780,11 @@ def export_user_contacts_raw_csv(search_query="", status_filter="", show_all=Fal
 
     # Apply search filter
     if search_query:
-        search_pattern = f"%{search_query}%"
-        query = query.filter(
-            db.or_(
-                User.name.ilike(search_pattern),
-                User.email.ilike(search_pattern)
-            )
-        )
+        query = apply_user_search(query, search_query)
 
-    # Order by created date descending
-    query = query.order_by(Passport.created_dt.desc())
-
-    results = query.all()
-
-    # Write column headers (no comment rows - they confuse spreadsheet software)
-    writer.writerow([
-        'User Name',
-        'User Email',
-        'User Phone',
-        'Activity',
-        'Passport Type',
-        'Amount',
-        'Created Date',
-        'Paid',
-        'Paid Date',
-        'Uses Remaining',
-        'Pass Code',
-        'Notes',
-        'Email Opt-Out'
-    ])
-
-    # Write data rows - one per passport
-    for row in results:
-        writer.writerow([
+    # Newest first, fetched in keyset batches
+    for row in iter_query(query, Passport.id, Passport.created_dt):
+        yield [
             row.user_name or '',
             row.user_email or '',
             row.user_phone or '',
@@ -5308,9 +5798,28 @@ def export_user_contacts_raw_csv(search_query="", status_filter="", show_all=Fal
             row.pass_code or '',
             row.notes or '',
             'Yes' if row.email_opt_out else 'No'
-        ])
+        ]
 
-    return output.getvalue()
+
+def export_user_contacts_raw_csv(search_query="", status_filter="", show_all=False):
+    """
+    Export RAW passport data to CSV format - one row per passport, no aggregation.
+    Builds the whole file in memory; the download route streams
+    iter_user_contacts_raw_rows() instead.
+
+    Args:
+        search_query: Optional search filter for user name/email
+        status_filter: "active" to show only users with passports
+        show_all: If True, ignore status_filter
+
+    Returns:
+        str: CSV formatted string with raw passport data
+    """
+    from export_engine import iter_csv
+
+    # UTF-8 BOM for Excel compatibility; no comment rows - they confuse spreadsheet software
+    chunks = iter_csv(USER_CONTACTS_RAW_HEADER, iter_user_contacts_raw_rows(search_query), bom=True)
+    return b"".join(chunks).decode("utf-8")
 
 
 # ================================